@@ -0,0 +1,58 @@
+"""
+Performance measurements for Django GraphQL JWT Flow.
+
+The benchmarks run against the demo project. From the repository root::
+
+    PYTHONPATH=demo:src python -m benchmarks.keys
+    PYTHONPATH=demo:src python -m benchmarks.refresh
+    PYTHONPATH=demo:src python -m benchmarks.suite --baseline baseline.json
+"""
+import contextlib
+import os
+import statistics
+import time
+import typing as t
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "demo.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import django
+
+    django.setup()
+
+
+def per_call(func: t.Callable[[], t.Any], number: int) -> float:
+    """
+    Run ``func`` ``number`` times and return the mean cost in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def median_per_call(func: t.Callable[[], t.Any], number: int, repeat: int) -> float:
+    """
+    Median of ``repeat`` runs of :func:`per_call`, in microseconds.
+    """
+    return statistics.median(per_call(func, number) for _ in range(repeat))
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Run the enclosed benchmark against a throwaway, migrated test database.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
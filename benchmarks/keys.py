@@ -0,0 +1,60 @@
+"""
+Per-token cost of signing and verifying with and without the settings snapshot.
+
+"cold" reloads the application settings before every operation, which is what
+every call cost before settings and keys were cached: reading ``JWT_FLOW``,
+parsing the key and deriving the crypto key objects. "warm" uses the snapshot.
+"""
+import argparse
+
+from . import per_call, setup
+
+KEYS = {
+    "HS384": {"kty": "oct", "k": "x-A5aHFjJohn3-wuBsv12Q"},
+    "EdDSA": {"kty": "OKP", "crv": "Ed25519"},
+    "ES256": {"kty": "EC", "crv": "P-256"},
+    "RS256": {"kty": "RSA", "size": 2048},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=500)
+    options = parser.parse_args()
+    setup()
+
+    from django.test import override_settings
+    from jwcrypto import jwk, jwt
+
+    from django_graphql_jwt_flow.apps import app_settings
+    from django_graphql_jwt_flow.models import JwtRefreshTokenManager
+
+    print(f"{'alg':<8}{'op':<8}{'cold µs':>12}{'warm µs':>12}{'speedup':>10}")
+    for alg, params in KEYS.items():
+        key = params if params["kty"] == "oct" else jwk.JWK.generate(**params)
+        key = key if isinstance(key, dict) else key.export(as_dict=True)
+        with override_settings(JWT_FLOW={"KEY": key, "SIGNATURE_ALG": alg}):
+            serialized = JwtRefreshTokenManager.generate_token("1").serialize()
+
+            def sign():
+                JwtRefreshTokenManager.generate_token("1")
+
+            def verify():
+                jwt.JWT(key=app_settings.get_key(), jwt=serialized)
+
+            for op, func in (("sign", sign), ("verify", verify)):
+
+                def cold():
+                    app_settings.reload()
+                    func()
+
+                cold_us = per_call(cold, options.number)
+                warm_us = per_call(func, options.number)
+                print(
+                    f"{alg:<8}{op:<8}{cold_us:>12.1f}{warm_us:>12.1f}"
+                    f"{cold_us / warm_us:>9.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
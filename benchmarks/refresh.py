@@ -0,0 +1,50 @@
+"""
+Queries and time per token refresh.
+
+``refresh_token`` goes through ``update_or_create``: a SELECT and an UPDATE, inside
+a transaction. ``rotate`` is a single compare-and-swap UPDATE on the user id and the
+digest of the presented token.
+"""
+import argparse
+
+from . import per_call, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=500)
+    options = parser.parse_args()
+    setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from django_graphql_jwt_flow.models import JwtRefreshToken
+    from django_graphql_jwt_flow.revocation import revocation_list
+
+    with test_database():
+        user = get_user_model().objects.create(email="benchmark@example.com")
+        JwtRefreshToken.objects.create(user)
+        revocation_list.sync()
+        current = None
+
+        def refresh_token():
+            JwtRefreshToken.objects.refresh_token(user)
+
+        def rotate():
+            nonlocal current
+            current = JwtRefreshToken.objects.rotate(user.pk, current)
+
+        print(f"{'method':<16}{'queries':>10}{'µs':>12}")
+        for name, func in (("refresh_token", refresh_token), ("rotate", rotate)):
+            current = JwtRefreshToken.objects.get(user=user).token
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            print(
+                f"{name:<16}{len(queries):>10}{per_call(func, options.number):>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
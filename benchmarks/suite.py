@@ -0,0 +1,208 @@
+"""
+Microbenchmarks of the token hot paths, for every supported kind of key.
+
+Measures the manager and model operations, a login round trip through
+``GraphQLView`` and the admin changelist against a throwaway SQLite database of
+the demo project. Every benchmark is run ``--repeat`` times and the median cost
+per call is reported, in microseconds.
+
+Results are written as JSON with ``--output``. Given a ``--baseline`` file from an
+earlier run, benchmarks that got slower by more than ``--threshold`` percent are
+reported and the exit status is 1::
+
+    PYTHONPATH=demo:src python -m benchmarks.suite --output baseline.json
+    PYTHONPATH=demo:src python -m benchmarks.suite --baseline baseline.json
+
+Passwords are hashed with MD5 and login throttling is disabled, so the login
+round trip measures this library instead of PBKDF2.
+"""
+import argparse
+import importlib.metadata
+import json
+import platform
+import sys
+import typing as t
+
+from . import median_per_call, setup, test_database
+
+KEYS = {
+    "HS256": {"kty": "oct", "size": 256},
+    "HS384": {"kty": "oct", "size": 384},
+    "EdDSA": {"kty": "OKP", "crv": "Ed25519"},
+    "ES256": {"kty": "EC", "crv": "P-256"},
+    "RS256": {"kty": "RSA", "size": 2048},
+}
+
+LOGIN = """
+mutation login($email: String!, $password: String!) {
+    login(email: $email, password: $password) { success token }
+}
+"""
+
+ADMIN_USERS = 100
+
+
+def run(algs: t.Sequence[str], number: int, repeat: int) -> t.Dict[str, float]:
+    import jwcrypto.jwk as jwk
+    from django.contrib.auth import get_user_model
+    from django.test import Client, override_settings
+
+    from django_graphql_jwt_flow.models import JwtRefreshToken
+
+    User = get_user_model()
+    password = "benchmark"
+    results = {}
+
+    def bench(name: str, func: t.Callable[[], t.Any], calls: int = number):
+        func()
+        results[name] = median_per_call(func, calls, repeat)
+        print(f"{name:<32}{results[name]:>12.1f} µs", file=sys.stderr)
+
+    for alg in algs:
+        jwt_flow = {
+            "KEY": jwk.JWK.generate(**KEYS[alg]).export(as_dict=True),
+            "SIGNATURE_ALG": alg,
+            "LOGIN_RATE_PER_USERNAME": None,
+            "LOGIN_RATE_PER_IP": None,
+        }
+        with override_settings(
+            JWT_FLOW=jwt_flow,
+            PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+        ):
+            user = User.objects.create_user(f"{alg}@example.com", password)
+            token = JwtRefreshToken.objects.create(user)
+            client = Client()
+            body = json.dumps(
+                {
+                    "query": LOGIN,
+                    "variables": {"email": user.email, "password": password},
+                }
+            )
+
+            def login():
+                response = client.post(
+                    "/graphql", body, content_type="application/json"
+                )
+                assert response.status_code == 200, response.content
+
+            bench(
+                f"{alg}.generate_token",
+                lambda: JwtRefreshToken.objects.generate_token(str(user.pk)),
+            )
+            bench(f"{alg}.is_valid", token.is_valid)
+            bench(f"{alg}.refresh_token", lambda: token.refresh())
+            bench(
+                f"{alg}.get_or_create",
+                lambda: JwtRefreshToken.objects.get_or_create(user),
+            )
+            bench(f"{alg}.login", login, max(1, number // 10))
+
+    admin = User.objects.create_superuser(email="admin@example.com", password=password)
+    users = User.objects.bulk_create(
+        User(email=f"user{i}@example.com") for i in range(ADMIN_USERS)
+    )
+    for user in User.objects.filter(pk__in=[user.pk for user in users]):
+        JwtRefreshToken.objects.create(user)
+    client = Client()
+    client.force_login(admin)
+
+    def changelist():
+        response = client.get("/admin/django_graphql_jwt_flow/jwtrefreshtoken/")
+        assert response.status_code == 200, response.status_code
+
+    bench("admin.changelist", changelist, max(1, number // 10))
+    return results
+
+
+def compare(
+    results: t.Dict[str, float], baseline: t.Dict[str, float], threshold: float
+) -> t.List[str]:
+    """
+    Compare results with a baseline.
+
+    :return: Names of the benchmarks that got slower by more than ``threshold``
+        percent.
+    """
+    print(
+        f"{'benchmark':<32}{'µs':>12}{'baseline µs':>14}{'change':>10}",
+        file=sys.stderr,
+    )
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            print(f"{name:<32}{value:>12.1f}{'-':>14}{'-':>10}", file=sys.stderr)
+            continue
+        change = (value - baseline[name]) / baseline[name] * 100
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<32}{value:>12.1f}{baseline[name]:>14.1f}{change:>+9.1f}%{flag}",
+            file=sys.stderr,
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-n", "--number", type=int, default=200)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "--alg", action="append", choices=list(KEYS), help="Default: all."
+    )
+    parser.add_argument("--output", metavar="file", help="Write results as JSON.")
+    parser.add_argument(
+        "--baseline", metavar="file", help="Results of an earlier run to compare to."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        metavar="percent",
+        help="Slowdown over the baseline that counts as a regression. Default: 10.",
+    )
+    options = parser.parse_args()
+    setup()
+
+    import django
+
+    with test_database():
+        results = run(options.alg or list(KEYS), options.number, options.repeat)
+
+    document = {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            # jwcrypto has no __version__, so read the installed distributions.
+            "jwcrypto": importlib.metadata.version("jwcrypto"),
+            "graphene-django": importlib.metadata.version("graphene-django"),
+            "machine": platform.machine(),
+        },
+        "unit": "us",
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file_obj:
+            json.dump(document, file_obj, indent=2, sort_keys=True)
+    else:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as file_obj:
+            baseline = json.load(file_obj)["results"]
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print(
+                f"{len(regressions)} benchmark(s) regressed by more than "
+                f"{options.threshold:g}%: {', '.join(regressions)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
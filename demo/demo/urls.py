@@ -19,11 +19,22 @@ from django.urls import path
 from django.views import static
 from django.views.decorators.csrf import csrf_exempt
 
-from django_graphql_jwt_flow.views import GraphQLView
+from django_graphql_jwt_flow.views import (
+    AsyncGraphQLView,
+    GraphQLView,
+    JWKSView,
+    MetricsView,
+)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=settings.DEBUG))),
+    path(
+        "graphql-async",
+        AsyncGraphQLView.as_view(graphiql=settings.DEBUG, csrf_exempt=True),
+    ),
+    path(".well-known/jwks.json", JWKSView.as_view()),
+    path("metrics", MetricsView.as_view()),
     path(
         "mail<path:path>",
         static.serve,
@@ -1,19 +1,23 @@
 from __future__ import annotations
 
 import typing as t
-from datetime import datetime
 
 from django.contrib import admin, messages
-from django.utils.http import urlsafe_base64_decode
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ERROR_FLAG, ChangeList
+from django.core.exceptions import PermissionDenied
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import Http404, HttpResponseRedirect
+from django.urls import path, reverse
 from django.utils.translation import gettext_lazy as _, ngettext
-from jwcrypto.common import json_decode
 
 from django_graphql_jwt_flow.apps import app_settings
 from . import models, forms
+from .export import FORMATS, decode_payload, export_response
 
 if t.TYPE_CHECKING:
     from django.db.models.query import QuerySet
-    from django.http import HttpRequest
+    from django.http import HttpRequest, HttpResponse
     from django.contrib.auth.base_user import AbstractBaseUser
 
     class _TokenQuerySet(QuerySet):
@@ -28,31 +32,77 @@ if t.TYPE_CHECKING:
         user: AbstractBaseUser = ...
 
 
+class ExpiryListFilter(admin.SimpleListFilter):
+    title = _("expiry")
+    parameter_name = "expiry"
+
+    def lookups(self, request, model_admin):
+        return [("expired", _("Expired")), ("active", _("Active"))]
+
+    def queryset(self, request, queryset):
+        cutoff = models.JwtRefreshToken.objects.expiry_cutoff()
+        if self.value() == "expired":
+            return queryset.filter(expires_at__lt=cutoff)
+        if self.value() == "active":
+            return queryset.filter(expires_at__gte=cutoff)
+        return queryset
+
+
+class ExportChangeList(ChangeList):
+    """
+    Applies the filters, search and ordering of the changelist, without counting
+    the results or fetching a page of them.
+    """
+
+    def get_results(self, request):
+        self.result_count = self.full_result_count = None
+        self.result_list = []
+        self.can_show_all = self.multi_page = False
+
+
 @admin.register(models.JwtRefreshToken)
 class JwtRefreshTokenAdmin(admin.ModelAdmin):
     search_fields = ["user__email", "user__first_name", "user__last_name"]
-    list_display = ["user_email", "token_payload", "is_expired"]
+    list_display = ["user_email", "token_payload", "expires_at", "is_expired"]
+    list_filter = [ExpiryListFilter]
+    list_select_related = ["user"]
     add_form = forms.CreateTokenForm
-    actions = ["refresh_token_action"]
+    actions = [
+        "refresh_token_action",
+        "revoke_token_action",
+        "export_csv_action",
+        "export_ndjson_action",
+    ]
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        cutoff = models.JwtRefreshToken.objects.expiry_cutoff()
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                _is_expired=ExpressionWrapper(
+                    Q(expires_at__lt=cutoff), output_field=BooleanField()
+                )
+            )
+        )
 
     def user_email(self, obj: models.JwtRefreshToken) -> str:
         return obj.user.email
 
     user_email.short_description = _("Email")
+    user_email.admin_order_field = "user__email"
 
     def token_payload(self, obj: models.JwtRefreshToken) -> str:
-        header, payload, sig = obj.token.split(".")
-        return urlsafe_base64_decode(payload).decode()
+        return decode_payload(obj.token)
 
     token_payload.short_description = _("Payload")
 
-    def is_expired(self, obj: models.JwtRefreshToken) -> bool:
-        now = datetime.utcnow().timestamp()
-        token_payload = json_decode(self.token_payload(obj))
-        return now > token_payload["exp"]
+    def is_expired(self, obj: models.JwtRefreshToken) -> t.Optional[bool]:
+        return obj._is_expired
 
     is_expired.boolean = True
     is_expired.short_description = _("Expired?")
+    is_expired.admin_order_field = "_is_expired"
 
     def get_form(self, request, obj=None, **kwargs):
         defaults = {}
@@ -61,6 +111,48 @@ class JwtRefreshTokenAdmin(admin.ModelAdmin):
         defaults.update(kwargs)
         return super().get_form(request, obj, **defaults)
 
+    def get_urls(self):
+        return [
+            path(
+                "export/<str:fmt>/",
+                self.admin_site.admin_view(self.export_view),
+                name=self.get_url_name("export"),
+            ),
+        ] + super().get_urls()
+
+    def get_url_name(self, view: str) -> str:
+        return "%s_%s_%s" % (
+            self.model._meta.app_label,
+            self.model._meta.model_name,
+            view,
+        )
+
+    def get_changelist(self, request: HttpRequest, **kwargs):
+        match = request.resolver_match
+        if match is not None and match.url_name == self.get_url_name("export"):
+            return ExportChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def export_view(self, request: HttpRequest, fmt: str) -> HttpResponse:
+        """
+        Stream the tokens of the changelist, with its filters and search applied,
+        in format ``fmt``. Link to it with the query string of the changelist.
+        """
+        if fmt not in FORMATS:
+            raise Http404
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            changelist = self.get_changelist_instance(request)
+        except IncorrectLookupParameters:
+            # Like the changelist itself, show the error page for bad filters.
+            url = reverse(
+                "admin:%s" % self.get_url_name("changelist"),
+                current_app=self.admin_site.name,
+            )
+            return HttpResponseRedirect(f"{url}?{ERROR_FLAG}=1")
+        return export_response(changelist.queryset, fmt)
+
     def has_change_permission(self, request, obj=None):
         if not request.user.is_superuser and app_settings.CHANGE_PERM_SUPERUSER_ONLY:
             return False
@@ -75,24 +167,46 @@ class JwtRefreshTokenAdmin(admin.ModelAdmin):
     def refresh_token_action(
         self, request: AuthenticatedRequest, queryset: TokenQuerySet
     ):
-        objs = []
-        for obj in queryset.iterator():
-            obj.token = models.JwtRefreshToken.objects.generate_token(
-                str(obj.user.pk)
-            ).serialize()
-            objs.append(obj)
-
-        updated = len(objs)
-        models.JwtRefreshToken.objects.bulk_update(objs, ["token"])
+        result = models.JwtRefreshToken.objects.bulk_refresh(queryset)
         self.message_user(
             request,
             ngettext(
-                "%d token was refreshed.",
-                "%d tokens were refreshed",
-                updated,
+                "%(count)d token was refreshed (%(rate).0f/s).",
+                "%(count)d tokens were refreshed (%(rate).0f/s).",
+                result.count,
             )
-            % updated,
+            % {"count": result.count, "rate": result.per_second},
             messages.SUCCESS,
         )
 
     refresh_token_action.short_description = _("Refresh token(s)")
+
+    def revoke_token_action(
+        self, request: AuthenticatedRequest, queryset: TokenQuerySet
+    ):
+        count = models.JwtRefreshToken.objects.revoke(queryset)
+        self.message_user(
+            request,
+            ngettext(
+                "%(count)d token was revoked.",
+                "%(count)d tokens were revoked.",
+                count,
+            )
+            % {"count": count},
+            messages.SUCCESS,
+        )
+
+    revoke_token_action.allowed_permissions = ("change",)
+    revoke_token_action.short_description = _("Revoke token(s)")
+
+    def export_csv_action(self, request: AuthenticatedRequest, queryset: QuerySet):
+        return export_response(queryset, "csv")
+
+    export_csv_action.allowed_permissions = ("view",)
+    export_csv_action.short_description = _("Export token(s) as CSV")
+
+    def export_ndjson_action(self, request: AuthenticatedRequest, queryset: QuerySet):
+        return export_response(queryset, "ndjson")
+
+    export_ndjson_action.allowed_permissions = ("view",)
+    export_ndjson_action.short_description = _("Export token(s) as NDJSON")
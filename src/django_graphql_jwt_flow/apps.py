@@ -1,11 +1,16 @@
-
+import hashlib
+import json
+import time
 import typing as t
-from datetime import timedelta
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import jwcrypto.jwk as jwk
 from django.apps import AppConfig
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
 class DjangoGraphqlJwtFlowConfig(AppConfig):
@@ -13,6 +18,197 @@ class DjangoGraphqlJwtFlowConfig(AppConfig):
     verbose_name = "Django GraphQL JWT Flow"
 
 
+class CachedJWK(jwk.JWK):
+    """
+    A JWK that remembers the crypto objects derived from it.
+
+    jwcrypto rebuilds the cryptography key object from the JWK parameters for every
+    sign and verify operation, which for RSA and EC keys means validating the key
+    material each time. Since configured keys never change during the lifetime of a
+    settings snapshot, we derive them once per operation and curve.
+    """
+
+    def __init__(self, **kwargs):
+        self._op_keys: t.Dict[t.Tuple[bool, t.Optional[str]], t.Any] = {}
+        super().__init__(**kwargs)
+
+    def _get_public_key(self, arg=None):
+        try:
+            return self._op_keys[False, arg]
+        except KeyError:
+            op_key = self._op_keys[False, arg] = super()._get_public_key(arg)
+            return op_key
+
+    def _get_private_key(self, arg=None):
+        try:
+            return self._op_keys[True, arg]
+        except KeyError:
+            op_key = self._op_keys[True, arg] = super()._get_private_key(arg)
+            return op_key
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: t.Any):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+
+class SettingsSnapshot(_Frozen):
+    """
+    Read-only copy of the library settings, merged with their defaults.
+    """
+
+    defaults: t.Dict[str, t.Any] = {
+        "KEY_FORMAT": "DICT",
+        "KEY": None,
+        "KEY_FILE": None,
+        "KID": None,
+        "KEYRING": None,
+        "ACTIVE_KID": None,
+        "KEY_GRACE_DAYS": None,
+        "REFRESH_DAYS": 7,
+        "SIGNATURE_ALG": "HS384",
+        "ALLOWED_SKEW": 90,
+        "TIME_WITH_MICROSECONDS": False,
+        "CHANGE_PERM_SUPERUSER_ONLY": True,
+        "DELETE_PERM_SUPERUSER_ONLY": True,
+        "BULK_CHUNK_SIZE": 1000,
+        "BULK_WORKERS": 1,
+        "BATCH_CONCURRENCY": 1,
+        "DOCUMENT_CACHE_SIZE": 256,
+        "PERSISTED_QUERIES": {},
+        "PERSISTED_QUERIES_REGISTER": False,
+        "JWKS_MAX_AGE": 3600,
+        "REVOCATION_CAPACITY": 100000,
+        "REVOCATION_FALSE_POSITIVE_RATE": 0.001,
+        "REVOCATION_SYNC_INTERVAL": 5.0,
+        "LOGIN_RATE_PER_USERNAME": (10, 60),
+        "LOGIN_RATE_PER_IP": None,
+        "LOGIN_THROTTLE_BACKEND": "django_graphql_jwt_flow.throttling.LocalThrottle",
+        "LOGIN_THROTTLE_CACHE": "default",
+        "LOGIN_CONCURRENCY": None,
+        "METRICS": False,
+        "METRICS_DIR": None,
+        "METRICS_FLUSH_INTERVAL": 1.0,
+        "USER_CACHE_TTL": 0,
+        "VERIFIED_TOKEN_CACHE_SIZE": 10000,
+        "VERIFIED_TOKEN_CACHE_TTL": 300,
+        "TOKEN_STORAGE": "django_graphql_jwt_flow.storage.ModelStorage",
+        "TOKEN_STORAGE_CACHE": "default",
+        "TOKEN_STORAGE_WRITE_THROUGH": True,
+        "READ_REPLICAS": (),
+        "REPLICA_PIN_SECONDS": 10.0,
+        "REPLICA_PIN_CACHE": None,
+    }
+    __slots__ = tuple(defaults) + ("expiration_delta",)
+
+    def __init__(self, django_settings: t.Dict[str, t.Any]):
+        for name, default in self.defaults.items():
+            object.__setattr__(self, name, django_settings.get(name, default))
+        object.__setattr__(self, "expiration_delta", timedelta(days=self.REFRESH_DAYS))
+
+
+class KeyMaterial(_Frozen):
+    """
+    The parsed keys, indexed by key id, and their public halves.
+
+    ``key`` and ``kid`` are the active signing key and its id. ``keys`` holds every
+    key that may verify tokens, including the active one, and ``verify_until`` the
+    moment after which a retired key may no longer be used. For symmetric keys the
+    public half is the key itself.
+
+    ``published`` holds the JWK parameters of the public halves of asymmetric keys,
+    as served by :meth:`get_jwks`. Symmetric keys are never published.
+    """
+
+    __slots__ = (
+        "key",
+        "public_key",
+        "kid",
+        "keys",
+        "public_keys",
+        "verify_until",
+        "published",
+        "_jwks",
+    )
+
+    def __init__(
+        self,
+        kid: t.Optional[str],
+        keys: t.Dict[t.Optional[str], jwk.JWK],
+        verify_until: t.Optional[t.Dict[t.Optional[str], datetime]] = None,
+    ):
+        public_keys = {
+            key_id: self.get_public_half(key) for key_id, key in keys.items()
+        }
+        object.__setattr__(self, "kid", kid)
+        object.__setattr__(self, "key", keys[kid])
+        object.__setattr__(self, "public_key", public_keys[kid])
+        object.__setattr__(self, "keys", keys)
+        object.__setattr__(self, "public_keys", public_keys)
+        object.__setattr__(self, "verify_until", verify_until or {})
+        published = {}
+        for key_id, key in keys.items():
+            if not key.is_symmetric:
+                params = key.export_public(as_dict=True)
+                if key_id is not None:
+                    params["kid"] = key_id
+                params.setdefault("use", "sig")
+                published[key_id] = params
+        object.__setattr__(self, "published", published)
+        object.__setattr__(self, "_jwks", {})
+
+    @staticmethod
+    def get_public_half(key: jwk.JWK) -> jwk.JWK:
+        if key.is_symmetric or not key.has_private:
+            return key
+        return CachedJWK(**key.export_public(as_dict=True))
+
+    def get_verification_key(
+        self, kid: t.Optional[str], now: t.Optional[datetime] = None
+    ) -> t.Optional[jwk.JWK]:
+        """
+        Key to verify a token signed with key id ``kid``, if that key is known and
+        has not aged out. Tokens without a key id are verified with the active key.
+        """
+        if kid is None:
+            return self.key
+        key = self.keys.get(kid)
+        if key is not None and kid in self.verify_until:
+            if (now or timezone.now()) >= self.verify_until[kid]:
+                return None
+        return key
+
+    def get_jwks(self, now: t.Optional[datetime] = None) -> t.Tuple[bytes, str]:
+        """
+        The JWK Set of the published keys that currently verify tokens.
+
+        Documents are serialized once per set of keys, so serving them only costs a
+        dictionary lookup.
+
+        :return: The serialized document and its ETag.
+        """
+        now = now or timezone.now()
+        kids = tuple(
+            kid
+            for kid in self.published
+            if kid not in self.verify_until or now < self.verify_until[kid]
+        )
+        jwks = self._jwks.get(kids)
+        if jwks is None:
+            body = json.dumps(
+                {"keys": [self.published[kid] for kid in kids]},
+                separators=(",", ":"),
+                sort_keys=True,
+            ).encode("utf-8")
+            jwks = self._jwks[kids] = (body, f'"{hashlib.sha256(body).hexdigest()}"')
+        return jwks
+
+
 class AppSettings:
     """
     Application settings for Django GraphQL JWT Flow
@@ -24,11 +220,15 @@ class AppSettings:
     applies to `get_symmetric_key()`.
     The exception can be suppressed by setting ``raise_exception`` to ``False``.
 
+    Settings are read once into a :class:`SettingsSnapshot` and the key is parsed
+    once into :class:`KeyMaterial`. Both are discarded by :meth:`reload`, which is
+    called whenever Django sends ``setting_changed`` for our dictionary.
     """
 
     def __init__(self, dict_name: str):
         self.dict_name = dict_name
-        self._django_settings = None
+        self._snapshot: t.Optional[SettingsSnapshot] = None
+        self._key_material: t.Optional[KeyMaterial] = None
 
     @property
     def django_settings(self) -> t.Dict[str, t.Any]:
@@ -39,50 +239,192 @@ class AppSettings:
 
         return django_settings
 
+    @property
+    def snapshot(self) -> SettingsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._snapshot = SettingsSnapshot(self.django_settings)
+        return snapshot
+
+    def reload(self):
+        """
+        Forget the settings snapshot and parsed key, so they are rebuilt from
+        Django's settings on next access.
+        """
+        self._snapshot = None
+        self._key_material = None
+
     @property
     def KEY_FORMAT(self) -> str:
-        return self.django_settings.get("KEY_FORMAT", "DICT")
+        return self.snapshot.KEY_FORMAT
 
     @property
     def KEY(self) -> t.Optional[t.Union[str, bytes, t.Dict[str, str]]]:
-        return self.django_settings.get("KEY")
+        return self.snapshot.KEY
 
     @property
     def KEY_FILE(self) -> t.Optional[Path]:
-        key_file: t.Optional[t.Union[str, Path]] = self.django_settings.get("KEY_FILE")
-        if key_file:
-            if not isinstance(key_file, Path):
-                key_file = Path(key_file)
+        return self.resolve_key_file(self.snapshot.KEY_FILE)
 
-            key_file = key_file.resolve()
-            if not key_file.exists():
-                raise FileNotFoundError(f"{key_file}: File does not exist")
+    @property
+    def KID(self) -> t.Optional[str]:
+        return self.snapshot.KID
 
-        return key_file
+    @property
+    def KEYRING(self) -> t.Optional[t.List[t.Dict[str, t.Any]]]:
+        return self.snapshot.KEYRING
+
+    @property
+    def ACTIVE_KID(self) -> t.Optional[str]:
+        return self.snapshot.ACTIVE_KID
+
+    @property
+    def KEY_GRACE_DAYS(self) -> int:
+        grace_days = self.snapshot.KEY_GRACE_DAYS
+        return self.REFRESH_DAYS if grace_days is None else grace_days
 
     @property
     def REFRESH_DAYS(self) -> int:
-        return self.django_settings.get("REFRESH_DAYS", 7)
+        return self.snapshot.REFRESH_DAYS
 
     @property
     def SIGNATURE_ALG(self) -> str:
-        return self.django_settings.get("SIGNATURE_ALG", "HS384")
+        return self.snapshot.SIGNATURE_ALG
 
     @property
     def ALLOWED_SKEW(self) -> int:
-        return self.django_settings.get("ALLOWED_SKEW", 90)
+        return self.snapshot.ALLOWED_SKEW
 
     @property
     def TIME_WITH_MICROSECONDS(self) -> bool:
-        return self.django_settings.get("TIME_WITH_MICROSECONDS", False)
+        return self.snapshot.TIME_WITH_MICROSECONDS
 
     @property
     def CHANGE_PERM_SUPERUSER_ONLY(self) -> bool:
-        return self.django_settings.get("CHANGE_PERM_SUPERUSER_ONLY", True)
+        return self.snapshot.CHANGE_PERM_SUPERUSER_ONLY
 
     @property
     def DELETE_PERM_SUPERUSER_ONLY(self) -> bool:
-        return self.django_settings.get("DELETE_PERM_SUPERUSER_ONLY", True)
+        return self.snapshot.DELETE_PERM_SUPERUSER_ONLY
+
+    @property
+    def BULK_CHUNK_SIZE(self) -> int:
+        return self.snapshot.BULK_CHUNK_SIZE
+
+    @property
+    def BULK_WORKERS(self) -> int:
+        return self.snapshot.BULK_WORKERS
+
+    @property
+    def BATCH_CONCURRENCY(self) -> int:
+        return self.snapshot.BATCH_CONCURRENCY
+
+    @property
+    def DOCUMENT_CACHE_SIZE(self) -> int:
+        return self.snapshot.DOCUMENT_CACHE_SIZE
+
+    @property
+    def PERSISTED_QUERIES(self) -> t.Mapping[str, str]:
+        return self.snapshot.PERSISTED_QUERIES
+
+    @property
+    def PERSISTED_QUERIES_REGISTER(self) -> bool:
+        return self.snapshot.PERSISTED_QUERIES_REGISTER
+
+    @property
+    def JWKS_MAX_AGE(self) -> int:
+        return self.snapshot.JWKS_MAX_AGE
+
+    @property
+    def REVOCATION_CAPACITY(self) -> int:
+        return self.snapshot.REVOCATION_CAPACITY
+
+    @property
+    def REVOCATION_FALSE_POSITIVE_RATE(self) -> float:
+        return self.snapshot.REVOCATION_FALSE_POSITIVE_RATE
+
+    @property
+    def REVOCATION_SYNC_INTERVAL(self) -> float:
+        return self.snapshot.REVOCATION_SYNC_INTERVAL
+
+    @property
+    def LOGIN_RATE_PER_USERNAME(self) -> t.Optional[t.Tuple[int, float]]:
+        return self.snapshot.LOGIN_RATE_PER_USERNAME
+
+    @property
+    def LOGIN_RATE_PER_IP(self) -> t.Optional[t.Tuple[int, float]]:
+        return self.snapshot.LOGIN_RATE_PER_IP
+
+    @property
+    def LOGIN_THROTTLE_BACKEND(self) -> str:
+        return self.snapshot.LOGIN_THROTTLE_BACKEND
+
+    @property
+    def LOGIN_THROTTLE_CACHE(self) -> str:
+        return self.snapshot.LOGIN_THROTTLE_CACHE
+
+    @property
+    def LOGIN_CONCURRENCY(self) -> t.Optional[int]:
+        return self.snapshot.LOGIN_CONCURRENCY
+
+    @property
+    def METRICS(self) -> bool:
+        return self.snapshot.METRICS
+
+    @property
+    def METRICS_DIR(self) -> t.Optional[t.Union[str, Path]]:
+        return self.snapshot.METRICS_DIR
+
+    @property
+    def METRICS_FLUSH_INTERVAL(self) -> float:
+        return self.snapshot.METRICS_FLUSH_INTERVAL
+
+    @property
+    def USER_CACHE_TTL(self) -> float:
+        return self.snapshot.USER_CACHE_TTL
+
+    @property
+    def VERIFIED_TOKEN_CACHE_SIZE(self) -> int:
+        return self.snapshot.VERIFIED_TOKEN_CACHE_SIZE
+
+    @property
+    def VERIFIED_TOKEN_CACHE_TTL(self) -> float:
+        return self.snapshot.VERIFIED_TOKEN_CACHE_TTL
+
+    @property
+    def TOKEN_STORAGE(self) -> str:
+        return self.snapshot.TOKEN_STORAGE
+
+    @property
+    def TOKEN_STORAGE_CACHE(self) -> str:
+        return self.snapshot.TOKEN_STORAGE_CACHE
+
+    @property
+    def TOKEN_STORAGE_WRITE_THROUGH(self) -> bool:
+        return self.snapshot.TOKEN_STORAGE_WRITE_THROUGH
+
+    @property
+    def READ_REPLICAS(self) -> t.Sequence[str]:
+        return self.snapshot.READ_REPLICAS
+
+    @property
+    def REPLICA_PIN_SECONDS(self) -> float:
+        return self.snapshot.REPLICA_PIN_SECONDS
+
+    @property
+    def REPLICA_PIN_CACHE(self) -> t.Optional[str]:
+        return self.snapshot.REPLICA_PIN_CACHE
+
+    @property
+    def key_material(self) -> KeyMaterial:
+        key_material = self._key_material
+        if key_material is None:
+            from .metrics import key_load_seconds
+
+            start = time.perf_counter()
+            key_material = self._key_material = self.load_key_material()
+            key_load_seconds.observe(time.perf_counter() - start)
+        return key_material
 
     def get_key(self) -> jwk.JWK:
         """
@@ -90,35 +432,132 @@ class AppSettings:
 
         :return: The key configured to use by default.
         """
-        if self.KEY_FILE:
-            if self.KEY_FILE.suffix.lower() == ".pem":
-                return jwk.JWK.from_pem(self.KEY_FILE.read_bytes())
-            elif self.KEY_FILE.suffix.lower() == ".json":
-                return jwk.JWK.from_json(self.KEY_FILE.read_text(encoding="utf-8"))
-            elif self.KEY_FILE.suffix.lower() == ".pyca":
-                return jwk.JWK.from_pyca(self.KEY_FILE.read_text(encoding="utf-8"))
+        return self.key_material.key
+
+    def get_kid(self) -> t.Optional[str]:
+        """
+        Key id of the key returned by :meth:`get_key`, to put in token headers.
+        """
+        return self.key_material.kid
+
+    def get_public_key(self) -> jwk.JWK:
+        """
+        The public half of the configured key, or the key itself if it is symmetric.
+
+        :return: The key to publish or verify with.
+        """
+        return self.key_material.public_key
+
+    def get_verification_key(self, kid: t.Optional[str]) -> t.Optional[jwk.JWK]:
+        """
+        Look up the key to verify a token signed with key id ``kid``.
+
+        :return: The key, or None if the key id is unknown or past its grace period.
+        """
+        return self.key_material.get_verification_key(kid)
+
+    def load_key_material(self) -> KeyMaterial:
+        """
+        Parse the configured key or keyring, bypassing the cache.
+        """
+        keyring = self.KEYRING
+        if not keyring:
+            key = self.load_key()
+            return KeyMaterial(self.KID or key.key_id, {self.KID or key.key_id: key})
+
+        keys: t.Dict[t.Optional[str], jwk.JWK] = {}
+        verify_until: t.Dict[t.Optional[str], datetime] = {}
+        grace = timedelta(days=self.KEY_GRACE_DAYS)
+        for entry in keyring:
+            kid = entry.get("KID")
+            if not kid:
+                raise ImproperlyConfigured("Every KEYRING entry needs a KID")
+            if kid in keys:
+                raise ImproperlyConfigured(f"{kid}: Duplicate KID in KEYRING")
+            keys[kid] = self.parse_key(
+                entry.get("KEY"),
+                self.resolve_key_file(entry.get("KEY_FILE")),
+                entry.get("KEY_FORMAT", "DICT"),
+            )
+            retired_at = entry.get("RETIRED_AT")
+            if retired_at:
+                if isinstance(retired_at, str):
+                    retired_at = parse_datetime(retired_at)
+                if retired_at is None:
+                    raise ImproperlyConfigured(f"{kid}: Invalid RETIRED_AT")
+                if timezone.is_naive(retired_at):
+                    retired_at = timezone.make_aware(retired_at, timezone.utc)
+                verify_until[kid] = retired_at + grace
+
+        active_kid = self.ACTIVE_KID or keyring[0]["KID"]
+        if active_kid not in keys:
+            raise ImproperlyConfigured(f"{active_kid}: ACTIVE_KID not in KEYRING")
+        verify_until.pop(active_kid, None)
+        return KeyMaterial(active_kid, keys, verify_until)
+
+    def load_key(self) -> jwk.JWK:
+        """
+        Read and parse the configured key, bypassing the cache.
+
+        :return: A freshly parsed key.
+        """
+        return self.parse_key(self.KEY, self.KEY_FILE, self.KEY_FORMAT)
+
+    @staticmethod
+    def resolve_key_file(key_file: t.Optional[t.Union[str, Path]]) -> t.Optional[Path]:
+        if key_file:
+            if not isinstance(key_file, Path):
+                key_file = Path(key_file)
+
+            key_file = key_file.resolve()
+            if not key_file.exists():
+                raise FileNotFoundError(f"{key_file}: File does not exist")
+
+        return key_file
+
+    @staticmethod
+    def parse_key(
+        key: t.Optional[t.Union[str, bytes, t.Dict[str, str]]],
+        key_file: t.Optional[Path],
+        key_format: str,
+    ) -> jwk.JWK:
+        if key_file:
+            if key_file.suffix.lower() == ".pem":
+                return CachedJWK.from_pem(key_file.read_bytes())
+            elif key_file.suffix.lower() == ".json":
+                return CachedJWK.from_json(key_file.read_text(encoding="utf-8"))
+            elif key_file.suffix.lower() == ".pyca":
+                return CachedJWK.from_pyca(key_file.read_text(encoding="utf-8"))
             else:
-                raise TypeError(f"{self.KEY_FILE.suffix}: Unsupported file type.")
-        elif self.KEY:
-            if self.KEY_FORMAT == "PEM":
-                return jwk.JWK.from_pem(
-                    self.KEY.encode("utf-8") if isinstance(self.KEY, str) else self.KEY
+                raise TypeError(f"{key_file.suffix}: Unsupported file type.")
+        elif key:
+            if key_format == "PEM":
+                return CachedJWK.from_pem(
+                    key.encode("utf-8") if isinstance(key, str) else key
                 )
-            elif self.KEY_FORMAT == "JSON":
-                return jwk.JWK.from_json(self.KEY)
-            elif self.KEY_FORMAT == "DICT":
-                if not isinstance(self.KEY, dict):
+            elif key_format == "JSON":
+                return CachedJWK.from_json(key)
+            elif key_format == "DICT":
+                if not isinstance(key, dict):
                     raise TypeError(
                         "KEY_FORMAT is set to DICT, but KEY is not a dictionary"
                     )
-                return jwk.JWK(**self.KEY)
+                return CachedJWK(**key)
             else:
-                raise TypeError(f"{self.KEY_FORMAT}: Unsupported key format")
+                raise TypeError(f"{key_format}: Unsupported key format")
         else:
             raise ImproperlyConfigured("Either a KEY or KEY_FILE is needed")
 
     def get_expiration_delta(self) -> timedelta:
-        return timedelta(days=self.REFRESH_DAYS)
+        return self.snapshot.expiration_delta
+
+
+app_settings = AppSettings("JWT_FLOW")
+
+
+def reload_app_settings(*, setting: str, **kwargs):
+    if setting == app_settings.dict_name:
+        app_settings.reload()
 
 
-app_settings = AppSettings("JWT_FLOW")
\ No newline at end of file
+setting_changed.connect(reload_app_settings)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import typing as t
+from collections import OrderedDict
+from functools import partial
+
+from graphql import parse, validate
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+
+from .apps import app_settings
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from graphql.type.schema import GraphQLSchema
+
+__all__ = (
+    "CachedDocumentBackend",
+    "PersistedQueries",
+    "document_backend",
+    "persisted_queries",
+    "query_hash",
+)
+
+
+def query_hash(query: str) -> str:
+    """
+    The hex encoded SHA-256 of a query, as used by persisted queries.
+    """
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class CachedDocumentBackend(GraphQLBackend):
+    """
+    A GraphQL backend that parses and validates every document once.
+
+    Documents are kept in an LRU cache of at most ``DOCUMENT_CACHE_SIZE`` entries,
+    keyed by the schema and the SHA-256 of the query. Validation errors are cached
+    too, so repeating an invalid query is as cheap as repeating a valid one. Parse
+    errors are raised and not cached.
+    """
+
+    def __init__(self):
+        self._documents: OrderedDict[t.Tuple[int, str], GraphQLDocument] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def document_from_string(
+        self, schema: GraphQLSchema, document_string: str
+    ) -> GraphQLDocument:
+        key = (id(schema), query_hash(document_string))
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None and document.schema is schema:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        document = self.parse_and_validate(schema, document_string)
+        size = app_settings.DOCUMENT_CACHE_SIZE
+        if size > 0:
+            with self._lock:
+                self._documents[key] = document
+                while len(self._documents) > size:
+                    self._documents.popitem(last=False)
+        return document
+
+    @staticmethod
+    def parse_and_validate(
+        schema: GraphQLSchema, document_string: str
+    ) -> GraphQLDocument:
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+
+            def execute_invalid(*args, **kwargs):
+                return ExecutionResult(errors=errors, invalid=True)
+
+            document_execute = execute_invalid
+        else:
+            document_execute = partial(execute, schema, document_ast)
+
+        return GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=document_execute,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> t.Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._documents),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class PersistedQueries:
+    """
+    Queries that clients may refer to by their SHA-256 hash only, following the
+    ``extensions.persistedQuery`` protocol of Apollo.
+
+    Queries are read from ``PERSISTED_QUERIES``, a mapping of hash to query. If
+    ``PERSISTED_QUERIES_REGISTER`` is set, a client sending both the query and its
+    hash registers the query in this process, up to ``DOCUMENT_CACHE_SIZE`` queries.
+    """
+
+    def __init__(self):
+        self._registered: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256_hash: str) -> t.Optional[str]:
+        query = app_settings.PERSISTED_QUERIES.get(sha256_hash)
+        if query is None:
+            with self._lock:
+                query = self._registered.get(sha256_hash)
+        return query
+
+    def register(self, sha256_hash: str, query: str) -> bool:
+        """
+        Remember a query sent together with its hash.
+
+        :return: Whether the hash matches the query.
+        """
+        if query_hash(query) != sha256_hash:
+            return False
+        if app_settings.PERSISTED_QUERIES_REGISTER:
+            with self._lock:
+                self._registered[sha256_hash] = query
+                while len(self._registered) > app_settings.DOCUMENT_CACHE_SIZE:
+                    self._registered.popitem(last=False)
+        return True
+
+
+document_backend = CachedDocumentBackend()
+persisted_queries = PersistedQueries()
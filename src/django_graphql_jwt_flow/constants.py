@@ -0,0 +1,3 @@
+#: Set on the request by :class:`~django_graphql_jwt_flow.views.AsyncGraphQLView`, so
+#: resolvers know they run on the event loop and must not block it.
+ASYNC_EXECUTION_FLAG = "graphql_jwt_flow_async_execution"
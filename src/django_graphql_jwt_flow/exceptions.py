@@ -13,3 +13,22 @@ class GraphQLError(BaseGraphQLError):
         # type: (...) -> None
         super().__init__(message, **kwargs)
         self.status_code = status_code
+
+
+class RefreshTokenReused(Exception):
+    """
+    A refresh token was presented that is not the user's current token, because it
+    was already rotated.
+    """
+
+
+class RefreshTokenExpired(Exception):
+    """
+    An expired refresh token was presented for rotation.
+    """
+
+
+class RefreshTokenRevoked(Exception):
+    """
+    A revoked refresh token was presented.
+    """
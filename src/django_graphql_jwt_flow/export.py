@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import binascii
+import csv
+import json
+import typing as t
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode
+
+from .apps import app_settings
+from .models import JwtRefreshToken
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.db.models.query import QuerySet
+
+__all__ = ("FORMATS", "decode_payload", "export_response", "export_rows")
+
+#: Columns of an export, in order.
+COLUMNS = ("user_id", "email", "issued_at", "expires_at", "expired", "payload")
+
+#: Rows joined into one chunk of the response body.
+ROWS_PER_CHUNK = 500
+
+
+def decode_payload(raw: str) -> str:
+    """
+    The claims of a serialized token as JSON text, without verifying it.
+
+    :return: The decoded payload, or an empty string if the token is malformed.
+    """
+    try:
+        header, payload, signature = raw.split(".")
+        return urlsafe_base64_decode(payload).decode()
+    except (ValueError, binascii.Error):
+        return ""
+
+
+def export_rows(
+    queryset: QuerySet, chunk_size: t.Optional[int] = None
+) -> t.Iterator[t.Tuple[t.Any, ...]]:
+    """
+    Yield one tuple of :data:`COLUMNS` per token, without creating model instances.
+
+    Rows are fetched with ``values_list().iterator()``, ``chunk_size`` at a time,
+    so memory use does not depend on the size of the queryset. Each payload is
+    decoded once.
+
+    :param queryset: The tokens to export.
+    :param chunk_size: Rows fetched at a time. Defaults to ``BULK_CHUNK_SIZE``.
+    """
+    cutoff = JwtRefreshToken.objects.expiry_cutoff()
+    rows = queryset.values_list(
+        "user_id", "user__email", "issued_at", "expires_at", "token"
+    ).iterator(chunk_size=chunk_size or app_settings.BULK_CHUNK_SIZE)
+    for user_id, email, issued_at, expires_at, raw in rows:
+        expired = expires_at < cutoff if expires_at is not None else None
+        yield user_id, email, issued_at, expires_at, expired, decode_payload(raw)
+
+
+class _Echo:
+    """
+    A file-like object for :func:`csv.writer` that returns what is written.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(rows: t.Iterable[t.Tuple[t.Any, ...]]) -> t.Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    chunk = []
+    for user_id, email, issued_at, expires_at, expired, payload in rows:
+        chunk.append(
+            writer.writerow(
+                (
+                    user_id,
+                    email,
+                    issued_at.isoformat() if issued_at else "",
+                    expires_at.isoformat() if expires_at else "",
+                    "" if expired is None else int(expired),
+                    payload,
+                )
+            )
+        )
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def stream_ndjson(rows: t.Iterable[t.Tuple[t.Any, ...]]) -> t.Iterator[str]:
+    # Nothing to send before the first row, so yield an empty chunk to start the
+    # response right away.
+    yield ""
+    chunk = []
+    for user_id, email, issued_at, expires_at, expired, payload in rows:
+        try:
+            claims = json.loads(payload) if payload else None
+        except ValueError:
+            claims = None
+        chunk.append(
+            json.dumps(
+                {
+                    "user_id": user_id,
+                    "email": email,
+                    "issued_at": issued_at.isoformat() if issued_at else None,
+                    "expires_at": expires_at.isoformat() if expires_at else None,
+                    "expired": expired,
+                    "payload": claims,
+                },
+                separators=(",", ":"),
+            )
+            + "\n"
+        )
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+#: Export formats, as ``name: (content type, extension, stream)``.
+FORMATS: t.Dict[
+    str, t.Tuple[str, str, t.Callable[[t.Iterable[t.Tuple]], t.Iterator[str]]]
+] = {
+    "csv": ("text/csv; charset=utf-8", "csv", stream_csv),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "ndjson", stream_ndjson),
+}
+
+
+def export_response(queryset: QuerySet, fmt: str) -> StreamingHttpResponse:
+    """
+    Stream the tokens of a queryset as an attachment in format ``fmt``.
+
+    The query only runs once the body is iterated, after the first chunk was sent.
+    """
+    content_type, extension, stream = FORMATS[fmt]
+    response = StreamingHttpResponse(
+        stream(export_rows(queryset)), content_type=content_type
+    )
+    filename = f"refresh-tokens-{timezone.now():%Y%m%d-%H%M%S}.{extension}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -12,22 +12,31 @@ def get_default_expires_at():
     return timezone.now() + timedelta(days=app_settings.REFRESH_DAYS)
 
 
+def validate_expires_at(value: datetime) -> datetime:
+    """
+    Check that a token expiry entered by a person lies in the future.
+
+    :return: The expiry in UTC.
+    """
+    if value < timezone.now():
+        raise ValidationError({"expires_at": "Token expires before issue date"})
+
+    return value.astimezone(timezone.utc)
+
+
 class CreateTokenForm(forms.ModelForm):
     expires_at = forms.DateTimeField(initial=get_default_expires_at, required=True)
 
     def clean_expires_at(self):
-        value: datetime = self.cleaned_data["expires_at"]
-        if value < timezone.now():
-            raise ValidationError({"expires_at": "Token expires before issue date"})
-
-        return value.astimezone(timezone.utc)
+        return validate_expires_at(self.cleaned_data["expires_at"])
 
     def save(self, commit=True):
         user = self.cleaned_data["user"]
         pk = str(user.pk)
         expires_at = self.cleaned_data["expires_at"]
         token = models.JwtRefreshToken.objects.generate_token(pk, expires_at=expires_at)
-        self.instance.token = token.serialize()
+        for name, value in models.JwtRefreshToken.objects.token_fields(token).items():
+            setattr(self.instance, name, value)
         return super().save(commit=commit)
 
     class Meta:
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import argparse
+import os
+import secrets
+import time
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management import BaseCommand, CommandError
+from jwcrypto import jws, jwt
+from jwcrypto.common import json_decode
+
+from django_graphql_jwt_flow.apps import CachedJWK
+
+#: Algorithms and key parameters that can be configured, as ``(alg, key)``.
+CANDIDATES = (
+    ("HS256", {"kty": "oct", "size": 256}),
+    ("HS384", {"kty": "oct", "size": 384}),
+    ("HS512", {"kty": "oct", "size": 512}),
+    ("EdDSA", {"kty": "OKP", "crv": "Ed25519"}),
+    ("EdDSA", {"kty": "OKP", "crv": "Ed448"}),
+    ("ES256", {"kty": "EC", "crv": "P-256"}),
+    ("ES384", {"kty": "EC", "crv": "P-384"}),
+    ("ES512", {"kty": "EC", "crv": "P-521"}),
+    ("RS256", {"kty": "RSA", "size": 2048}),
+    ("RS256", {"kty": "RSA", "size": 3072}),
+    ("RS256", {"kty": "RSA", "size": 4096}),
+    ("PS256", {"kty": "RSA", "size": 2048}),
+)
+
+
+class Result(t.NamedTuple):
+    alg: str
+    key: str
+    symmetric: bool
+    token_size: int
+    sign: float
+    verify: float
+    parallel_sign: float
+    parallel_verify: float
+
+    @property
+    def per_token(self) -> float:
+        """Tokens per second that can be signed once and verified once."""
+        return 1 / (1 / self.sign + 1 / self.verify)
+
+
+def describe_key(params: t.Dict[str, t.Any]) -> str:
+    if "crv" in params:
+        return params["crv"]
+    return f"{params['kty']} {params['size']}"
+
+
+def measure(alg: str, key: t.Dict[str, str], number: int) -> t.Tuple[float, float, int]:
+    """
+    Sign and verify ``number`` tokens the way the token manager does.
+
+    A module level function, so it can run in a process pool.
+
+    :return: Signatures per second, verifications per second and token size.
+    """
+    key = CachedJWK(**key)
+    now = datetime.utcnow().replace(microsecond=0)
+    default_claims = {
+        "iat": now.timestamp(),
+        "exp": (now + timedelta(days=7)).timestamp(),
+        "jti": secrets.token_urlsafe(16),
+    }
+
+    def sign_one() -> str:
+        token = jwt.JWT(
+            header={"alg": alg}, claims={"uid": "1"}, default_claims=default_claims
+        )
+        token.make_signed_token(key)
+        return token.serialize()
+
+    def verify_one(raw: str):
+        verified = jws.JWS()
+        verified.deserialize(raw)
+        verified.verify(key)
+        json_decode(verified.payload)
+
+    # Untimed, so one-off costs such as loading the key into the backend and
+    # importing lazily loaded modules are not counted.
+    raw = sign_one()
+    verify_one(raw)
+
+    start = time.perf_counter()
+    for _ in range(number):
+        sign_one()
+    sign = number / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(number):
+        verify_one(raw)
+    verify = number / (time.perf_counter() - start)
+    return sign, verify, len(raw)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure signing and verification throughput of every supported algorithm "
+        "and key size on this host, and recommend a SIGNATURE_ALG."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-n",
+            "--number",
+            type=int,
+            default=500,
+            metavar="tokens",
+            help="Tokens signed and verified per algorithm and process.",
+        )
+        parser.add_argument(
+            "-p",
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            metavar="count",
+            help="Processes for the parallel measurement. Default: number of CPUs.",
+        )
+        parser.add_argument(
+            "--alg",
+            action="append",
+            choices=sorted({alg for alg, params in CANDIDATES}),
+            help="Only measure this algorithm. Can be repeated.",
+        )
+        parser.add_argument(
+            "--asymmetric",
+            action="store_true",
+            help="Only recommend asymmetric algorithms, whose public keys can be "
+            "published for resource servers.",
+        )
+
+    def handle(self, *args, **options):
+        number: int = options["number"]
+        processes: int = options["processes"]
+        if number < 1 or processes < 1:
+            raise CommandError("--number and --processes must be positive integers")
+
+        candidates = [
+            (alg, params)
+            for alg, params in CANDIDATES
+            if not options["alg"] or alg in options["alg"]
+        ]
+        results = []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for alg, params in candidates:
+                if options["verbosity"] > 1:
+                    self.stderr.write(f"Measuring {alg} {describe_key(params)}...")
+                key = CachedJWK.generate(**params).export(as_dict=True)
+                sign, verify, size = measure(alg, key, number)
+                parallel = list(
+                    pool.map(
+                        measure,
+                        [alg] * processes,
+                        [key] * processes,
+                        [number] * processes,
+                    )
+                )
+                results.append(
+                    Result(
+                        alg=alg,
+                        key=describe_key(params),
+                        symmetric=params["kty"] == "oct",
+                        token_size=size,
+                        sign=sign,
+                        verify=verify,
+                        parallel_sign=sum(result[0] for result in parallel),
+                        parallel_verify=sum(result[1] for result in parallel),
+                    )
+                )
+
+        results.sort(key=lambda result: result.per_token, reverse=True)
+        self.write_table(results, processes)
+
+        eligible = [r for r in results if not options["asymmetric"] or not r.symmetric]
+        if eligible:
+            self.write_recommendation(eligible[0])
+
+    def write_table(self, results: t.Sequence[Result], processes: int):
+        self.stdout.write(
+            f"{'#':>3} {'alg':<7}{'key':<10}{'bytes':>7}{'sign/s':>11}{'verify/s':>11}"
+            f"{f'sign/s x{processes}':>15}{f'verify/s x{processes}':>17}"
+        )
+        for rank, result in enumerate(results, 1):
+            self.stdout.write(
+                f"{rank:>3} {result.alg:<7}{result.key:<10}{result.token_size:>7}"
+                f"{result.sign:>11.0f}{result.verify:>11.0f}"
+                f"{result.parallel_sign:>15.0f}{result.parallel_verify:>17.0f}"
+            )
+
+    def write_recommendation(self, result: Result):
+        if result.symmetric:
+            key_file, comment = "jwt-key.json", f"random {result.key[4:]} bit oct JWK"
+        elif result.key == "Ed25519":
+            key_file, comment = "jwt-key.pem", "manage.py generate_key --priv-out"
+        else:
+            key_file, comment = "jwt-key.pem", f"{result.key} private key"
+        self.stdout.write("")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"==> Fastest: {result.alg} with a {result.key} key, "
+                f"{result.per_token:.0f} tokens/s signed and verified per core."
+            )
+        )
+        self.stdout.write(
+            "JWT_FLOW = {\n"
+            f'    "SIGNATURE_ALG": "{result.alg}",\n'
+            f'    "KEY_FILE": BASE_DIR / "{key_file}",  # {comment}\n'
+            "}"
+        )
+        if result.symmetric:
+            self.stdout.write(
+                "Symmetric keys cannot be published with JWKSView. Use --asymmetric "
+                "if resource servers verify tokens."
+            )
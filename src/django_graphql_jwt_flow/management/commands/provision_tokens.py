@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django import forms
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+from django.db import router, transaction
+
+from django_graphql_jwt_flow.apps import app_settings
+from django_graphql_jwt_flow.forms import validate_expires_at
+from django_graphql_jwt_flow.models import JwtRefreshToken, sign_token
+from django_graphql_jwt_flow.utils import chunked_values, setup_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Create refresh tokens for all users that have none. Users are read in "
+        "primary key order, tokens are signed in parallel processes and inserted "
+        "with one bulk insert per batch."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=app_settings.BULK_CHUNK_SIZE,
+            metavar="rows",
+            help="Number of users read and tokens inserted per transaction.",
+        )
+        parser.add_argument(
+            "--expires-at",
+            metavar="datetime",
+            help="Expiry of the tokens, in any format the admin form accepts. "
+            "Default: REFRESH_DAYS from now.",
+        )
+        parser.add_argument(
+            "-p",
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            metavar="count",
+            help="Processes signing tokens. Default: number of CPUs.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size: int = options["batch_size"]
+        processes: int = options["processes"]
+        if batch_size < 1 or processes < 1:
+            raise CommandError("--batch-size and --processes must be positive integers")
+
+        expires_at = None
+        if options["expires_at"]:
+            try:
+                expires_at = validate_expires_at(
+                    forms.DateTimeField().clean(options["expires_at"])
+                )
+            except ValidationError as error:
+                raise CommandError(f"--expires-at: {' '.join(error.messages)}")
+
+        # An anti-join: LEFT OUTER JOIN on the token table, WHERE its id IS NULL.
+        users = get_user_model()._default_manager.filter(jwt_refresh_token__isnull=True)
+        total = users.count()
+        if not total:
+            self.stdout.write("All users have a token.")
+            return
+
+        sign = functools.partial(sign_token, expires_at=expires_at)
+        executor = None
+        if processes > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=processes, initializer=setup_worker
+            )
+
+        using = router.db_for_write(JwtRefreshToken)
+        start = time.perf_counter()
+        count = created = 0
+        try:
+            for chunk in chunked_values(users, (), batch_size):
+                user_ids = [user_id for user_id, in chunk]
+                if executor:
+                    chunksize = max(1, len(user_ids) // (processes * 4))
+                    tokens = executor.map(sign, user_ids, chunksize=chunksize)
+                else:
+                    tokens = map(sign, user_ids)
+                objs = [
+                    JwtRefreshToken(user_id=user_id, **fields)
+                    for user_id, fields in zip(user_ids, tokens)
+                ]
+                with transaction.atomic(using=using):
+                    # Users that got a token in the meantime keep it. Such inserts
+                    # report no row count, so count the tokens of this batch.
+                    tokens = JwtRefreshToken.objects.using(using)
+                    tokens.bulk_create(objs, ignore_conflicts=True)
+                    created += tokens.filter(
+                        token_digest__in=[obj.token_digest for obj in objs]
+                    ).count()
+                count += len(objs)
+                if options["verbosity"] > 0:
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f"{count}/{total} users, {created} tokens created, "
+                        f"{created / elapsed:.0f} tokens/s, last pk {user_ids[-1]}."
+                    )
+        finally:
+            if executor:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start
+        if count > created:
+            self.stdout.write(
+                f"{count - created} user(s) got a token meanwhile and kept it."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"==> Provisioned tokens for {created} user(s) in {elapsed:.1f}s."
+            )
+        )
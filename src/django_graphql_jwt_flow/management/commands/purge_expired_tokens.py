@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import argparse
+import time
+import typing as t
+
+from django.core.management import BaseCommand, CommandError
+from django.db import router, transaction
+
+from django_graphql_jwt_flow.apps import app_settings
+from django_graphql_jwt_flow.models import JwtRefreshToken, RevokedToken
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.db.models.query import QuerySet
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete refresh tokens that expired more than ALLOWED_SKEW seconds ago, "
+        "then revocation list entries of such tokens, in primary key order and one "
+        "short transaction per batch."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=app_settings.BULK_CHUNK_SIZE,
+            metavar="rows",
+            help="Number of tokens deleted per transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            metavar="seconds",
+            help="Pause between batches, to leave room for production traffic.",
+        )
+        parser.add_argument(
+            "--after",
+            type=int,
+            default=0,
+            metavar="pk",
+            help="Only consider refresh tokens with a primary key above this one. "
+            "Use the last reported primary key to resume an interrupted run.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=0,
+            metavar="rows",
+            help="Stop after deleting this many refresh tokens, and as many "
+            "revocation list entries. Default: no limit.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the tokens and revocation list entries that would be "
+            "deleted.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size: int = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer")
+
+        tokens = JwtRefreshToken.objects.expired().filter(pk__gt=options["after"])
+        revoked = RevokedToken.objects.filter(
+            expires_at__lt=JwtRefreshToken.objects.expiry_cutoff()
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{tokens.count()} expired token(s) would be deleted.")
+            self.stdout.write(
+                f"{revoked.count()} expired revoked token(s) would be deleted."
+            )
+            return
+
+        deleted = self.purge(tokens, "token(s)", options, after=options["after"])
+        self.stdout.write(
+            self.style.SUCCESS(f"==> Deleted {deleted} expired token(s).")
+        )
+        deleted = self.purge(revoked, "revoked token(s)", options)
+        self.stdout.write(
+            self.style.SUCCESS(f"==> Deleted {deleted} expired revoked token(s).")
+        )
+
+    def purge(
+        self, queryset: QuerySet, noun: str, options: t.Dict[str, t.Any], after: int = 0
+    ) -> int:
+        """
+        Delete the rows of ``queryset`` above primary key ``after`` in batches.
+
+        Each batch is deleted with the conditions of ``queryset`` repeated, so rows
+        that were refreshed after they were read are kept.
+
+        :return: The number of deleted rows.
+        """
+        batch_size: int = options["batch_size"]
+        limit: int = options["limit"]
+        using = router.db_for_write(queryset.model)
+        pks = queryset.order_by("pk").values_list("pk", flat=True)
+        last_pk = after
+        deleted = 0
+        while not limit or deleted < limit:
+            size = min(batch_size, limit - deleted) if limit else batch_size
+            with transaction.atomic(using=using):
+                batch = list(pks.filter(pk__gt=last_pk)[:size])
+                if not batch:
+                    break
+                count, __ = queryset.filter(pk__in=batch).delete()
+            deleted += count
+            last_pk = batch[-1]
+            if options["verbosity"] > 0:
+                self.stdout.write(f"Deleted {deleted} {noun}, last pk {last_pk}.")
+            if len(batch) < size:
+                break
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+        return deleted
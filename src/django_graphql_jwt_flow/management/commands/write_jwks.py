@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+
+from django_graphql_jwt_flow.apps import app_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the JWK Set served by JWKSView to a file, for resource servers or a "
+        "static file server. The file is replaced atomically."
+    )
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "output",
+            metavar="file",
+            help="File to write the JWK Set to, or - for standard output.",
+        )
+
+    def handle(self, *args, **options):
+        body, etag = app_settings.key_material.get_jwks()
+        if options["output"] == "-":
+            self.stdout.write(body.decode("utf-8"))
+            return
+
+        output = Path(options["output"]).resolve()
+        if not output.parent.is_dir():
+            raise CommandError(f"{output.parent}: Directory does not exist")
+
+        fd, tmp_name = tempfile.mkstemp(dir=output.parent, prefix=f".{output.name}.")
+        try:
+            with os.fdopen(fd, "wb") as file_obj:
+                file_obj.write(body)
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, output)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        self.stdout.write(self.style.SUCCESS(f"==> JWK Set written, ETag {etag}."))
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+from .apps import app_settings
+
+__all__ = (
+    "Counter",
+    "Histogram",
+    "Registry",
+    "registry",
+    "timed",
+)
+
+#: Upper bounds of the latency buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    math.inf,
+)
+
+Labels = t.Tuple[t.Tuple[str, str], ...]
+
+logger = logging.getLogger(__name__)
+
+
+class Registry:
+    """
+    Holds the values of all metrics of this process.
+
+    Observations only update dictionaries under a lock. If ``METRICS_DIR`` is set,
+    the values are also written to a file per process, at most once per
+    ``METRICS_FLUSH_INTERVAL`` seconds, and :meth:`render` adds up the files of all
+    processes, so every worker of a pre-forking server reports the totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics: t.Dict[str, t.Union[Counter, Histogram]] = {}
+        self._counters: t.Dict[t.Tuple[str, Labels], float] = {}
+        self._histograms: t.Dict[t.Tuple[str, Labels], t.List[float]] = {}
+        self._flushed_at = 0.0
+
+    def register(self, metric: t.Union[Counter, Histogram]):
+        self.metrics[metric.name] = metric
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def inc(self, name: str, labels: Labels, amount: float):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+        self.maybe_flush()
+
+    def observe(
+        self, name: str, labels: Labels, buckets: t.Sequence[float], value: float
+    ):
+        key = (name, labels)
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                # One count per bucket, then the sum.
+                counts = self._histograms[key] = [0.0] * (len(buckets) + 1)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+        self.maybe_flush()
+
+    def snapshot(self) -> t.Dict[str, t.List[t.Any]]:
+        with self._lock:
+            return {
+                "counters": [
+                    [name, list(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), list(counts)]
+                    for (name, labels), counts in self._histograms.items()
+                ],
+            }
+
+    def maybe_flush(self):
+        directory = app_settings.METRICS_DIR
+        if directory is None:
+            return
+        now = time.monotonic()
+        if now - self._flushed_at >= app_settings.METRICS_FLUSH_INTERVAL:
+            self._flushed_at = now
+            self.try_flush(directory)
+
+    def try_flush(self, directory: t.Union[str, Path]) -> bool:
+        """
+        :meth:`flush`, but an unwritable directory is logged instead of failing the
+        request that made the observation. It is retried on the next interval.
+
+        :return: Whether the values were written.
+        """
+        try:
+            self.flush(directory)
+        except OSError:
+            logger.warning("Could not write metrics to %s", directory, exc_info=True)
+            return False
+        return True
+
+    def flush(self, directory: t.Union[str, Path]):
+        """
+        Write the values of this process to ``<directory>/<pid>.json``, atomically.
+        """
+        directory = Path(directory)
+        fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".metrics.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file_obj:
+                json.dump(self.snapshot(), file_obj)
+            os.replace(tmp_name, directory / f"{os.getpid()}.json")
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def collect(self) -> t.List[t.Dict[str, t.List[t.Any]]]:
+        """
+        The values of this process, or of all processes if ``METRICS_DIR`` is set.
+        """
+        directory = app_settings.METRICS_DIR
+        if directory is None:
+            return [self.snapshot()]
+        snapshots, own = [], f"{os.getpid()}.json"
+        flushed = self.try_flush(directory)
+        if not flushed:
+            # The file of this process, if any, is outdated.
+            snapshots.append(self.snapshot())
+        for path in Path(directory).glob("*.json"):
+            if not flushed and path.name == own:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format, version 0.0.4.
+        """
+        counters: t.Dict[t.Tuple[str, Labels], float] = {}
+        histograms: t.Dict[t.Tuple[str, Labels], t.List[float]] = {}
+        for snapshot in self.collect():
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, counts in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0.0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            if isinstance(metric, Counter):
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {value:g}")
+                continue
+            for (key_name, labels), counts in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(metric.buckets, counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    bucket_labels = format_labels(labels + (("le", le),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative:g}")
+                lines.append(f"{name}_sum{format_labels(labels)} {counts[-1]:.9g}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative:g}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+registry = Registry()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        registry.register(self)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        if app_settings.METRICS:
+            registry.inc(self.name, tuple(sorted(labels.items())), amount)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+        registry.register(self)
+
+    def observe(self, value: float, **labels: str):
+        if app_settings.METRICS:
+            registry.observe(
+                self.name, tuple(sorted(labels.items())), self.buckets, value
+            )
+
+
+def timed(histogram: Histogram, **labels: str):
+    """
+    Decorator that observes the duration of every call in ``histogram``.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not app_settings.METRICS:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+token_seconds = Histogram(
+    "jwt_flow_token_seconds",
+    "Time spent signing and verifying tokens, by operation.",
+)
+token_checks = Counter(
+    "jwt_flow_token_checks_total",
+    "Stored tokens checked with is_valid(), by outcome.",
+)
+key_load_seconds = Histogram(
+    "jwt_flow_key_load_seconds",
+    "Time spent reading and parsing the configured keys.",
+)
+db_seconds = Histogram(
+    "jwt_flow_db_seconds",
+    "Time spent in token manager operations that query the database, by operation.",
+)
+auth_checks = Counter(
+    "jwt_flow_auth_checks_total",
+    "Bearer tokens checked by JwtAuthenticationMiddleware, by outcome.",
+)
+graphql_seconds = Histogram(
+    "jwt_flow_graphql_seconds",
+    "Time spent executing GraphQL requests, by response status code.",
+)
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .apps import app_settings
+from .metrics import auth_checks, token_seconds
+from .models import verify_claims
+from .revocation import revocation_list
+from .utils import token_digest
+from .wks import TokenInvalidReasons
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.contrib.auth.base_user import AbstractBaseUser
+    from django.http import HttpRequest
+
+    CustomUser = t.TypeVar("CustomUser", bound=AbstractBaseUser)
+
+__all__ = (
+    "JwtAuthenticationMiddleware",
+    "UserCache",
+    "get_bearer_token",
+    "user_cache",
+    "verify_bearer_token",
+)
+
+User: t.Type[CustomUser] = get_user_model()
+
+#: Scheme of the ``Authorization`` header carrying a token.
+AUTH_SCHEME = "bearer"
+
+
+def get_bearer_token(request: HttpRequest) -> t.Optional[str]:
+    """
+    The token of a ``Authorization: Bearer <token>`` header, if there is one.
+    """
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    scheme, __, token = header.partition(" ")
+    if scheme.lower() != AUTH_SCHEME:
+        return None
+    return token.strip() or None
+
+
+def verify_bearer_token(raw: str) -> t.Union[t.Dict[str, t.Any], str]:
+    """
+    Check a token presented by a client: its signature, its time claims, allowing
+    ``ALLOWED_SKEW``, and the revocation list. Costs no query, unless the
+    revocation filter needs to catch up or has a hit.
+
+    Unlike :meth:`~django_graphql_jwt_flow.models.JwtRefreshToken.is_valid`, the
+    token is not compared with the stored one. Tokens replaced by a rotation or
+    refresh are on the revocation list instead, so other processes reject them
+    after their next catch-up.
+
+    :param raw: The serialized token.
+    :return: The claims, or a reason from
+        :class:`~django_graphql_jwt_flow.wks.TokenInvalidReasons` if invalid.
+    """
+    start = time.perf_counter()
+    claims = verify_claims(raw)
+    token_seconds.observe(time.perf_counter() - start, operation="verify")
+    if isinstance(claims, str):
+        return claims
+
+    now = datetime.utcnow().timestamp()
+    skew = app_settings.ALLOWED_SKEW
+    if claims.get("nbf", claims["iat"]) >= now + skew:
+        return TokenInvalidReasons.not_yet_valid
+    if claims["exp"] <= now - skew:
+        return TokenInvalidReasons.expired
+    if revocation_list.is_revoked(token_digest(raw)):
+        return TokenInvalidReasons.revoked
+    return claims
+
+
+class UserCache:
+    """
+    Users by primary key, kept for ``USER_CACHE_TTL`` seconds.
+
+    At most :attr:`max_size` users are kept, the least recently used are forgotten
+    first. Every lookup returns a copy, so requests cannot change each other's
+    user. Saving or deleting a user drops it from the cache of the current process;
+    other processes keep it until the TTL runs out, which is why the TTL should be
+    short.
+    """
+
+    max_size = 10000
+
+    def __init__(self):
+        self._users: OrderedDict[str, t.Tuple[float, CustomUser]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid: str) -> t.Optional[CustomUser]:
+        """
+        The active user with primary key ``uid``, from the cache or the database.
+        """
+        ttl = app_settings.USER_CACHE_TTL
+        if ttl:
+            with self._lock:
+                entry = self._users.get(uid)
+                if entry is not None and entry[0] > time.monotonic():
+                    self._users.move_to_end(uid)
+                    self.hits += 1
+                    return copy.copy(entry[1])
+                self.misses += 1
+
+        try:
+            user = User._default_manager.filter(pk=uid).first()
+        except (TypeError, ValueError, ValidationError):
+            user = None
+        if user is None or not getattr(user, "is_active", True):
+            return None
+        if ttl:
+            with self._lock:
+                self._users[uid] = (time.monotonic() + ttl, copy.copy(user))
+                self._users.move_to_end(uid)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+        return user
+
+    def discard(self, uid: str):
+        with self._lock:
+            self._users.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> t.Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._users), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
+
+
+def get_user(request: HttpRequest) -> t.Union[CustomUser, AnonymousUser]:
+    claims = request.jwt_claims
+    user = user_cache.get(claims["uid"]) if claims is not None else None
+    return user or AnonymousUser()
+
+
+class JwtAuthenticationMiddleware(MiddlewareMixin):
+    """
+    Authenticates requests with a ``Authorization: Bearer <token>`` header.
+
+    The token is verified once per request, by :func:`verify_bearer_token`. Its
+    claims are set as ``request.jwt_claims`` and ``request.user`` becomes a lazy
+    object that loads the user on first access only, so resolvers that never touch
+    it cost no query. If the token is invalid, ``request.jwt_claims`` is ``None``,
+    ``request.jwt_error`` holds the reason and the user is anonymous.
+
+    Requests without a bearer token are left alone, so place this after Django's
+    ``AuthenticationMiddleware`` to keep session authentication for the admin.
+    Under ASGI, load the user in resolvers with ``sync_to_async``.
+    """
+
+    def process_request(self, request: HttpRequest):
+        raw = get_bearer_token(request)
+        if raw is None:
+            if not hasattr(request, "user"):
+                request.user = AnonymousUser()
+            request.jwt_claims = request.jwt_error = None
+            return
+
+        claims = verify_bearer_token(raw)
+        if isinstance(claims, str):
+            auth_checks.inc(result=claims)
+            request.jwt_claims, request.jwt_error = None, claims
+        else:
+            auth_checks.inc(result="valid")
+            request.jwt_claims, request.jwt_error = claims, None
+        request.user = SimpleLazyObject(lambda: get_user(request))
+
+
+def discard_cached_user(*, instance: CustomUser, **kwargs):
+    user_cache.discard(str(instance.pk))
+
+
+def clear_user_cache(*, setting: str, **kwargs):
+    if setting == app_settings.dict_name:
+        user_cache.clear()
+
+
+post_save.connect(discard_cached_user, sender=User)
+post_delete.connect(discard_cached_user, sender=User)
+setting_changed.connect(clear_user_cache)
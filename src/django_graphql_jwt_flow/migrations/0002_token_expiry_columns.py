@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_graphql_jwt_flow", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jwtrefreshtoken",
+            name="expires_at",
+            field=models.DateTimeField(
+                db_index=True, editable=False, null=True, verbose_name="expires at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="jwtrefreshtoken",
+            name="issued_at",
+            field=models.DateTimeField(
+                db_index=True, editable=False, null=True, verbose_name="issued at"
+            ),
+        ),
+    ]
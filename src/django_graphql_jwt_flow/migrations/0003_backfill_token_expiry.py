@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, transaction
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode
+from jwcrypto.common import json_decode
+
+CHUNK_SIZE = 1000
+
+
+def claim_to_datetime(timestamp):
+    value = datetime.fromtimestamp(timestamp)
+    if settings.USE_TZ:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def backfill_token_expiry(apps, schema_editor):
+    """
+    Copy iat and exp from the token payload into the new columns.
+
+    Rows are walked in primary key order, one keyset-paginated chunk and one
+    transaction at a time, so the table is never loaded into memory and no long
+    running transaction is held. Signatures are not verified: the column only mirrors
+    what the stored token says. Tokens that can't be decoded are left as NULL.
+    """
+    JwtRefreshToken = apps.get_model("django_graphql_jwt_flow", "JwtRefreshToken")
+    db_alias = schema_editor.connection.alias
+    queryset = (
+        JwtRefreshToken.objects.using(db_alias)
+        .filter(expires_at__isnull=True)
+        .order_by("pk")
+        .values_list("pk", "token")
+    )
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+        objs = []
+        for pk, token in chunk:
+            try:
+                claims = json_decode(urlsafe_base64_decode(token.split(".")[1]))
+                objs.append(
+                    JwtRefreshToken(
+                        pk=pk,
+                        issued_at=claim_to_datetime(claims["iat"]),
+                        expires_at=claim_to_datetime(claims["exp"]),
+                    )
+                )
+            except (IndexError, KeyError, TypeError, ValueError):
+                continue
+        with transaction.atomic(using=db_alias):
+            JwtRefreshToken.objects.using(db_alias).bulk_update(
+                objs, ["issued_at", "expires_at"]
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("django_graphql_jwt_flow", "0002_token_expiry_columns"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_token_expiry, migrations.RunPython.noop),
+    ]
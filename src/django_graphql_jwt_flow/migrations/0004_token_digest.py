@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_graphql_jwt_flow", "0003_backfill_token_expiry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jwtrefreshtoken",
+            name="token_digest",
+            field=models.CharField(
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="token digest",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="jwtrefreshtoken",
+            name="token",
+            field=models.TextField(verbose_name="token"),
+        ),
+    ]
@@ -0,0 +1,46 @@
+import hashlib
+
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+
+def backfill_token_digest(apps, schema_editor):
+    """
+    Store the SHA-256 digest of every token, one keyset-paginated chunk and one
+    transaction at a time.
+    """
+    JwtRefreshToken = apps.get_model("django_graphql_jwt_flow", "JwtRefreshToken")
+    db_alias = schema_editor.connection.alias
+    queryset = (
+        JwtRefreshToken.objects.using(db_alias)
+        .filter(token_digest__isnull=True)
+        .order_by("pk")
+        .values_list("pk", "token")
+    )
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+        objs = [
+            JwtRefreshToken(
+                pk=pk, token_digest=hashlib.sha256(token.encode("ascii")).hexdigest()
+            )
+            for pk, token in chunk
+        ]
+        with transaction.atomic(using=db_alias):
+            JwtRefreshToken.objects.using(db_alias).bulk_update(objs, ["token_digest"])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("django_graphql_jwt_flow", "0004_token_digest"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_token_digest, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_graphql_jwt_flow", "0005_backfill_token_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "token_digest",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="token digest"
+                    ),
+                ),
+                (
+                    "revoked_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="revoked at"
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(
+                        db_index=True, null=True, verbose_name="expires at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Revoked token",
+                "verbose_name_plural": "Revoked tokens",
+            },
+        ),
+    ]
@@ -1,20 +1,34 @@
 from __future__ import annotations
 
+import functools
+import secrets
+import time
 import typing as t
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from json.decoder import JSONDecodeError
 
 from django.contrib.auth import get_user_model
-from django.db import models, IntegrityError
+from django.db import models, router, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from jwcrypto import jwt
+from jwcrypto import jws, jwt
 from jwcrypto.common import json_decode
 from jwcrypto.jws import InvalidJWSSignature, InvalidJWSObject
 
-__all__ = ("JwtRefreshToken", "JwtRefreshTokenManager")
+from .exceptions import RefreshTokenExpired, RefreshTokenReused, RefreshTokenRevoked
+from .metrics import db_seconds, timed, token_checks, token_seconds
+from .storage import get_token_storage
+from .utils import chunked_values, claim_to_datetime, token_digest
+from .wks import TokenInvalidReasons
+
+__all__ = ("BulkResult", "JwtRefreshToken", "JwtRefreshTokenManager", "RevokedToken")
 
 if t.TYPE_CHECKING:  # pragma: no cover
     from django.contrib.auth.base_user import AbstractBaseUser
+    from django.db.models.query import QuerySet
+
+    from .apps import KeyMaterial
 
     CustomUser = t.TypeVar("CustomUser", bound=AbstractBaseUser)
     JSONScalars = t.Union[int, str, float, bytes, bytearray, bool, None]
@@ -22,26 +36,379 @@ if t.TYPE_CHECKING:  # pragma: no cover
 User: t.Type[CustomUser] = get_user_model()
 
 
+class BulkResult(t.NamedTuple):
+    count: int
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.count / self.seconds if self.seconds else 0.0
+
+
+def sign_token(
+    uid: t.Any, expires_at: t.Optional[datetime] = None
+) -> t.Dict[str, t.Any]:
+    """
+    Generate a token for a user id and return the model field values for it.
+
+    A module level function, so it can be pickled into a process pool.
+
+    :param expires_at: Expiry of the token. Defaults to ``REFRESH_DAYS`` from now.
+    """
+    return JwtRefreshTokenManager.token_fields(
+        JwtRefreshTokenManager.generate_token(str(uid), expires_at=expires_at)
+    )
+
+
+def verify_claims(
+    raw: str, key_material: t.Optional[KeyMaterial] = None
+) -> t.Union[t.Dict[str, t.Any], str]:
+    """
+    Verify the signature of a serialized token and decode its claims.
+
+    The verification key is looked up by the ``kid`` header of the token, so
+    tokens signed with a retired key keep verifying during the grace period.
+    Unlike :class:`jwcrypto.jwt.JWT`, this does not check the time claims, so
+    callers can apply ``ALLOWED_SKEW`` themselves.
+
+    Tokens verified with the configured keys are remembered in
+    :data:`~django_graphql_jwt_flow.token_cache.verified_tokens`, so verifying the
+    same token again is a dictionary lookup.
+
+    :param raw: The serialized token.
+    :param key_material: The keys to verify with. Defaults to the configured keys.
+    :return: The claims, or a reason from
+        :class:`~django_graphql_jwt_flow.wks.TokenInvalidReasons` if invalid.
+    """
+    digest = None
+    if key_material is None:
+        from .apps import app_settings
+        from .token_cache import verified_tokens
+
+        digest = token_digest(raw)
+        claims = verified_tokens.get(digest)
+        if claims is not None:
+            return dict(claims)
+        key_material = app_settings.key_material
+
+    token = jws.JWS()
+    try:
+        token.deserialize(raw)
+        kid = token.jose_header.get("kid")
+        if kid is not None and not isinstance(kid, str):
+            return TokenInvalidReasons.malformed
+        key = key_material.get_verification_key(kid)
+        if key is None:
+            return TokenInvalidReasons.unknown_key
+        token.verify(key)
+    except InvalidJWSSignature:
+        return TokenInvalidReasons.invalid_signature
+    except (InvalidJWSObject, ValueError):
+        return TokenInvalidReasons.malformed
+    try:
+        claims = json_decode(token.payload)
+    except (JSONDecodeError, TypeError, ValueError):
+        return TokenInvalidReasons.malformed
+    if not isinstance(claims, dict) or not {"iat", "exp", "uid"} <= claims.keys():
+        return TokenInvalidReasons.malformed
+    if digest is not None:
+        verified_tokens.set(digest, dict(claims), kid)
+    return claims
+
+
 class JwtRefreshTokenManager(models.Manager):
+    """
+    Issues, refreshes and rotates the token of each user.
+
+    The per-user operations go through the ``TOKEN_STORAGE`` backend, see
+    :mod:`django_graphql_jwt_flow.storage`. Querysets and bulk operations always
+    use the database.
+    """
+
+    #: Fields that are written whenever a token is (re)issued.
+    token_field_names = ("token", "token_digest", "issued_at", "expires_at")
+
+    @timed(db_seconds, operation="create")
     def create(self, user: User):
-        if hasattr(user, "jwt_refresh_token"):
-            raise IntegrityError(f"User {user.get_username()} already has a token")
-        return super().create(
-            user=user, token=self.generate_token(str(user.pk)).serialize()
+        return get_token_storage().create(
+            user, self.token_fields(self.generate_token(str(user.pk)))
         )
 
+    @timed(db_seconds, operation="get_or_create")
     def get_or_create(self, user: User) -> t.Tuple[JwtRefreshToken, bool]:
-        queryset = super().get_queryset()
-        try:
-            return queryset.get(user=user), False
-        except self.model.DoesNotExist:
-            return self.create(user), True
+        return get_token_storage().get_or_create(
+            user, lambda: self.token_fields(self.generate_token(str(user.pk)))
+        )
+
+    def get_by_token(self, raw: str) -> JwtRefreshToken:
+        """
+        Look up a token by its serialized form, using the digest index.
 
+        :param raw: The serialized token.
+        :raises JwtRefreshToken.DoesNotExist: If no such token is stored.
+        """
+        return self.get(token_digest=token_digest(raw))
+
+    @timed(db_seconds, operation="refresh_token")
     def refresh_token(self, user: User) -> JwtRefreshToken:
+        """
+        Replace the token of a user with a new one, or create it. The token read
+        before the write is added to the revocation list, so it stops working
+        right away.
+        """
+        storage = get_token_storage()
+        previous = storage.get(user)
         new_token = self.generate_token(uid=str(user.pk))
-        return super().update_or_create(
-            defaults={"token": new_token.serialize()}, user=user
-        )[0]
+        token = storage.update_or_create(user, self.token_fields(new_token))
+        if previous is not None and previous.token_digest != token.token_digest:
+            self.revoke_digests([(previous.token_digest, previous.expires_at)])
+        return token
+
+    @timed(db_seconds, operation="rotate")
+    def rotate(self, user_id: t.Any, current: str) -> str:
+        """
+        Replace the token ``current`` of a user with a new one. With the default
+        storage, this is a single ``UPDATE ... WHERE user_id = %s AND token_digest =
+        %s``.
+
+        No row is locked or read: the digest condition makes the update a
+        compare-and-swap. If no row was updated, ``current`` is not the stored token
+        (anymore), because it was already rotated, by a concurrent request or by
+        someone replaying an old token. Revoked and expired tokens are not rotated
+        either; the update also checks ``expires_at``. Once rotated, ``current`` is
+        added to the revocation list.
+
+        :param user_id: Primary key of the user the token belongs to.
+        :param current: The serialized token presented by the client.
+        :return: The new serialized token.
+        :raises RefreshTokenReused: If ``current`` is not the stored token.
+        :raises RefreshTokenRevoked: If ``current`` was revoked.
+        :raises RefreshTokenExpired: If ``current`` has expired.
+        """
+        from .revocation import revocation_list
+
+        current_digest = token_digest(current)
+        if revocation_list.is_revoked(current_digest):
+            raise RefreshTokenRevoked(user_id)
+        claims = verify_claims(current)
+        expires_at = (
+            None if isinstance(claims, str) else claim_to_datetime(claims["exp"])
+        )
+        if expires_at is not None and expires_at < self.expiry_cutoff():
+            raise RefreshTokenExpired(user_id)
+        fields = self.token_fields(self.generate_token(uid=str(user_id)))
+        if fields["token_digest"] == current_digest or not get_token_storage().rotate(
+            user_id, current_digest, fields
+        ):
+            raise RefreshTokenReused(user_id)
+        self.revoke_digests([(current_digest, expires_at)])
+        return fields["token"]
+
+    @staticmethod
+    def expiry_cutoff(at: t.Optional[datetime] = None) -> datetime:
+        """
+        Tokens with an ``expires_at`` before the returned moment are expired,
+        including the allowed clock skew.
+
+        :param at: Point in time to compare with. Defaults to now.
+        """
+        from .apps import app_settings
+
+        return (at or timezone.now()) - timedelta(seconds=app_settings.ALLOWED_SKEW)
+
+    def expired(self, at: t.Optional[datetime] = None) -> QuerySet:
+        """
+        Tokens that expired, as an index range scan on ``expires_at``.
+
+        :param at: Point in time to compare with. Defaults to now.
+        """
+        return self.filter(expires_at__lt=self.expiry_cutoff(at))
+
+    def active(self, at: t.Optional[datetime] = None) -> QuerySet:
+        """
+        Tokens that have not expired.
+
+        :param at: Point in time to compare with. Defaults to now.
+        """
+        return self.filter(expires_at__gte=self.expiry_cutoff(at))
+
+    @timed(db_seconds, operation="bulk_refresh")
+    def bulk_refresh(
+        self,
+        queryset: QuerySet,
+        chunk_size: t.Optional[int] = None,
+        workers: t.Optional[int] = None,
+        executor: t.Optional[Executor] = None,
+    ) -> BulkResult:
+        """
+        Re-sign the tokens in a queryset.
+
+        Rows are read as ``(pk, user_id)`` tuples in primary key order and written
+        back with one ``bulk_update`` per chunk, each chunk in its own transaction,
+        which also adds the replaced tokens to the revocation list.
+        Signing is done by ``executor`` if given, otherwise by a thread pool of
+        ``workers`` threads, or serially if ``workers`` is less than 2. To sign in
+        separate processes, pass a :class:`~concurrent.futures.ProcessPoolExecutor`
+        created with ``initializer=``:func:`~django_graphql_jwt_flow.utils.setup_worker`.
+
+        :param queryset: The tokens to refresh.
+        :param chunk_size: Rows per read and write. Defaults to ``BULK_CHUNK_SIZE``.
+        :param workers: Signing threads. Defaults to ``BULK_WORKERS``.
+        :param executor: An executor to sign with, which is not shut down.
+        :return: The number of refreshed tokens and the time it took.
+        """
+        from .apps import app_settings
+
+        chunk_size = chunk_size or app_settings.BULK_CHUNK_SIZE
+        workers = workers or app_settings.BULK_WORKERS
+        storage = get_token_storage()
+        own_executor = None
+        if executor is None and workers and workers > 1:
+            executor = own_executor = ThreadPoolExecutor(max_workers=workers)
+        sign = executor.map if executor else map
+
+        start = time.perf_counter()
+        count = 0
+        try:
+            for chunk in chunked_values(
+                queryset, ("user_id", "token_digest", "expires_at"), chunk_size
+            ):
+                tokens = sign(sign_token, [row[1] for row in chunk])
+                objs = [
+                    self.model(pk=row[0], **fields)
+                    for row, fields in zip(chunk, tokens)
+                ]
+                with transaction.atomic(using=router.db_for_write(self.model)):
+                    self.bulk_update(objs, self.token_field_names)
+                    self.revoke_digests(
+                        (digest, expires_at)
+                        for pk, user_id, digest, expires_at in chunk
+                        if digest is not None
+                    )
+                storage.forget(row[1] for row in chunk)
+                count += len(objs)
+        finally:
+            if own_executor:
+                own_executor.shutdown()
+
+        return BulkResult(count, time.perf_counter() - start)
+
+    def validate(
+        self, queryset: t.Optional[QuerySet] = None, chunk_size: t.Optional[int] = None
+    ) -> t.Iterator[t.Tuple[t.Any, bool, t.Optional[str]]]:
+        """
+        Validate stored tokens without loading model instances or users.
+
+        Rows are read as ``(pk, user_id, token, token_digest)`` tuples, one chunk at
+        a time. For every chunk the signatures are verified against the same keyring
+        and the digests checked against the revocation list at once, after which the
+        time window and uid checks are done as plain number and string comparisons
+        against bounds computed once per chunk. Memory use is bounded by the chunk
+        size.
+
+        :param queryset: The tokens to validate. Defaults to all tokens.
+        :param chunk_size: Rows per query. Defaults to ``BULK_CHUNK_SIZE``.
+        :return: Iterator of ``(pk, valid, reason)``, where reason is one of
+            :class:`~django_graphql_jwt_flow.wks.TokenInvalidReasons` or ``None``.
+        """
+        from .apps import app_settings
+        from .revocation import revocation_list
+
+        if queryset is None:
+            queryset = self.all()
+        chunk_size = chunk_size or app_settings.BULK_CHUNK_SIZE
+        key_material = app_settings.key_material
+        skew = app_settings.ALLOWED_SKEW
+
+        fields = ("user_id", "token", "token_digest")
+        for chunk in chunked_values(queryset, fields, chunk_size):
+            decoded = [
+                (
+                    pk,
+                    user_id,
+                    verify_claims(raw, key_material),
+                    digest or token_digest(raw),
+                )
+                for pk, user_id, raw, digest in chunk
+            ]
+            revoked = revocation_list.filter_revoked(row[3] for row in decoded)
+            now = datetime.utcnow().timestamp()
+            lower, upper = now - skew, now + skew
+            for pk, user_id, claims, digest in decoded:
+                if isinstance(claims, str):
+                    yield pk, False, claims
+                elif claims.get("nbf", claims["iat"]) >= upper:
+                    yield pk, False, TokenInvalidReasons.not_yet_valid
+                elif claims["exp"] <= lower:
+                    yield pk, False, TokenInvalidReasons.expired
+                elif str(user_id) != claims["uid"]:
+                    yield pk, False, TokenInvalidReasons.uid_mismatch
+                elif digest in revoked:
+                    yield pk, False, TokenInvalidReasons.revoked
+                else:
+                    yield pk, True, None
+
+    @timed(db_seconds, operation="revoke")
+    def revoke(self, queryset: QuerySet, chunk_size: t.Optional[int] = None) -> int:
+        """
+        Add the current tokens of ``queryset`` to the revocation list.
+
+        Revoking a token does not touch its row, so a refresh issues a new, valid
+        token. Tokens that are already revoked are skipped.
+
+        :param queryset: The tokens to revoke.
+        :param chunk_size: Rows per query and transaction. Defaults to
+            ``BULK_CHUNK_SIZE``.
+        :return: Number of tokens read.
+        """
+        from .apps import app_settings
+
+        chunk_size = chunk_size or app_settings.BULK_CHUNK_SIZE
+        using = router.db_for_write(RevokedToken)
+        count = 0
+        for chunk in chunked_values(
+            queryset.exclude(token_digest=None),
+            ("token_digest", "expires_at"),
+            chunk_size,
+        ):
+            with transaction.atomic(using=using):
+                self.revoke_digests(
+                    (digest, expires_at) for pk, digest, expires_at in chunk
+                )
+            count += len(chunk)
+        return count
+
+    def revoke_digests(
+        self, rows: t.Iterable[t.Tuple[str, t.Optional[datetime]]]
+    ) -> None:
+        """
+        Add tokens to the revocation list by digest, in one ``INSERT``. This process
+        sees them as revoked once the current transaction commits, others after
+        their next catch-up.
+
+        :param rows: ``(token_digest, expires_at)`` of each token.
+        """
+        from .revocation import revocation_list
+        from .token_cache import verified_tokens
+
+        rows = list(rows)
+        if not rows:
+            return
+        digests = [digest for digest, expires_at in rows]
+        using = router.db_for_write(RevokedToken)
+        RevokedToken.objects.using(using).bulk_create(
+            [
+                RevokedToken(token_digest=digest, expires_at=expires_at)
+                for digest, expires_at in rows
+            ],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(
+            functools.partial(revocation_list.add, digests), using=using
+        )
+        transaction.on_commit(
+            functools.partial(verified_tokens.discard, digests), using=using
+        )
 
     def update(self, **kwargs):
         raise TypeError("Method disallowed. Please use refresh_token().")
@@ -49,7 +416,25 @@ class JwtRefreshTokenManager(models.Manager):
     def update_or_create(self, defaults=None, **kwargs):
         raise TypeError("Method disallowed. Please use refresh_token().")
 
+    @staticmethod
+    def token_fields(token: jwt.JWT) -> t.Dict[str, t.Any]:
+        """
+        Model field values for a freshly generated token.
+
+        :param token: A signed token, as returned by :meth:`generate_token`.
+        :return: Values for :attr:`token_field_names`.
+        """
+        claims = json_decode(token.claims)
+        raw = token.serialize()
+        return {
+            "token": raw,
+            "token_digest": token_digest(raw),
+            "issued_at": claim_to_datetime(claims["iat"]),
+            "expires_at": claim_to_datetime(claims["exp"]),
+        }
+
     @classmethod
+    @timed(token_seconds, operation="sign")
     def generate_token(
         cls,
         uid: str,
@@ -66,12 +451,18 @@ class JwtRefreshTokenManager(models.Manager):
             now = now.replace(microsecond=0)
         delta = app_settings.get_expiration_delta()
         expires_at = expires_at or now + delta
+        # A random id, so two tokens for the same user signed within the same
+        # second still differ and a rotated-out token never matches the new one.
         default_claims = {
             "iat": now.timestamp(),
             "exp": expires_at.timestamp(),
+            "jti": secrets.token_urlsafe(16),
         }
         header = header or {}
         header.update(alg=app_settings.SIGNATURE_ALG)
+        kid = app_settings.get_kid()
+        if kid is not None:
+            header.update(kid=kid)
         token = jwt.JWT(header=header, claims=claims, default_claims=default_claims)
         token.make_signed_token(key)
         return token
@@ -84,7 +475,20 @@ class JwtRefreshToken(models.Model):
         related_name="jwt_refresh_token",
         verbose_name=_("user"),
     )
-    token = models.TextField(verbose_name=_("token"), db_index=True)
+    token = models.TextField(verbose_name=_("token"))
+    token_digest = models.CharField(
+        verbose_name=_("token digest"),
+        max_length=64,
+        unique=True,
+        null=True,
+        editable=False,
+    )
+    issued_at = models.DateTimeField(
+        verbose_name=_("issued at"), null=True, editable=False, db_index=True
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_("expires at"), null=True, editable=False, db_index=True
+    )
     objects = JwtRefreshTokenManager()
 
     class Meta:
@@ -94,22 +498,28 @@ class JwtRefreshToken(models.Model):
     def __str__(self):
         return f"token for user with ID {self.user.pk}"
 
+    def save(self, *args, **kwargs):
+        self.token_digest = token_digest(self.token) if self.token else None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "token" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "token_digest"}
+        super().save(*args, **kwargs)
+
     def is_valid(self) -> bool:
         """
-        Asserts that the user id corrsponds to the pk and that the current time
-        is within timerestrictions placed in the claim.
+        Asserts that the user id corrsponds to the pk, that the current time
+        is within timerestrictions placed in the claim and that the token has not
+        been revoked.
 
         :return: Whether the token is valid
         """
         from .apps import app_settings
 
-        try:
-            token = jwt.JWT(key=app_settings.get_key(), jwt=self.token)
-        except (InvalidJWSSignature, InvalidJWSObject):
-            return False
-        try:
-            claims = json_decode(token.claims)
-        except (JSONDecodeError, TypeError):  # pragma: no cover
+        start = time.perf_counter()
+        claims = verify_claims(self.token)
+        token_seconds.observe(time.perf_counter() - start, operation="verify")
+        if isinstance(claims, str):
+            token_checks.inc(result=claims)
             return False
 
         now = datetime.utcnow()
@@ -117,10 +527,59 @@ class JwtRefreshToken(models.Model):
         not_after = datetime.fromtimestamp(claims["exp"])
         not_before -= timedelta(seconds=app_settings.ALLOWED_SKEW)
         not_after += timedelta(seconds=app_settings.ALLOWED_SKEW)
-        time_valid = not_before < now < not_after
+        if now <= not_before:
+            token_checks.inc(result=TokenInvalidReasons.not_yet_valid)
+            return False
+        if now >= not_after:
+            token_checks.inc(result=TokenInvalidReasons.expired)
+            return False
+        if str(self.user_id) != claims["uid"]:
+            token_checks.inc(result=TokenInvalidReasons.uid_mismatch)
+            return False
+
+        from .revocation import revocation_list
+
+        if revocation_list.is_revoked(self.token_digest or token_digest(self.token)):
+            token_checks.inc(result=TokenInvalidReasons.revoked)
+            return False
+        token_checks.inc(result="valid")
+        return True
 
-        return time_valid and str(self.user.pk) == claims["uid"]
+    def revoke(self) -> int:
+        """
+        Revoke the stored token of this user. See
+        :meth:`JwtRefreshTokenManager.revoke`.
+        """
+        return self.__class__.objects.revoke(self.__class__.objects.filter(pk=self.pk))
 
     def refresh(self):
         # noinspection PyTypeChecker
         return self.__class__.objects.refresh_token(self.user)
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked refresh token, by digest.
+
+    Rows are only ever inserted, so the primary key doubles as the high-water mark
+    from which :data:`~django_graphql_jwt_flow.revocation.revocation_list` catches
+    up. Rows can be deleted once ``expires_at`` has passed, which the
+    ``purge_expired_tokens`` command does.
+    """
+
+    token_digest = models.CharField(
+        verbose_name=_("token digest"), max_length=64, unique=True
+    )
+    revoked_at = models.DateTimeField(
+        verbose_name=_("revoked at"), default=timezone.now
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_("expires at"), null=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = _("Revoked token")
+        verbose_name_plural = _("Revoked tokens")
+
+    def __str__(self):
+        return f"revoked token {self.token_digest[:12]}"
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from django.core.signals import setting_changed
+from django.db import DatabaseError
+from django.db.models import Q
+
+from .apps import app_settings
+from .utils import chunked_values
+
+__all__ = ("BloomFilter", "RevocationList", "revocation_list")
+
+
+class BloomFilter:
+    """
+    A Bloom filter of token digests.
+
+    Sized for ``capacity`` entries at a false positive rate of ``error_rate``. The
+    digests are SHA-256 hex strings, so instead of hashing them again the bit
+    positions are derived from two 64 bit slices of the digest by double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, digest: str) -> t.Iterator[int]:
+        first, second = int(digest[:16], 16), int(digest[16:32], 16) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, digest: str):
+        for position in self.positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(digest)
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    def estimated_error_rate(self) -> float:
+        """
+        The false positive rate at the current number of entries.
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class RevocationList:
+    """
+    A per-process view of :class:`~django_graphql_jwt_flow.models.RevokedToken`.
+
+    Revoked digests are kept in a :class:`BloomFilter`, so checking a token that is
+    not revoked costs no query. Only filter hits are looked up in the database, and
+    the outcome is remembered in two small exact sets, so the same false positive or
+    revoked token does not cause a query twice.
+
+    The filter catches up with the table at most once per
+    ``REVOCATION_SYNC_INTERVAL`` seconds, reading only the rows above the highest
+    primary key seen so far. Primary keys are not committed in order, so keys
+    skipped by a catch-up are retried for :attr:`gap_timeout` seconds. Once the
+    filter holds more than its capacity it is rebuilt at twice the size.
+    """
+
+    #: Seconds to keep retrying primary keys that were skipped by a catch-up.
+    gap_timeout = 60.0
+    #: Maximum number of entries in each of the exact sets and of skipped keys.
+    exact_size = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forget everything, so the next check reloads the filter.
+        """
+        with self._lock:
+            self._filter: t.Optional[BloomFilter] = None
+            self._high_water = 0
+            self._gaps: OrderedDict[int, float] = OrderedDict()
+            self._synced_at = 0.0
+            self._revoked: OrderedDict[str, None] = OrderedDict()
+            self._not_revoked: OrderedDict[str, None] = OrderedDict()
+            self.checks = self.filter_hits = self.false_positives = 0
+
+    def is_revoked(self, digest: str) -> bool:
+        return bool(self.filter_revoked([digest]))
+
+    def filter_revoked(self, digests: t.Iterable[str]) -> t.Set[str]:
+        """
+        Find the revoked digests among ``digests``, with at most one query.
+
+        If the filter cannot be loaded, all digests are looked up in the database
+        instead, until a later check loads it. A failed catch-up leaves the current
+        filter in use.
+
+        :return: The revoked digests.
+        """
+        from .models import RevokedToken
+
+        try:
+            self.sync()
+        except DatabaseError:
+            # Retried by the next check. The lookup below raises again if the
+            # database is still unavailable.
+            pass
+        revoked, candidates = set(), []
+        with self._lock:
+            bloom_filter = self._filter
+            for digest in digests:
+                self.checks += 1
+                if digest in self._revoked:
+                    revoked.add(digest)
+                elif digest not in self._not_revoked and (
+                    bloom_filter is None or digest in bloom_filter
+                ):
+                    candidates.append(digest)
+            if bloom_filter is not None:
+                self.filter_hits += len(candidates)
+        if not candidates:
+            return revoked
+
+        found = set(
+            RevokedToken.objects.filter(token_digest__in=candidates).values_list(
+                "token_digest", flat=True
+            )
+        )
+        with self._lock:
+            for digest in candidates:
+                self._remember(
+                    self._revoked if digest in found else self._not_revoked, digest
+                )
+            if bloom_filter is not None:
+                self.false_positives += len(candidates) - len(found)
+        return revoked | found
+
+    def add(self, digests: t.Iterable[str]):
+        """
+        Mark digests as revoked in this process without waiting for a catch-up.
+        """
+        with self._lock:
+            if self._filter is None:
+                return
+            for digest in digests:
+                self._filter.add(digest)
+                self._not_revoked.pop(digest, None)
+                self._remember(self._revoked, digest)
+
+    def sync(self, force: bool = False):
+        """
+        Catch up with the revocation table, if ``REVOCATION_SYNC_INTERVAL`` has
+        passed or ``force`` is set.
+
+        While one thread catches up, others keep using the current filter. Only the
+        first load blocks.
+        """
+        if not force and self._filter is not None:
+            if (
+                time.monotonic() - self._synced_at
+                < app_settings.REVOCATION_SYNC_INTERVAL
+            ):
+                return
+        if not self._sync_lock.acquire(blocking=self._filter is None or force):
+            return
+        try:
+            synced_at = time.monotonic()
+            if self._filter is None or self._filter.count > self._filter.capacity:
+                self.rebuild()
+            else:
+                self._catch_up()
+            self._synced_at = synced_at
+        finally:
+            self._sync_lock.release()
+
+    def rebuild(self):
+        """
+        Load all revoked digests into a new filter.
+        """
+        from .models import RevokedToken
+
+        rows = [
+            row
+            for chunk in chunked_values(
+                RevokedToken.objects.all(),
+                ("token_digest",),
+                app_settings.BULK_CHUNK_SIZE,
+            )
+            for row in chunk
+        ]
+        bloom_filter = BloomFilter(
+            max(app_settings.REVOCATION_CAPACITY, 2 * len(rows)),
+            app_settings.REVOCATION_FALSE_POSITIVE_RATE,
+        )
+        with self._lock:
+            self._filter = bloom_filter
+            self._high_water = 0
+            self._gaps.clear()
+            self._load(rows)
+
+    def _catch_up(self):
+        from .models import RevokedToken
+
+        condition = Q(pk__gt=self._high_water)
+        if self._gaps:
+            condition |= Q(pk__in=list(self._gaps))
+        rows = list(
+            RevokedToken.objects.filter(condition)
+            .order_by("pk")
+            .values_list("pk", "token_digest")
+        )
+        with self._lock:
+            self._load(rows)
+
+    def _load(self, rows: t.Sequence[t.Tuple[int, str]]):
+        now = time.monotonic()
+        for pk, digest in rows:
+            self._gaps.pop(pk, None)
+            if pk > self._high_water + 1:
+                for skipped in range(
+                    max(self._high_water + 1, pk - self.exact_size), pk
+                ):
+                    self._gaps[skipped] = now
+            self._high_water = max(self._high_water, pk)
+            self._filter.add(digest)
+            self._not_revoked.pop(digest, None)
+        while self._gaps and (
+            len(self._gaps) > self.exact_size
+            or now - next(iter(self._gaps.values())) > self.gap_timeout
+        ):
+            self._gaps.popitem(last=False)
+
+    def _remember(self, exact_set: OrderedDict[str, None], digest: str):
+        exact_set[digest] = None
+        exact_set.move_to_end(digest)
+        while len(exact_set) > self.exact_size:
+            exact_set.popitem(last=False)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        """
+        Size and effectiveness of the filter, for monitoring.
+        """
+        with self._lock:
+            bloom_filter = self._filter
+            return {
+                "capacity": bloom_filter.capacity if bloom_filter else 0,
+                "entries": bloom_filter.count if bloom_filter else 0,
+                "bytes": bloom_filter.nbytes if bloom_filter else 0,
+                "hashes": bloom_filter.hashes if bloom_filter else 0,
+                "error_rate": app_settings.REVOCATION_FALSE_POSITIVE_RATE,
+                "estimated_error_rate": (
+                    bloom_filter.estimated_error_rate() if bloom_filter else 0.0
+                ),
+                "high_water": self._high_water,
+                "checks": self.checks,
+                "filter_hits": self.filter_hits,
+                "false_positives": self.false_positives,
+            }
+
+
+revocation_list = RevocationList()
+
+
+def clear_revocation_list(*, setting: str, **kwargs):
+    if setting == app_settings.dict_name:
+        revocation_list.clear()
+
+
+setting_changed.connect(clear_revocation_list)
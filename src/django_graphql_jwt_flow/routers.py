@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+
+from .apps import app_settings
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.db.models import Model
+
+__all__ = ("PinnedUsers", "ReplicaRouter", "pinned_users")
+
+
+class PinnedUsers:
+    """
+    Users whose token reads go to the primary database for
+    ``REPLICA_PIN_SECONDS`` after a write, so they never read a token older than
+    the one they just wrote from a lagging replica.
+
+    Pins are kept per process, at most :attr:`max_size`, or in the Django cache
+    ``REPLICA_PIN_CACHE`` if set, so a write in one process pins the reads of all.
+    """
+
+    max_size = 100000
+    key_prefix = "jwt_flow:pinned"
+
+    def __init__(self):
+        self._pins: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pin(self, user_id: t.Any):
+        seconds = app_settings.REPLICA_PIN_SECONDS
+        cache_alias = app_settings.REPLICA_PIN_CACHE
+        if cache_alias is not None:
+            caches[cache_alias].set(f"{self.key_prefix}:{user_id}", 1, seconds)
+            return
+        with self._lock:
+            self._pins[str(user_id)] = time.monotonic() + seconds
+            self._pins.move_to_end(str(user_id))
+            while len(self._pins) > self.max_size:
+                self._pins.popitem(last=False)
+
+    def is_pinned(self, user_id: t.Any) -> bool:
+        cache_alias = app_settings.REPLICA_PIN_CACHE
+        if cache_alias is not None:
+            return caches[cache_alias].get(f"{self.key_prefix}:{user_id}") is not None
+        with self._lock:
+            until = self._pins.get(str(user_id))
+            if until is None:
+                return False
+            if until > time.monotonic():
+                return True
+            del self._pins[str(user_id)]
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._pins.clear()
+
+
+pinned_users = PinnedUsers()
+
+
+class ReplicaRouter:
+    """
+    Sends reads of the token tables to one of ``READ_REPLICAS``, and writes to the
+    primary database, ``default``.
+
+    Reads of a user's token go to the primary for ``REPLICA_PIN_SECONDS`` after the
+    token of that user was written. The user is taken from the ``user_id`` hint
+    given by :class:`~django_graphql_jwt_flow.storage.ModelStorage`, or from the
+    ``instance`` hint of related lookups and saves. All other models are left to
+    the next router. Without replicas configured, the router does nothing.
+    """
+
+    app_label = "django_graphql_jwt_flow"
+
+    def is_routed(self, model: t.Type[Model]) -> bool:
+        return (
+            bool(app_settings.READ_REPLICAS) and model._meta.app_label == self.app_label
+        )
+
+    @staticmethod
+    def get_user_id(hints: t.Dict[str, t.Any]) -> t.Optional[t.Any]:
+        user_id = hints.get("user_id")
+        instance = hints.get("instance")
+        if user_id is None and instance is not None:
+            if isinstance(instance, get_user_model()):
+                return instance.pk
+            return getattr(instance, "user_id", None)
+        return user_id
+
+    def db_for_read(self, model: t.Type[Model], **hints) -> t.Optional[str]:
+        if not self.is_routed(model):
+            return None
+        user_id = self.get_user_id(hints)
+        if user_id is not None and pinned_users.is_pinned(user_id):
+            return DEFAULT_DB_ALIAS
+        return random.choice(app_settings.READ_REPLICAS)
+
+    def db_for_write(self, model: t.Type[Model], **hints) -> t.Optional[str]:
+        if not self.is_routed(model):
+            return None
+        user_id = self.get_user_id(hints)
+        if user_id is not None:
+            pinned_users.pin(user_id)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Model, obj2: Model, **hints) -> t.Optional[bool]:
+        replicas = app_settings.READ_REPLICAS
+        if not replicas:
+            return None
+        aliases = {DEFAULT_DB_ALIAS, *replicas}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def clear_pinned_users(*, setting: str, **kwargs):
+    if setting == app_settings.dict_name:
+        pinned_users.clear()
+
+
+setting_changed.connect(clear_pinned_users)
@@ -3,16 +3,24 @@ from __future__ import annotations
 import typing as t
 
 import graphene
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, get_user_model
 from graphene_django import DjangoObjectType
 
-from . import apps
-from .exceptions import GraphQLError
+from .constants import ASYNC_EXECUTION_FLAG
+from .exceptions import (
+    GraphQLError,
+    RefreshTokenExpired,
+    RefreshTokenReused,
+    RefreshTokenRevoked,
+)
 from .models import JwtRefreshToken
+from .throttling import check_login_rate, password_check_slot
 from .wks import ErrorStrings
 
 if t.TYPE_CHECKING:
     from django.contrib.auth.models import AbstractBaseUser
+    from django.http import HttpRequest
 
     CustomUserModel = t.TypeVar("CustomUserModel", bound=AbstractBaseUser)
 
@@ -35,15 +43,62 @@ class Login(graphene.Mutation):
         }
 
     success = graphene.Boolean()
+    token = graphene.String()
 
     @classmethod
     def mutate(
         cls, root: graphene.ObjectType, info: graphene.ResolveInfo, **credentials: str
     ):
-        user = authenticate(request=info.context, **credentials)
+        if getattr(info.context, ASYNC_EXECUTION_FLAG, False):
+            return cls.mutate_async(root, info, **credentials)
+
+        cls.check_login_rate(info.context, credentials)
+        with password_check_slot():
+            user = authenticate(request=info.context, **credentials)
+        if not user:
+            raise GraphQLError(ErrorStrings.invalid_credentials, status_code=401)
+
+        return cls(success=True, token=cls.issue_token(user))
+
+    @classmethod
+    async def mutate_async(
+        cls, root: graphene.ObjectType, info: graphene.ResolveInfo, **credentials: str
+    ):
+        """
+        Same as :meth:`mutate`, but the rate check, password hashing and database
+        access run in a thread, so the event loop stays free.
+        """
+        await sync_to_async(cls.check_login_rate)(info.context, credentials)
+        with password_check_slot():
+            user = await sync_to_async(authenticate)(
+                request=info.context, **credentials
+            )
         if not user:
             raise GraphQLError(ErrorStrings.invalid_credentials, status_code=401)
 
-        private_key = apps.settings.get_private_key()
-        payload = {"ID": user.pk}
-        return cls(success=True)
+        return cls(success=True, token=await sync_to_async(cls.issue_token)(user))
+
+    @staticmethod
+    def check_login_rate(request: HttpRequest, credentials: t.Dict[str, str]):
+        """
+        Reject the attempt with a 429 before any password is hashed, if the client
+        IP or the username is over its rate.
+        """
+        username = credentials.get(getattr(User, "USERNAME_FIELD", "username"), "")
+        check_login_rate(request, username)
+
+    @staticmethod
+    def issue_token(user: CustomUserModel) -> str:
+        """
+        Return the user's refresh token, creating or refreshing it if needed.
+        """
+        token, created = JwtRefreshToken.objects.get_or_create(user)
+        if created or token.is_valid():
+            return token.token
+        try:
+            return JwtRefreshToken.objects.rotate(user.pk, token.token)
+        except RefreshTokenReused:
+            # A concurrent login rotated it first, so that token is fresh.
+            return JwtRefreshToken.objects.get_or_create(user)[0].token
+        except (RefreshTokenExpired, RefreshTokenRevoked):
+            return JwtRefreshToken.objects.refresh_token(user).token
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import abc
+import typing as t
+from datetime import datetime
+
+from django.core.cache import caches
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+from .apps import app_settings
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.contrib.auth.base_user import AbstractBaseUser
+    from django.db.models import Model
+
+    from .models import JwtRefreshToken
+
+    CustomUser = t.TypeVar("CustomUser", bound=AbstractBaseUser)
+
+__all__ = (
+    "CacheStorage",
+    "ModelStorage",
+    "TokenStorage",
+    "get_token_storage",
+)
+
+
+class TokenStorage(abc.ABC):
+    """
+    Stores the current token of each user for
+    :class:`~django_graphql_jwt_flow.models.JwtRefreshTokenManager`.
+
+    ``fields`` are the values of
+    :attr:`~django_graphql_jwt_flow.models.JwtRefreshTokenManager.token_field_names`
+    for a freshly signed token.
+    """
+
+    @property
+    def model(self) -> t.Type[JwtRefreshToken]:
+        from .models import JwtRefreshToken
+
+        return JwtRefreshToken
+
+    @abc.abstractmethod
+    def get(self, user: CustomUser) -> t.Optional[JwtRefreshToken]:
+        """
+        The stored token of a user, if there is one.
+        """
+
+    @abc.abstractmethod
+    def create(self, user: CustomUser, fields: t.Dict[str, t.Any]) -> JwtRefreshToken:
+        """
+        Store the first token of a user.
+
+        :raises IntegrityError: If the user already has a token.
+        """
+
+    def get_or_create(
+        self, user: CustomUser, make_fields: t.Callable[[], t.Dict[str, t.Any]]
+    ) -> t.Tuple[JwtRefreshToken, bool]:
+        """
+        The stored token of a user, or a new one made by ``make_fields``. If a
+        concurrent request stores a token first, that token is returned.
+
+        :return: The token and whether it was created.
+        """
+        token = self.get(user)
+        if token is not None:
+            return token, False
+        try:
+            return self.create(user, make_fields()), True
+        except IntegrityError:
+            token = self.get(user)
+            if token is None:
+                raise
+            return token, False
+
+    @abc.abstractmethod
+    def update_or_create(
+        self, user: CustomUser, fields: t.Dict[str, t.Any]
+    ) -> JwtRefreshToken:
+        """
+        Store a token for a user, replacing the current one.
+        """
+
+    @abc.abstractmethod
+    def rotate(self, user_id: t.Any, current_digest: str, fields: t.Dict[str, t.Any]):
+        """
+        Replace the token of a user, if its digest is ``current_digest`` and it has
+        not expired, atomically.
+
+        :return: Whether the token was replaced.
+        """
+
+    def forget(self, user_ids: t.Iterable[t.Any]):
+        """
+        Called after tokens were changed in the database behind the storage's back,
+        for instance by a bulk update.
+        """
+
+
+class ModelStorage(TokenStorage):
+    """
+    Stores tokens in the :class:`~django_graphql_jwt_flow.models.JwtRefreshToken`
+    table. The default.
+
+    Queries carry the user id as a ``user_id`` hint for database routers, see
+    :class:`~django_graphql_jwt_flow.routers.ReplicaRouter`.
+    """
+
+    def get_manager(self, user_id: t.Any):
+        return self.model._base_manager.db_manager(hints={"user_id": user_id})
+
+    def get(self, user: CustomUser) -> t.Optional[JwtRefreshToken]:
+        try:
+            return self.get_manager(user.pk).get(user=user)
+        except self.model.DoesNotExist:
+            return None
+
+    def create(self, user: CustomUser, fields: t.Dict[str, t.Any]) -> JwtRefreshToken:
+        instance = self.insert(user, fields)
+        if instance is None:
+            raise IntegrityError(f"User {user.get_username()} already has a token")
+        return instance
+
+    def insert(
+        self, user: CustomUser, fields: t.Dict[str, t.Any]
+    ) -> t.Optional[JwtRefreshToken]:
+        """
+        Insert a token unless the user has one, with ``bulk_create(...,
+        ignore_conflicts=True)``: a single ``INSERT ... ON CONFLICT DO NOTHING``
+        (``INSERT OR IGNORE`` on SQLite, ``INSERT IGNORE`` on MySQL). Databases that
+        cannot ignore conflicts insert in a savepoint instead.
+
+        Rows whose insert was ignored are not told apart by ``bulk_create()``, so
+        the primary key is then read back by the unique token digest. Like
+        ``bulk_create()``, this sends no signals.
+
+        :return: The new token, or ``None`` if the user already has one.
+        """
+        model = self.model
+        using = router.db_for_write(model, user_id=user.pk)
+        manager = model._base_manager.db_manager(using, hints={"user_id": user.pk})
+        instance = model(user=user, **fields)
+        if connections[using].features.supports_ignore_conflicts:
+            manager.bulk_create([instance], ignore_conflicts=True)
+        else:
+            try:
+                with transaction.atomic(using=using):
+                    manager.bulk_create([instance])
+            except IntegrityError:
+                return None
+        pk = (
+            manager.filter(token_digest=instance.token_digest)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if pk is None:
+            return None
+        instance.pk = pk
+        instance._state.adding = False
+        instance._state.db = using
+        return instance
+
+    def update_or_create(
+        self, user: CustomUser, fields: t.Dict[str, t.Any]
+    ) -> JwtRefreshToken:
+        return self.get_manager(user.pk).update_or_create(defaults=fields, user=user)[0]
+
+    def rotate(self, user_id: t.Any, current_digest: str, fields: t.Dict[str, t.Any]):
+        return bool(
+            self.get_manager(user_id)
+            .filter(
+                user_id=user_id,
+                token_digest=current_digest,
+                expires_at__gte=self.model.objects.expiry_cutoff(),
+            )
+            .update(**fields)
+        )
+
+
+class CacheStorage(ModelStorage):
+    """
+    Stores tokens in the Django cache ``TOKEN_STORAGE_CACHE``, one key per user,
+    until they expire.
+
+    With ``TOKEN_STORAGE_WRITE_THROUGH`` (the default), every write also goes to the
+    database and the cache only serves reads: a lookup is a cache hit after the
+    first one and the table stays complete for the admin and bulk operations.
+
+    Cached tokens then carry a version, which writes, rotations and :meth:`forget`
+    replace. A token read from the database is cached with the version seen before
+    the read, for at most :attr:`max_fill_timeout` seconds, so a fill that races
+    with a rotation is never served.
+
+    Without write-through, tokens only live in the cache and the token table is
+    never touched. Replaced tokens still go to the revocation table.
+    Such tokens have no primary key, so they are invisible to the admin,
+    :meth:`~django_graphql_jwt_flow.models.JwtRefreshTokenManager.bulk_refresh`
+    and revocation, and are lost when the cache is flushed, which logs users out.
+    Rotation then relies on the atomic ``add()`` of the cache backend to let only
+    one request rotate a given token.
+    """
+
+    key_prefix = "jwt_flow:token"
+    #: Longest time a token read from the database is cached, in seconds.
+    max_fill_timeout = 300
+
+    @property
+    def cache(self):
+        return caches[app_settings.TOKEN_STORAGE_CACHE]
+
+    @property
+    def write_through(self) -> bool:
+        return app_settings.TOKEN_STORAGE_WRITE_THROUGH
+
+    def make_key(self, user_id: t.Any) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def make_version_key(self, user_id: t.Any) -> str:
+        return f"{self.key_prefix}:version:{user_id}"
+
+    @staticmethod
+    def new_version() -> str:
+        return get_random_string(12)
+
+    @property
+    def version_timeout(self) -> float:
+        return (
+            app_settings.get_expiration_delta().total_seconds()
+            + app_settings.ALLOWED_SKEW
+        )
+
+    @staticmethod
+    def get_timeout(expires_at: t.Optional[datetime]) -> t.Optional[float]:
+        """
+        Seconds until a token expires, including the allowed clock skew.
+        """
+        if expires_at is None:
+            return None
+        if timezone.is_naive(expires_at):
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+        else:
+            remaining = (expires_at - timezone.now()).total_seconds()
+        return max(remaining + app_settings.ALLOWED_SKEW, 1)
+
+    def store(self, user_id: t.Any, fields: t.Dict[str, t.Any], pk: t.Any = None):
+        """
+        Cache a token that was just written, under a new version.
+        """
+        timeout = self.get_timeout(fields["expires_at"])
+        if not self.write_through:
+            self.cache.set(self.make_key(user_id), {**fields, "pk": pk}, timeout)
+            return
+        version = self.new_version()
+        self.cache.set_many(
+            {
+                self.make_version_key(user_id): version,
+                self.make_key(user_id): {**fields, "pk": pk, "version": version},
+            },
+            timeout,
+        )
+
+    def to_instance(self, user: CustomUser, data: t.Dict[str, t.Any]) -> Model:
+        data = dict(data)
+        data.pop("version", None)
+        pk = data.pop("pk")
+        instance = self.model(pk=pk, user=user, **data)
+        if pk is not None:
+            instance._state.adding = False
+            instance._state.db = self.get_manager(user.pk).db
+        return instance
+
+    def get(self, user: CustomUser) -> t.Optional[JwtRefreshToken]:
+        key = self.make_key(user.pk)
+        if not self.write_through:
+            data = self.cache.get(key)
+            return None if data is None else self.to_instance(user, data)
+
+        version_key = self.make_version_key(user.pk)
+        found = self.cache.get_many([key, version_key])
+        data, version = found.get(key), found.get(version_key)
+        if data is not None and version is not None and data.get("version") == version:
+            return self.to_instance(user, data)
+        if version is None:
+            version = self.new_version()
+            if not self.cache.add(version_key, version, self.version_timeout):
+                version = self.cache.get(version_key)
+        instance = super().get(user)
+        if instance is not None and version is not None:
+            # Written after the version was read, this entry is only served if no
+            # write or rotation replaced the version in the meantime.
+            timeout = self.get_timeout(instance.expires_at)
+            self.cache.set(
+                key,
+                {**self.get_fields(instance), "pk": instance.pk, "version": version},
+                min(timeout or self.max_fill_timeout, self.max_fill_timeout),
+            )
+        return instance
+
+    def create(self, user: CustomUser, fields: t.Dict[str, t.Any]) -> JwtRefreshToken:
+        if self.write_through:
+            instance = super().create(user, fields)
+            self.store(user.pk, fields, instance.pk)
+            return instance
+        if not self.cache.add(
+            self.make_key(user.pk),
+            {**fields, "pk": None},
+            timeout=self.get_timeout(fields["expires_at"]),
+        ):
+            raise IntegrityError(f"User {user.get_username()} already has a token")
+        return self.to_instance(user, {**fields, "pk": None})
+
+    def update_or_create(
+        self, user: CustomUser, fields: t.Dict[str, t.Any]
+    ) -> JwtRefreshToken:
+        if self.write_through:
+            instance = super().update_or_create(user, fields)
+            self.store(user.pk, fields, instance.pk)
+            return instance
+        self.store(user.pk, fields)
+        return self.to_instance(user, {**fields, "pk": None})
+
+    def rotate(self, user_id: t.Any, current_digest: str, fields: t.Dict[str, t.Any]):
+        if self.write_through:
+            rotated = super().rotate(user_id, current_digest, fields)
+            self.forget([user_id])
+            return rotated
+        data = self.cache.get(self.make_key(user_id))
+        if data is None or data["token_digest"] != current_digest:
+            return False
+        if data["expires_at"] < self.model.objects.expiry_cutoff():
+            return False
+        # Of concurrent requests presenting the same token, only the first to add
+        # this key may rotate it.
+        if not self.cache.add(
+            f"{self.key_prefix}:rotated:{current_digest}",
+            user_id,
+            timeout=self.get_timeout(data["expires_at"]),
+        ):
+            return False
+        self.store(user_id, fields)
+        return True
+
+    def forget(self, user_ids: t.Iterable[t.Any]):
+        # Without write-through, the cache is the only copy of the tokens and
+        # changes to the table do not concern it.
+        if not self.write_through:
+            return
+        user_ids = list(user_ids)
+        self.cache.delete_many([self.make_key(user_id) for user_id in user_ids])
+        self.cache.set_many(
+            {
+                self.make_version_key(user_id): self.new_version()
+                for user_id in user_ids
+            },
+            self.version_timeout,
+        )
+
+    def get_fields(self, instance: JwtRefreshToken) -> t.Dict[str, t.Any]:
+        from .models import JwtRefreshTokenManager
+
+        return {
+            name: getattr(instance, name)
+            for name in JwtRefreshTokenManager.token_field_names
+        }
+
+
+_backends: t.Dict[str, TokenStorage] = {}
+
+
+def get_token_storage() -> TokenStorage:
+    """
+    The instance of ``TOKEN_STORAGE``, created once per process.
+    """
+    path = app_settings.TOKEN_STORAGE
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends.setdefault(path, import_string(path)())
+    return backend
+
+
+def forget_token(*, instance: JwtRefreshToken, **kwargs):
+    get_token_storage().forget([instance.user_id])
+
+
+post_save.connect(forget_token, sender="django_graphql_jwt_flow.JwtRefreshToken")
+post_delete.connect(forget_token, sender="django_graphql_jwt_flow.JwtRefreshToken")
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import abc
+import contextlib
+import hashlib
+import threading
+import time
+import typing as t
+from collections import OrderedDict, deque
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .apps import app_settings
+from .exceptions import GraphQLError
+from .wks import ErrorStrings
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.http import HttpRequest
+
+__all__ = (
+    "CacheThrottle",
+    "LocalThrottle",
+    "ThrottleBackend",
+    "check_login_rate",
+    "get_throttle_backend",
+    "password_check_slot",
+)
+
+
+class ThrottleBackend(abc.ABC):
+    """
+    Counts attempts per key in a sliding window.
+    """
+
+    @abc.abstractmethod
+    def allow(self, key: str, limit: int, window: float) -> bool:
+        """
+        Record an attempt for ``key``, unless ``limit`` attempts were recorded in
+        the last ``window`` seconds already.
+
+        :return: Whether the attempt is allowed.
+        """
+
+
+class LocalThrottle(ThrottleBackend):
+    """
+    An exact sliding window log per process.
+
+    Keeps the times of the allowed attempts per key, at most ``limit`` per key. At
+    most :attr:`max_keys` keys are tracked, the least recently used are forgotten
+    first.
+    """
+
+    max_keys = 100000
+
+    def __init__(self):
+        self._attempts: OrderedDict[str, deque] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, limit: int, window: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+                while len(self._attempts) > self.max_keys:
+                    self._attempts.popitem(last=False)
+            else:
+                self._attempts.move_to_end(key)
+            while attempts and attempts[0] <= now - window:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                return False
+            attempts.append(now)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._attempts.clear()
+
+
+class CacheThrottle(ThrottleBackend):
+    """
+    A sliding window counter in Django's cache, shared by all processes using the
+    same cache.
+
+    Attempts are counted in fixed windows. The count of the previous window is
+    weighted by the part of it that still overlaps the sliding window, which costs
+    two cache keys per throttled key instead of a log of attempts.
+    """
+
+    @property
+    def cache(self):
+        return caches[app_settings.LOGIN_THROTTLE_CACHE]
+
+    def allow(self, key: str, limit: int, window: float) -> bool:
+        now = time.time()
+        bucket = int(now // window)
+        current_key, previous_key = f"{key}:{bucket}", f"{key}:{bucket - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        overlap = 1 - (now - bucket * window) / window
+        estimate = counts.get(previous_key, 0) * overlap + counts.get(current_key, 0)
+        if estimate >= limit:
+            return False
+        if not self.cache.add(current_key, 1, timeout=2 * window):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, timeout=2 * window)
+        return True
+
+
+_backends: t.Dict[str, ThrottleBackend] = {}
+
+
+def get_throttle_backend() -> ThrottleBackend:
+    """
+    The instance of ``LOGIN_THROTTLE_BACKEND``, created once per process.
+    """
+    path = app_settings.LOGIN_THROTTLE_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends.setdefault(path, import_string(path)())
+    return backend
+
+
+def check_login_rate(request: HttpRequest, username: str):
+    """
+    Count a login attempt for the client IP and the username.
+
+    :raises GraphQLError: With status code 429, if either is over its rate.
+    """
+    backend = get_throttle_backend()
+    checks = (
+        ("ip", request.META.get("REMOTE_ADDR", ""), app_settings.LOGIN_RATE_PER_IP),
+        ("username", username.strip().lower(), app_settings.LOGIN_RATE_PER_USERNAME),
+    )
+    for scope, value, rate in checks:
+        if not rate:
+            continue
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+        if not backend.allow(f"jwt_flow:login:{scope}:{digest}", *rate):
+            raise GraphQLError(ErrorStrings.too_many_attempts, status_code=429)
+
+
+class _PasswordChecks:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limit: t.Optional[int] = None
+        self._semaphore: t.Optional[threading.BoundedSemaphore] = None
+
+    def get_semaphore(self) -> t.Optional[threading.BoundedSemaphore]:
+        limit = app_settings.LOGIN_CONCURRENCY
+        if limit != self._limit:
+            with self._lock:
+                if limit != self._limit:
+                    self._semaphore = (
+                        threading.BoundedSemaphore(limit) if limit else None
+                    )
+                    self._limit = limit
+        return self._semaphore
+
+
+_password_checks = _PasswordChecks()
+
+
+@contextlib.contextmanager
+def password_check_slot():
+    """
+    Hold one of ``LOGIN_CONCURRENCY`` slots for checking a password.
+
+    Never waits for a slot: if all are taken, the request is shed right away, as
+    queueing behind password hashing only adds latency.
+
+    :raises GraphQLError: With status code 503, if all slots are taken.
+    """
+    semaphore = _password_checks.get_semaphore()
+    if semaphore is None:
+        yield
+        return
+    if not semaphore.acquire(blocking=False):
+        raise GraphQLError(ErrorStrings.server_busy, status_code=503)
+    try:
+        yield
+    finally:
+        semaphore.release()
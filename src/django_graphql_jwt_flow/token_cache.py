@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.signals import setting_changed
+from django.utils import timezone
+
+from .apps import app_settings
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from .apps import KeyMaterial
+
+__all__ = ("VerifiedTokenCache", "verified_tokens")
+
+
+class VerifiedTokenCache:
+    """
+    Claims of tokens whose signature was verified, by token digest.
+
+    Clients present the same token on many requests, so a hit replaces the
+    signature check and claim decoding by a dictionary lookup. Only signatures are
+    cached: time claims and revocation are still checked on every use.
+
+    Entries live for ``VERIFIED_TOKEN_CACHE_TTL`` seconds, but never beyond the
+    ``exp`` claim of the token or the end of the grace period of its key. At most
+    ``VERIFIED_TOKEN_CACHE_SIZE`` entries are kept, the least recently used are
+    evicted first. The cache is emptied when the keys are reloaded, and revoked
+    tokens are discarded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[
+            str, t.Tuple[float, t.Dict[str, t.Any]]
+        ] = OrderedDict()
+        self._key_material: t.Optional[KeyMaterial] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest: str) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        The cached claims of a token, if they have not expired.
+        """
+        key_material = app_settings.key_material
+        with self._lock:
+            if key_material is not self._key_material:
+                self._entries.clear()
+                self._key_material = key_material
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[digest]
+            self.misses += 1
+        return None
+
+    def set(self, digest: str, claims: t.Dict[str, t.Any], kid: t.Optional[str]):
+        """
+        Remember the claims of a token verified with the configured keys.
+
+        :param kid: Id of the key that verified the token.
+        """
+        size = app_settings.VERIFIED_TOKEN_CACHE_SIZE
+        if size <= 0:
+            return
+        key_material = app_settings.key_material
+        now = datetime.utcnow().timestamp()
+        ttl = min(app_settings.VERIFIED_TOKEN_CACHE_TTL, claims["exp"] - now)
+        verify_until = key_material.verify_until.get(kid)
+        if verify_until is not None:
+            ttl = min(ttl, (verify_until - timezone.now()).total_seconds())
+        if ttl <= 0:
+            return
+        with self._lock:
+            if key_material is not self._key_material:
+                self._entries.clear()
+                self._key_material = key_material
+            self._entries[digest] = (time.monotonic() + ttl, claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, digests: t.Iterable[str]):
+        with self._lock:
+            for digest in digests:
+                self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._key_material = None
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def clear_verified_tokens(*, setting: str, **kwargs):
+    if setting == app_settings.dict_name:
+        verified_tokens.clear()
+
+
+setting_changed.connect(clear_verified_tokens)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import hashlib
+import typing as t
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from django.db.models.query import QuerySet
+
+
+def chunked_values(
+    queryset: QuerySet, fields: t.Sequence[str], chunk_size: int
+) -> t.Iterator[t.List[t.Tuple[t.Any, ...]]]:
+    """
+    Walk a queryset in primary key order and yield lists of at most ``chunk_size``
+    value tuples.
+
+    Each chunk is a separate keyset-paginated query (``WHERE pk > last``), so no
+    cursor is held open between chunks and callers are free to write to the same
+    table, each chunk in its own transaction. The primary key is always the first
+    element of every tuple.
+
+    :param queryset: The rows to walk. Any ordering is replaced by primary key order.
+    :param fields: Fields to fetch in addition to the primary key.
+    :param chunk_size: Maximum number of rows per query.
+    :return: Iterator of lists of value tuples.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+
+    queryset = queryset.order_by("pk").values_list("pk", *fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1][0]
+
+
+def claim_to_datetime(timestamp: float) -> datetime:
+    """
+    Convert a time claim (``iat``, ``exp``, ``nbf``) to a value for a DateTimeField.
+
+    Claims are made from UTC datetimes, so they are converted back the same way and
+    marked as UTC if time zone support is active.
+    """
+    value = datetime.fromtimestamp(timestamp)
+    if settings.USE_TZ:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def token_digest(raw: str) -> str:
+    """
+    Fixed-width digest of a serialized token, used to index and look up tokens.
+
+    Serialized tokens are ASCII, but the digest is also taken of untrusted input
+    before it is parsed, so any string is accepted.
+
+    :param raw: The serialized token.
+    :return: Hex encoded SHA-256 of the token.
+    """
+    return hashlib.sha256(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def setup_worker():
+    """
+    Initializer for a :class:`~concurrent.futures.ProcessPoolExecutor` that signs
+    tokens.
+
+    Workers started with the ``spawn`` or ``forkserver`` method, the default on
+    macOS and Windows and from Python 3.14 on Linux too, begin with an empty app
+    registry, and the models module cannot be imported before Django is set up.
+    Settings are loaded from ``DJANGO_SETTINGS_MODULE``, as in the parent process.
+    """
+    import django
+
+    django.setup()
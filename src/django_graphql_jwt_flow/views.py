@@ -1,17 +1,162 @@
-
 from __future__ import annotations
 
+import asyncio
+import functools
+import inspect
+import json
+import time
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
 
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import ensure_csrf_cookie
 from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
 from graphene_django.utils.utils import set_rollback
-from graphene_django.views import GraphQLView as BaseGraphQLView
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql.execution import ExecutionResult
+from graphql.execution.executors.asyncio import AsyncioExecutor
+
+from . import metrics
+from .apps import app_settings
+from .backend import document_backend, persisted_queries
+from .constants import ASYNC_EXECUTION_FLAG
 
 if t.TYPE_CHECKING:
     from django.http.request import HttpRequest
 
+    Response = t.Tuple[t.Optional[str], int]
+
 
 class GraphQLView(BaseGraphQLView):
+    """
+    Parsed and validated documents are cached by
+    :data:`~django_graphql_jwt_flow.backend.document_backend`, unless another
+    ``backend`` is given. Clients may send the SHA-256 hash of a persisted query in
+    ``extensions.persistedQuery.sha256Hash`` instead of the query itself.
+    """
+
+    def __init__(self, *args, backend=None, **kwargs):
+        super().__init__(*args, backend=backend or document_backend, **kwargs)
+
+    @method_decorator(ensure_csrf_cookie)
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            show_graphiql = self.graphiql and self.can_display_graphiql(request, data)
+
+            if show_graphiql:
+                return self.render_graphiql(request, **self.get_graphiql_context())
+
+            if self.batch:
+                result, status_code = self.join_batch_responses(
+                    self.get_batch_responses(request, data)
+                )
+            else:
+                result, status_code = self.get_response(request, data, show_graphiql)
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            return self.get_error_response(request, e)
+
+    def get_graphiql_context(self) -> t.Dict[str, t.Any]:
+        return dict(
+            # Dependency parameters.
+            whatwg_fetch_version=self.whatwg_fetch_version,
+            whatwg_fetch_sri=self.whatwg_fetch_sri,
+            react_version=self.react_version,
+            react_sri=self.react_sri,
+            react_dom_sri=self.react_dom_sri,
+            graphiql_version=self.graphiql_version,
+            graphiql_sri=self.graphiql_sri,
+            graphiql_css_sri=self.graphiql_css_sri,
+            subscriptions_transport_ws_version=self.subscriptions_transport_ws_version,
+            subscriptions_transport_ws_sri=self.subscriptions_transport_ws_sri,
+            # The SUBSCRIPTION_PATH setting.
+            subscription_path=self.subscription_path,
+            # GraphiQL headers tab,
+            graphiql_header_editor_enabled=(
+                graphene_settings.GRAPHIQL_HEADER_EDITOR_ENABLED
+            ),
+        )
+
+    def get_error_response(self, request: HttpRequest, error: HttpError):
+        response = error.response
+        response["Content-Type"] = "application/json"
+        response.content = self.json_encode(
+            request, {"errors": [self.format_error(error)]}
+        )
+        return response
+
+    @staticmethod
+    def join_batch_responses(responses: t.Sequence[Response]) -> Response:
+        result = "[{}]".format(",".join(response[0] for response in responses))
+        status_code = max((response[1] for response in responses), default=200)
+        return result, status_code
+
+    def get_batch_concurrency(self, request: HttpRequest, data: t.List[dict]) -> int:
+        """
+        How many batch entries may be executed at the same time.
+
+        Entries are independent of each other only if none of them is a mutation,
+        since mutations are documented to run in order. Otherwise, and if
+        ``BATCH_CONCURRENCY`` is below 2, entries run one after another.
+        """
+        concurrency = min(app_settings.BATCH_CONCURRENCY, len(data))
+        if concurrency < 2:
+            return 1
+
+        backend = self.get_backend(request)
+        for entry in data:
+            query, variables, operation_name, ID = self.get_graphql_params(
+                request, entry
+            )
+            try:
+                document = backend.document_from_string(self.schema, query)
+            except Exception:
+                # Reported when the entry itself is executed.
+                continue
+            if document.get_operation_type(operation_name) != "query":
+                return 1
+
+        return concurrency
+
+    def get_batch_responses(
+        self, request: HttpRequest, data: t.List[dict]
+    ) -> t.List[Response]:
+        """
+        Execute batch entries, concurrently in a thread pool if allowed by
+        :meth:`get_batch_concurrency`. Responses are in the order of the entries.
+        """
+        concurrency = self.get_batch_concurrency(request, data)
+        if concurrency < 2:
+            return [self.get_response(request, entry) for entry in data]
+
+        def get_response(entry: dict) -> Response:
+            try:
+                return self.get_response(request, entry)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(get_response, data))
+
     def get_response(
         self,
         request: HttpRequest,
@@ -40,12 +185,60 @@ class GraphQLView(BaseGraphQLView):
         :param show_graphiql: bool indicating if we show the graphiql interface.
         :return:
         """
+        start = time.perf_counter()
         query, variables, operation_name, ID = self.get_graphql_params(request, data)
 
         execution_result = self.execute_graphql_request(
             request, data, query, variables, operation_name, show_graphiql
         )
 
+        response = self.get_response_from_result(
+            request, execution_result, ID, show_graphiql
+        )
+        self.observe_response(start, response)
+        return response
+
+    @staticmethod
+    def observe_response(start: float, response: Response):
+        metrics.graphql_seconds.observe(
+            time.perf_counter() - start, status=str(response[1])
+        )
+
+    def get_graphql_params(self, request: HttpRequest, data: t.Dict[str, t.Any]):
+        query, variables, operation_name, ID = super().get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+
+        persisted = (extensions or {}).get("persistedQuery")
+        if isinstance(persisted, dict) and persisted.get("sha256Hash"):
+            sha256_hash = persisted["sha256Hash"]
+            if query:
+                if not persisted_queries.register(sha256_hash, query):
+                    raise HttpError(
+                        HttpResponseBadRequest("provided sha does not match query")
+                    )
+            else:
+                query = persisted_queries.get(sha256_hash)
+                if query is None:
+                    raise HttpError(HttpResponseBadRequest("PersistedQueryNotFound"))
+
+        return query, variables, operation_name, ID
+
+    def get_response_from_result(
+        self,
+        request: HttpRequest,
+        execution_result: t.Optional[ExecutionResult],
+        ID: t.Optional[str],
+        show_graphiql: bool = False,
+    ) -> t.Tuple[t.Optional[str], int]:
+        """
+        Encode an execution result and pick the status code, as described in
+        :meth:`get_response`.
+        """
         if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
             set_rollback()
 
@@ -83,4 +276,197 @@ class GraphQLView(BaseGraphQLView):
         else:
             result = None
 
-        return result, status_code
\ No newline at end of file
+        return result, status_code
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    A GraphQLView that runs on the event loop under ASGI.
+
+    Documents are parsed and results encoded on the event loop and resolvers run
+    through an asyncio executor, so resolvers that are coroutine functions are
+    awaited instead of occupying a thread. Synchronous resolvers are still called
+    directly, which means they must not touch the database: Django raises
+    ``SynchronousOnlyOperation`` if they do. They can check for
+    :data:`~django_graphql_jwt_flow.constants.ASYNC_EXECUTION_FLAG` on the context
+    and return a coroutine instead, as the ``Login`` mutation does.
+
+    Django's ``csrf_exempt`` decorator doesn't support coroutine views before Django
+    4.1, so use ``AsyncGraphQLView.as_view(csrf_exempt=True)`` instead.
+    ``ATOMIC_MUTATIONS`` is not supported, since transactions can't span awaits.
+    """
+
+    csrf_exempt = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        csrf_exempt = initkwargs.pop("csrf_exempt", cls.csrf_exempt)
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        async_view.csrf_exempt = csrf_exempt
+        return async_view
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs):
+        # Same as the ensure_csrf_cookie decorator on the synchronous view.
+        get_token(request)
+        setattr(request, ASYNC_EXECUTION_FLAG, True)
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            show_graphiql = self.graphiql and self.can_display_graphiql(request, data)
+
+            if show_graphiql:
+                return self.render_graphiql(request, **self.get_graphiql_context())
+
+            if self.batch:
+                result, status_code = self.join_batch_responses(
+                    await self.get_batch_responses(request, data)
+                )
+            else:
+                result, status_code = await self.get_response(
+                    request, data, show_graphiql
+                )
+
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            return self.get_error_response(request, e)
+
+    async def get_batch_responses(
+        self, request: HttpRequest, data: t.List[dict]
+    ) -> t.List[Response]:
+        """
+        Execute batch entries, as concurrent tasks if allowed by
+        :meth:`get_batch_concurrency`. Responses are in the order of the entries.
+        """
+        concurrency = self.get_batch_concurrency(request, data)
+        if concurrency < 2:
+            return [await self.get_response(request, entry) for entry in data]
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_response(entry: dict) -> Response:
+            async with semaphore:
+                return await self.get_response(request, entry)
+
+        return list(await asyncio.gather(*(get_response(entry) for entry in data)))
+
+    async def get_response(
+        self,
+        request: HttpRequest,
+        data: t.Dict[str, t.Any],
+        show_graphiql: bool = False,
+    ):
+        """
+        Asynchronous version of :meth:`GraphQLView.get_response`, with the same
+        status code handling.
+        """
+        start = time.perf_counter()
+        query, variables, operation_name, ID = self.get_graphql_params(request, data)
+
+        execution_result = await self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        response = self.get_response_from_result(
+            request, execution_result, ID, show_graphiql
+        )
+        self.observe_response(start, response)
+        return response
+
+    async def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ) -> t.Optional[ExecutionResult]:
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        try:
+            backend = self.get_backend(request)
+            document = backend.document_from_string(self.schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+        if request.method.lower() == "get":
+            operation_type = document.get_operation_type(operation_name)
+            if operation_type and operation_type != "query":
+                if show_graphiql:
+                    return None
+
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["POST"],
+                        "Can only perform a {} operation from a POST request.".format(
+                            operation_type
+                        ),
+                    )
+                )
+
+        try:
+            result = document.execute(
+                root_value=self.get_root_value(request),
+                variable_values=variables,
+                operation_name=operation_name,
+                context_value=self.get_context(request),
+                middleware=self.get_middleware(request),
+                executor=self.executor
+                or AsyncioExecutor(loop=asyncio.get_running_loop()),
+                return_promise=True,
+            )
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+
+class JWKSView(View):
+    """
+    Publishes the public keys that verify tokens as a JWK Set (RFC 7517), so
+    resource servers can verify tokens without calling back into Django.
+
+    The document only changes when keys are rotated or retired, so it is served with
+    a strong ``ETag`` and ``Cache-Control: public, max-age=JWKS_MAX_AGE`` and
+    conditional requests are answered with ``304 Not Modified``.
+    """
+
+    content_type = "application/jwk-set+json"
+    http_method_names = ["get", "head", "options"]
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        body, etag = app_settings.key_material.get_jwks()
+        response = HttpResponse(body, content_type=self.content_type)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=app_settings.JWKS_MAX_AGE)
+        return get_conditional_response(request, etag=etag, response=response)
+
+
+class MetricsView(View):
+    """
+    Serves the metrics in the Prometheus text format, if ``METRICS`` is enabled.
+    Responds with 404 otherwise.
+
+    The metrics reveal request rates, so mount the view where only the scraper can
+    reach it.
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+    http_method_names = ["get", "head"]
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if not app_settings.METRICS:
+            raise Http404("Metrics are disabled")
+        return HttpResponse(metrics.registry.render(), content_type=self.content_type)
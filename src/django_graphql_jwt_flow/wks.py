@@ -7,4 +7,21 @@ class ErrorStrings:
     (lowercase and digits allowed and everything else converted to dashes).
     """
 
-    invalid_credentials = "invalid-credentials"
\ No newline at end of file
+    invalid_credentials = "invalid-credentials"
+    too_many_attempts = "too-many-attempts"
+    server_busy = "server-busy"
+
+
+class TokenInvalidReasons:
+    """
+    Well-known strings explaining why a stored refresh token failed validation.
+    Same conventions as :class:`ErrorStrings`.
+    """
+
+    malformed = "malformed-token"
+    invalid_signature = "invalid-signature"
+    unknown_key = "unknown-key"
+    not_yet_valid = "token-not-yet-valid"
+    expired = "token-expired"
+    uid_mismatch = "uid-mismatch"
+    revoked = "token-revoked"
@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from demo.app.factories import UserFactory
+from demo.app.models import User
+from django_graphql_jwt_flow.models import JwtRefreshToken
+
+
+class JwtRefreshTokenAdminTest(TestCase):
+    changelist_url = reverse("admin:django_graphql_jwt_flow_jwtrefreshtoken_changelist")
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser("admin@example.com")
+        self.client.force_login(self.admin_user)
+
+    @staticmethod
+    def create_tokens(count):
+        return [JwtRefreshToken.objects.create(UserFactory()) for i in range(count)]
+
+    def expire(self, token):
+        JwtRefreshToken.objects.filter(pk=token.pk).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+
+    def get_changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.changelist_url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_changelist_constant_queries(self):
+        self.create_tokens(2)
+        __, few = self.get_changelist_queries()
+        self.create_tokens(8)
+        response, many = self.get_changelist_queries()
+        self.assertEqual(few, many)
+        self.assertContains(response, "Expires at")
+
+    def test_expiry_filter(self):
+        active, expired = self.create_tokens(2)
+        self.expire(expired)
+        response, __ = self.get_changelist_queries(expiry="expired")
+        self.assertEqual(
+            [obj.pk for obj in response.context["cl"].result_list], [expired.pk]
+        )
+        self.assertTrue(response.context["cl"].result_list[0]._is_expired)
+        response, __ = self.get_changelist_queries(expiry="active")
+        self.assertEqual(
+            [obj.pk for obj in response.context["cl"].result_list], [active.pk]
+        )
+
+    def test_sort_by_expiry(self):
+        first, second = self.create_tokens(2)
+        self.expire(second)
+        response, __ = self.get_changelist_queries(o="3")
+        self.assertEqual(
+            [obj.pk for obj in response.context["cl"].result_list],
+            [second.pk, first.pk],
+        )
+
+    def export(self, response):
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv_action(self):
+        first, second, third = self.create_tokens(3)
+        self.expire(second)
+        response = self.client.post(
+            self.changelist_url,
+            {
+                "action": "export_csv_action",
+                "_selected_action": [first.pk, second.pk],
+            },
+        )
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(self.export(response))))
+        self.assertEqual(
+            [(row["email"], row["expired"]) for row in rows],
+            [(second.user.email, "1"), (first.user.email, "0")],
+        )
+        self.assertEqual(json.loads(rows[1]["payload"])["uid"], str(first.user.pk))
+
+    def test_export_ndjson_action(self):
+        token = self.create_tokens(1)[0]
+        response = self.client.post(
+            self.changelist_url,
+            {"action": "export_ndjson_action", "_selected_action": [token.pk]},
+        )
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+        lines = self.export(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row["user_id"], token.user.pk)
+        self.assertFalse(row["expired"])
+        self.assertEqual(row["expires_at"], token.expires_at.isoformat())
+
+    def test_revoke_action_permission(self):
+        from django.contrib.auth.models import Permission
+
+        from django_graphql_jwt_flow.models import RevokedToken
+
+        token = self.create_tokens(1)[0]
+        viewer = UserFactory(is_staff=True)
+        viewer.user_permissions.add(
+            Permission.objects.get(codename="view_jwtrefreshtoken")
+        )
+        self.client.force_login(viewer)
+        response = self.client.get(self.changelist_url)
+        actions = [
+            name
+            for name, label in response.context["action_form"].fields["action"].choices
+        ]
+        self.assertIn("export_csv_action", actions)
+        self.assertNotIn("revoke_token_action", actions)
+        self.client.post(
+            self.changelist_url,
+            {"action": "revoke_token_action", "_selected_action": [token.pk]},
+        )
+        self.assertFalse(RevokedToken.objects.exists())
+
+        self.client.force_login(self.admin_user)
+        self.client.post(
+            self.changelist_url,
+            {"action": "revoke_token_action", "_selected_action": [token.pk]},
+        )
+        self.assertTrue(
+            RevokedToken.objects.filter(token_digest=token.token_digest).exists()
+        )
+
+    def test_export_view_filters(self):
+        active, expired = self.create_tokens(2)
+        self.expire(expired)
+        url = reverse(
+            "admin:django_graphql_jwt_flow_jwtrefreshtoken_export", args=["csv"]
+        )
+        response = self.client.get(url, {"expiry": "active"})
+        rows = list(csv.DictReader(io.StringIO(self.export(response))))
+        self.assertEqual([row["email"] for row in rows], [active.user.email])
+
+        response = self.client.get(url, {"q": expired.user.email})
+        rows = list(csv.DictReader(io.StringIO(self.export(response))))
+        self.assertEqual([row["email"] for row in rows], [expired.user.email])
+
+        # Bad filters lead to the error page of the changelist, as there.
+        response = self.client.get(url, {"bogus": "1"})
+        self.assertRedirects(response, f"{self.changelist_url}?e=1")
+
+        response = self.client.get(
+            reverse(
+                "admin:django_graphql_jwt_flow_jwtrefreshtoken_export", args=["xml"]
+            )
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_streams(self):
+        self.create_tokens(3)
+        url = reverse(
+            "admin:django_graphql_jwt_flow_jwtrefreshtoken_export", args=["csv"]
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        # Nothing is counted or fetched before the response starts.
+        table = JwtRefreshToken._meta.db_table
+        self.assertFalse([q for q in ctx.captured_queries if table in q["sql"]])
+        content = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            self.assertTrue(next(content).startswith(b"user_id,email,"))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(b"".join(content).splitlines()), 3)
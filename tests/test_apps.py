@@ -0,0 +1,110 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from django_graphql_jwt_flow.apps import AppSettings, app_settings
+
+
+class AppSettingsTest(SimpleTestCase):
+    oct_key = {"kty": "oct", "k": "x-A5aHFjJohn3-wuBsv12Q"}
+    okp_key = {
+        "kty": "OKP",
+        "crv": "Ed25519",
+        "x": "Lc5eoWH8FRE2L8CHlBDHTyd_o26DOi4PpPwbnM4QGBI",
+        "d": "2vs4Y76RdPDatIdOsTALoMa7_99xbbnmUTpz974O2oo",
+    }
+
+    def test_key_is_parsed_once(self):
+        self.assertIs(app_settings.get_key(), app_settings.get_key())
+        self.assertIs(app_settings.snapshot, app_settings.snapshot)
+
+    def test_snapshot_is_read_only(self):
+        with self.assertRaisesMessage(AttributeError, "is read-only"):
+            app_settings.snapshot.REFRESH_DAYS = 1
+        with self.assertRaisesMessage(AttributeError, "is read-only"):
+            app_settings.key_material.key = None
+
+    def test_override_settings_reloads(self):
+        before = app_settings.get_key()
+        with override_settings(JWT_FLOW={"KEY": self.oct_key, "REFRESH_DAYS": 3}):
+            self.assertEqual(app_settings.REFRESH_DAYS, 3)
+            self.assertEqual(app_settings.get_key().key_type, "oct")
+        self.assertIsNot(app_settings.get_key(), before)
+        self.assertEqual(app_settings.get_key().export(), before.export())
+
+    @override_settings(JWT_FLOW={"KEY": okp_key})
+    def test_public_key(self):
+        public = app_settings.get_public_key()
+        self.assertFalse(public.has_private)
+        self.assertEqual(public.export_public(), app_settings.get_key().export_public())
+
+    @override_settings(JWT_FLOW={"KEY": oct_key})
+    def test_public_key_symmetric(self):
+        self.assertIs(app_settings.get_public_key(), app_settings.get_key())
+
+    def test_defaults(self):
+        settings = AppSettings("JWT_FLOW_MISSING")
+        self.assertEqual(settings.SIGNATURE_ALG, "HS384")
+        self.assertEqual(settings.get_expiration_delta().days, 7)
+        with self.assertRaisesMessage(
+            ImproperlyConfigured, "Either a KEY or KEY_FILE is needed"
+        ):
+            settings.get_key()
+
+    def test_kid(self):
+        with override_settings(JWT_FLOW={"KEY": self.oct_key}):
+            self.assertIsNone(app_settings.get_kid())
+        with override_settings(JWT_FLOW={"KEY": self.oct_key, "KID": "k1"}):
+            self.assertEqual(app_settings.get_kid(), "k1")
+            self.assertIs(
+                app_settings.get_verification_key("k1"), app_settings.get_key()
+            )
+            self.assertIs(
+                app_settings.get_verification_key(None), app_settings.get_key()
+            )
+            self.assertIsNone(app_settings.get_verification_key("k2"))
+
+    @override_settings(
+        JWT_FLOW={
+            "KEYRING": [
+                {"KID": "new", "KEY": okp_key},
+                {"KID": "old", "KEY": oct_key, "RETIRED_AT": "2020-01-01T00:00:00"},
+                {"KID": "recent", "KEY": oct_key, "RETIRED_AT": "2999-01-01T00:00:00Z"},
+            ],
+            "ACTIVE_KID": "new",
+        }
+    )
+    def test_keyring(self):
+        key_material = app_settings.key_material
+        self.assertEqual(app_settings.get_kid(), "new")
+        self.assertEqual(app_settings.get_key().key_type, "OKP")
+        self.assertFalse(key_material.public_keys["new"].has_private)
+        self.assertIs(key_material.public_keys["old"], key_material.keys["old"])
+        self.assertIsNone(app_settings.get_verification_key("old"))
+        self.assertIs(
+            app_settings.get_verification_key("recent"), key_material.keys["recent"]
+        )
+        self.assertIsNone(app_settings.get_verification_key("missing"))
+        self.assertEqual(app_settings.KEY_GRACE_DAYS, app_settings.REFRESH_DAYS)
+
+    def test_keyring_invalid(self):
+        for keyring, message in (
+            ([{"KEY": self.oct_key}], "Every KEYRING entry needs a KID"),
+            (
+                [{"KID": "a", "KEY": self.oct_key}, {"KID": "a", "KEY": self.oct_key}],
+                "a: Duplicate KID in KEYRING",
+            ),
+            (
+                [{"KID": "a", "KEY": self.oct_key, "RETIRED_AT": "yesterday"}],
+                "a: Invalid RETIRED_AT",
+            ),
+        ):
+            with override_settings(JWT_FLOW={"KEYRING": keyring}):
+                with self.assertRaisesMessage(ImproperlyConfigured, message):
+                    app_settings.get_key()
+        with override_settings(
+            JWT_FLOW={"KEYRING": [{"KID": "a", "KEY": self.oct_key}], "ACTIVE_KID": "b"}
+        ):
+            with self.assertRaisesMessage(
+                ImproperlyConfigured, "b: ACTIVE_KID not in KEYRING"
+            ):
+                app_settings.get_key()
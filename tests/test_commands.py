@@ -0,0 +1,215 @@
+import functools
+import json
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.models import JwtRefreshToken, RevokedToken, sign_token
+
+
+class PurgeExpiredTokensTest(TestCase):
+    def setUp(self):
+        self.tokens = [
+            JwtRefreshToken.objects.create(UserFactory()) for i in range(0, 5)
+        ]
+        self.expired = [token.pk for token in self.tokens[:3]]
+        JwtRefreshToken.objects.filter(pk__in=self.expired).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+
+    def call(self, *args):
+        out = StringIO()
+        call_command("purge_expired_tokens", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        self.assertIn("3 expired token(s) would be deleted", self.call("--dry-run"))
+        self.assertEqual(JwtRefreshToken.objects.count(), 5)
+
+    def test_purge_in_batches(self):
+        output = self.call("--batch-size", "2")
+        self.assertIn(f"Deleted 2 token(s), last pk {self.expired[1]}.", output)
+        self.assertIn("Deleted 3 expired token(s)", output)
+        self.assertFalse(JwtRefreshToken.objects.filter(pk__in=self.expired).exists())
+        self.assertEqual(JwtRefreshToken.objects.count(), 2)
+
+    def test_recheck_expiry(self):
+        refreshed = self.tokens[0]
+        delete = QuerySet.delete
+
+        def refresh_then_delete(queryset):
+            # A login refreshes the token after the batch was read.
+            JwtRefreshToken.objects.filter(pk=refreshed.pk).update(
+                expires_at=timezone.now() + timedelta(days=1)
+            )
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, "delete", refresh_then_delete):
+            output = self.call("--batch-size", "1")
+        self.assertIn("Deleted 2 expired token(s)", output)
+        self.assertTrue(JwtRefreshToken.objects.filter(pk=refreshed.pk).exists())
+
+    def test_purge_revoked(self):
+        # Revoked tokens keep the expiry of the token.
+        JwtRefreshToken.objects.revoke(JwtRefreshToken.objects.all())
+        self.assertIn(
+            "3 expired revoked token(s) would be deleted", self.call("--dry-run")
+        )
+        self.assertIn("Deleted 3 expired revoked token(s)", self.call())
+        self.assertEqual(
+            set(RevokedToken.objects.values_list("token_digest", flat=True)),
+            {token.token_digest for token in self.tokens[3:]},
+        )
+
+    def test_quiet(self):
+        self.assertNotIn("last pk", self.call("--batch-size", "2", "-v", "0"))
+
+    def test_resume_and_limit(self):
+        self.call("--after", str(self.expired[0]), "--limit", "1")
+        self.assertEqual(
+            list(
+                JwtRefreshToken.objects.filter(pk__in=self.expired).values_list(
+                    "pk", flat=True
+                )
+            ),
+            [self.expired[0], self.expired[2]],
+        )
+
+
+class WriteJwksTest(SimpleTestCase):
+    okp_key = {
+        "kty": "OKP",
+        "crv": "Ed25519",
+        "x": "Lc5eoWH8FRE2L8CHlBDHTyd_o26DOi4PpPwbnM4QGBI",
+        "d": "2vs4Y76RdPDatIdOsTALoMa7_99xbbnmUTpz974O2oo",
+    }
+
+    @override_settings(JWT_FLOW={"KEY": okp_key, "KID": "main"})
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "jwks.json"
+            out = StringIO()
+            call_command("write_jwks", str(output), stdout=out)
+            self.assertIn("JWK Set written", out.getvalue())
+            jwks = json.loads(output.read_text())
+            self.assertEqual([key["kid"] for key in jwks["keys"]], ["main"])
+            self.assertEqual([p.name for p in Path(tmp_dir).iterdir()], ["jwks.json"])
+
+    @override_settings(JWT_FLOW={"KEY": {"kty": "oct", "k": "x-A5aHFjJohn3-wuBsv12Q"}})
+    def test_symmetric_key_not_published(self):
+        out = StringIO()
+        call_command("write_jwks", "-", stdout=out)
+        self.assertEqual(json.loads(out.getvalue()), {"keys": []})
+
+
+class JwtBenchTest(SimpleTestCase):
+    def test_recommendation(self):
+        out = StringIO()
+        call_command(
+            "jwt_bench",
+            *("--alg", "HS256", "--alg", "EdDSA", "-n", "5", "-p", "1"),
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len([line for line in lines if "HS256  oct 256" in line]), 1)
+        self.assertEqual(len([line for line in lines if "EdDSA  Ed" in line]), 2)
+        self.assertIn('"SIGNATURE_ALG": ', out.getvalue())
+
+    def test_asymmetric(self):
+        out = StringIO()
+        call_command(
+            "jwt_bench",
+            *("--alg", "HS256", "--alg", "EdDSA", "-n", "5", "-p", "1"),
+            "--asymmetric",
+            stdout=out,
+        )
+        self.assertIn('"SIGNATURE_ALG": "EdDSA"', out.getvalue())
+        self.assertNotIn("JWKSView", out.getvalue())
+
+
+@override_settings(
+    JWT_FLOW={"KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"}},
+)
+class ProvisionTokensTest(TestCase):
+    def setUp(self):
+        self.users = [UserFactory() for i in range(5)]
+        self.existing = JwtRefreshToken.objects.create(self.users[0])
+
+    def call(self, *args):
+        out = StringIO()
+        call_command("provision_tokens", *args, stdout=out)
+        return out.getvalue()
+
+    def test_provision(self):
+        output = self.call("--batch-size", "3", "-p", "1")
+        self.assertIn("3/4 users", output)
+        self.assertIn("4/4 users", output)
+        self.assertIn("Provisioned tokens for 4 user(s)", output)
+        tokens = JwtRefreshToken.objects.order_by("user_id")
+        self.assertEqual(
+            [token.user_id for token in tokens], [user.pk for user in self.users]
+        )
+        self.assertEqual(tokens[0].token, self.existing.token)
+        self.assertTrue(all(token.is_valid() for token in tokens))
+        self.assertIn("All users have a token.", self.call())
+
+    def test_concurrent_token(self):
+        def sign(uid, **kwargs):
+            # A login of this user while the command runs.
+            if uid == self.users[2].pk:
+                expires_at = timezone.now() + timedelta(days=1)
+                JwtRefreshToken.objects.bulk_create(
+                    [JwtRefreshToken(user_id=uid, **sign_token(uid, expires_at))]
+                )
+            return sign_token(uid, **kwargs)
+
+        with mock.patch(
+            "django_graphql_jwt_flow.management.commands.provision_tokens.sign_token",
+            sign,
+        ):
+            output = self.call("-p", "1")
+        self.assertIn("4/4 users, 3 tokens created", output)
+        self.assertIn("1 user(s) got a token meanwhile and kept it.", output)
+        self.assertIn("Provisioned tokens for 3 user(s)", output)
+        self.assertEqual(JwtRefreshToken.objects.count(), 5)
+
+    def test_parallel(self):
+        self.call("-p", "2")
+        self.assertEqual(JwtRefreshToken.objects.count(), 5)
+        self.assertTrue(
+            all(token.is_valid() for token in JwtRefreshToken.objects.all())
+        )
+
+    def test_parallel_spawn(self):
+        # Workers that do not inherit the parent's app registry.
+        spawn = functools.partial(
+            ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")
+        )
+        with mock.patch(
+            "django_graphql_jwt_flow.management.commands.provision_tokens"
+            ".ProcessPoolExecutor",
+            spawn,
+        ):
+            self.call("-p", "2")
+        self.assertEqual(JwtRefreshToken.objects.count(), 5)
+
+    def test_expires_at(self):
+        expires_at = (timezone.now() + timedelta(days=30)).replace(microsecond=0)
+        self.call("-p", "1", "--expires-at", expires_at.strftime("%Y-%m-%d %H:%M:%S"))
+        token = JwtRefreshToken.objects.get(user=self.users[1])
+        self.assertEqual(token.expires_at, expires_at)
+
+        with self.assertRaisesMessage(CommandError, "Token expires before issue date"):
+            self.call("--expires-at", "2000-01-01 00:00")
+        with self.assertRaisesMessage(CommandError, "Enter a valid date/time."):
+            self.call("--expires-at", "soon")
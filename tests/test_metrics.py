@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.metrics import Counter, Histogram, registry
+from django_graphql_jwt_flow.models import JwtRefreshToken
+
+KEY = {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"}
+
+
+@override_settings(JWT_FLOW={"KEY": KEY, "METRICS": True})
+class RegistryTest(SimpleTestCase):
+    def setUp(self):
+        registry.clear()
+        self.counter = Counter("test_events_total", "Events.")
+        self.histogram = Histogram("test_seconds", "Latency.", buckets=(0.1, 1.0))
+
+    def tearDown(self):
+        registry.metrics.pop("test_events_total")
+        registry.metrics.pop("test_seconds")
+
+    def test_render(self):
+        self.counter.inc(kind="a")
+        self.counter.inc(2, kind="a")
+        self.histogram.observe(0.05, op='say "hi"')
+        self.histogram.observe(0.5, op='say "hi"')
+        text = registry.render()
+        self.assertIn("# TYPE test_events_total counter\n", text)
+        self.assertIn('test_events_total{kind="a"} 3\n', text)
+        self.assertIn("# TYPE test_seconds histogram\n", text)
+        self.assertIn('test_seconds_bucket{op="say \\"hi\\"",le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{op="say \\"hi\\"",le="1"} 2\n', text)
+        self.assertIn('test_seconds_count{op="say \\"hi\\""} 2\n', text)
+        self.assertIn('test_seconds_sum{op="say \\"hi\\""} 0.55\n', text)
+
+    @override_settings(JWT_FLOW={"KEY": KEY})
+    def test_disabled(self):
+        self.counter.inc()
+        self.assertNotIn("\ntest_events_total ", registry.render())
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = {
+                "counters": [["test_events_total", [], 5]],
+                "histograms": [["test_seconds", [], [1, 0, 0, 0.01]]],
+            }
+            Path(directory, f"{os.getpid() + 1}.json").write_text(json.dumps(other))
+            with override_settings(
+                JWT_FLOW={"KEY": KEY, "METRICS": True, "METRICS_DIR": directory}
+            ):
+                self.counter.inc()
+                self.histogram.observe(2.0)
+                text = registry.render()
+            self.assertIn("test_events_total 6\n", text)
+            self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+            self.assertIn('test_seconds_bucket{le="+Inf"} 2\n', text)
+            self.assertIn("test_seconds_count 2\n", text)
+
+    def test_unwritable_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            missing = Path(directory, "missing")
+            with override_settings(
+                JWT_FLOW={"KEY": KEY, "METRICS": True, "METRICS_DIR": str(missing)}
+            ), self.assertLogs("django_graphql_jwt_flow.metrics", "WARNING") as logs:
+                registry._flushed_at = 0.0
+                self.counter.inc()
+                text = registry.render()
+        self.assertIn(f"Could not write metrics to {missing}", logs.output[0])
+        self.assertIn("test_events_total 1\n", text)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    JWT_FLOW={"KEY": KEY, "METRICS": True},
+)
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_token_operations(self):
+        token = JwtRefreshToken.objects.create(UserFactory())
+        token.is_valid()
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn('jwt_flow_token_seconds_count{operation="sign"} 1\n', text)
+        self.assertIn('jwt_flow_token_seconds_count{operation="verify"} 1\n', text)
+        self.assertIn('jwt_flow_token_checks_total{result="valid"} 1\n', text)
+        self.assertIn('jwt_flow_db_seconds_count{operation="create"} 1\n', text)
+        self.assertIn("jwt_flow_key_load_seconds_count 1\n", text)
+
+    def test_graphql(self):
+        self.client.post(
+            "/graphql", '{"query": "{ ping }"}', content_type="application/json"
+        )
+        self.client.post(
+            "/graphql", '{"query": "{ pong }"}', content_type="application/json"
+        )
+        response = self.client.get("/metrics")
+        self.assertEqual(
+            response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        text = response.content.decode()
+        self.assertIn('jwt_flow_graphql_seconds_count{status="200"} 1\n', text)
+        self.assertIn('jwt_flow_graphql_seconds_count{status="400"} 1\n', text)
+
+    @override_settings(JWT_FLOW={"KEY": KEY})
+    def test_view_disabled(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
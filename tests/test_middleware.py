@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.middleware import JwtAuthenticationMiddleware, user_cache
+from django_graphql_jwt_flow.models import JwtRefreshToken
+from django_graphql_jwt_flow.revocation import revocation_list
+from django_graphql_jwt_flow.wks import TokenInvalidReasons
+
+JWT_FLOW = {
+    "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+    "REVOCATION_SYNC_INTERVAL": 3600,
+    "TIME_WITH_MICROSECONDS": True,
+}
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    JWT_FLOW=JWT_FLOW,
+)
+class JwtAuthenticationMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.token = JwtRefreshToken.objects.create(self.user)
+        self.middleware = JwtAuthenticationMiddleware(lambda request: HttpResponse())
+        revocation_list.clear()
+        revocation_list.sync()
+        user_cache.clear()
+
+    def authenticate(self, token: str):
+        request = RequestFactory().post("/graphql", HTTP_AUTHORIZATION=token)
+        self.middleware(request)
+        return request
+
+    def test_lazy_user(self):
+        with self.assertNumQueries(0):
+            request = self.authenticate(f"Bearer {self.token.token}")
+        self.assertEqual(request.jwt_claims["uid"], str(self.user.pk))
+        self.assertIsNone(request.jwt_error)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user, self.user)
+            self.assertTrue(request.user.is_authenticated)
+
+    def test_without_token(self):
+        request = self.authenticate("Basic dXNlcjpwYXNz")
+        self.assertIsNone(request.jwt_claims)
+        self.assertIsNone(request.jwt_error)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_invalid_tokens(self):
+        expired = JwtRefreshToken.objects.generate_token(
+            str(self.user.pk), expires_at=datetime.utcnow() - timedelta(days=1)
+        ).serialize()
+        cases = (
+            ("Bearer garbage", TokenInvalidReasons.malformed),
+            (f"Bearer {self.token.token[:-2]}", TokenInvalidReasons.invalid_signature),
+            (f"Bearer {expired}", TokenInvalidReasons.expired),
+        )
+        for header, reason in cases:
+            with self.subTest(reason), self.assertNumQueries(0):
+                request = self.authenticate(header)
+                self.assertIsNone(request.jwt_claims)
+                self.assertEqual(request.jwt_error, reason)
+                self.assertFalse(request.user.is_authenticated)
+
+    def test_hostile_headers(self):
+        def segment(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        payload = self.token.token.split(".")[1]
+        cases = {
+            "list kid": segment({"alg": "HS256", "kid": ["x"]}),
+            "object kid": segment({"alg": "HS256", "kid": {"x": 1}}),
+            "number kid": segment({"alg": "HS256", "kid": 1}),
+            "list header": segment(["x"]),
+        }
+        for name, header in cases.items():
+            with self.subTest(name):
+                request = self.authenticate(f"Bearer {header}.{payload}.c2ln")
+                self.assertEqual(request.jwt_error, TokenInvalidReasons.malformed)
+                self.assertFalse(request.user.is_authenticated)
+
+        header, payload, signature = self.token.token.split(".")
+        for token in (
+            f"{header}.{payload}",
+            f"{self.token.token}.{signature}",
+            "é",
+            f"{header}.{payload}é.{signature}",
+            "\ud800.\ud800.\ud800",
+        ):
+            with self.subTest(token):
+                request = self.authenticate(f"Bearer {token}")
+                self.assertEqual(request.jwt_error, TokenInvalidReasons.malformed)
+                self.assertFalse(request.user.is_authenticated)
+
+    def test_revoked_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.revoke()
+        request = self.authenticate(f"Bearer {self.token.token}")
+        self.assertEqual(request.jwt_error, TokenInvalidReasons.revoked)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_superseded_tokens(self):
+        self.assertIsNone(self.authenticate(f"Bearer {self.token.token}").jwt_error)
+        with self.captureOnCommitCallbacks(execute=True):
+            rotated = JwtRefreshToken.objects.rotate(self.user.pk, self.token.token)
+        request = self.authenticate(f"Bearer {self.token.token}")
+        self.assertEqual(request.jwt_error, TokenInvalidReasons.revoked)
+        self.assertIsNone(self.authenticate(f"Bearer {rotated}").jwt_error)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            refreshed = JwtRefreshToken.objects.refresh_token(self.user)
+        request = self.authenticate(f"Bearer {rotated}")
+        self.assertEqual(request.jwt_error, TokenInvalidReasons.revoked)
+        self.assertIsNone(self.authenticate(f"Bearer {refreshed.token}").jwt_error)
+
+        # Other processes learn about them from the table.
+        revocation_list.clear()
+        request = self.authenticate(f"Bearer {self.token.token}")
+        self.assertEqual(request.jwt_error, TokenInvalidReasons.revoked)
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        request = self.authenticate(f"Bearer {self.token.token}")
+        self.assertIsNotNone(request.jwt_claims)
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_user_cache(self):
+        with override_settings(JWT_FLOW={**JWT_FLOW, "USER_CACHE_TTL": 60}):
+            revocation_list.sync()
+            with self.assertNumQueries(1):
+                first = self.authenticate(f"Bearer {self.token.token}").user
+                first.email
+            with self.assertNumQueries(0):
+                second = self.authenticate(f"Bearer {self.token.token}").user
+                self.assertEqual(second, self.user)
+            self.assertIsNot(first._wrapped, second._wrapped)
+            self.assertEqual(user_cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+            self.user.save()
+            with self.assertNumQueries(1):
+                self.authenticate(f"Bearer {self.token.token}").user.email
+
+    def test_user_cache_disabled(self):
+        for __ in range(2):
+            with self.assertNumQueries(1):
+                self.authenticate(f"Bearer {self.token.token}").user.email
+        self.assertEqual(user_cache.stats()["size"], 0)
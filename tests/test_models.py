@@ -1,11 +1,12 @@
 from django.db import IntegrityError
 from django.test import TestCase, SimpleTestCase, override_settings
-from jwcrypto.common import json_decode
+from jwcrypto.common import base64url_decode, json_decode
 from jwcrypto.jwk import JWK
 from jwcrypto.jwt import JWT
 
 from demo.app.factories import UserFactory
 from django_graphql_jwt_flow.models import JwtRefreshTokenManager, JwtRefreshToken
+from django_graphql_jwt_flow.revocation import revocation_list
 
 
 class TokenGeneratorTest(SimpleTestCase):
@@ -145,3 +146,297 @@ class JwtRefreshTokenTest(TestCase):
         token = JwtRefreshToken.objects.create(user=user)
         pk = user.pk
         self.assertEqual(f"token for user with ID {pk}", str(token))
+
+    @override_settings(
+        JWT_FLOW={
+            "KEY": {"k": "x-A5aHFjJohn3-wuBsv12Q", "kty": "oct"},
+            "SIGNATURE_ALG": "HS384",
+            "TIME_WITH_MICROSECONDS": True,
+        }
+    )
+    def test_manager_bulk_refresh(self):
+        tokens = [
+            JwtRefreshToken.objects.create(user=self.create_user()) for i in range(5)
+        ]
+        previous = {token.pk: token.token for token in tokens}
+        result = JwtRefreshToken.objects.bulk_refresh(
+            JwtRefreshToken.objects.all(), chunk_size=2, workers=2
+        )
+        self.assertEqual(result.count, 5)
+        self.assertGreater(result.per_second, 0)
+        for token in JwtRefreshToken.objects.select_related("user"):
+            self.assertNotEqual(previous[token.pk], token.token)
+            self.assertTrue(token.is_valid())
+
+    def test_manager_bulk_refresh_queries(self):
+        for i in range(4):
+            JwtRefreshToken.objects.create(user=self.create_user())
+        # Three reads (the last one comes back empty) and per chunk a savepoint pair
+        # plus the update and the revocation of the old tokens, never a query per
+        # row.
+        with self.assertNumQueries(3 + 2 * 4):
+            JwtRefreshToken.objects.bulk_refresh(
+                JwtRefreshToken.objects.all(), chunk_size=2
+            )
+
+    def test_manager_validate(self):
+        from datetime import datetime, timedelta
+        from django_graphql_jwt_flow.wks import TokenInvalidReasons
+
+        valid = JwtRefreshToken.objects.create(user=self.create_user())
+        expired = JwtRefreshToken.objects.create(user=self.create_user())
+        mismatch = JwtRefreshToken.objects.create(user=self.create_user())
+        tampered = JwtRefreshToken.objects.create(user=self.create_user())
+        malformed = JwtRefreshToken.objects.create(user=self.create_user())
+        past = datetime.utcnow() - timedelta(days=1)
+        JwtRefreshToken.objects.filter(pk=expired.pk).update(
+            token=JwtRefreshToken.objects.generate_token(
+                str(expired.user_id), expires_at=past
+            ).serialize()
+        )
+        JwtRefreshToken.objects.filter(pk=mismatch.pk).update(token=valid.token)
+        JwtRefreshToken.objects.filter(pk=tampered.pk).update(token=tampered.token[:-4])
+        JwtRefreshToken.objects.filter(pk=malformed.pk).update(
+            token=malformed.token[1:]
+        )
+
+        revocation_list.clear()
+        revocation_list.sync()
+        with self.assertNumQueries(3):
+            actual = list(JwtRefreshToken.objects.validate(chunk_size=2))
+        self.assertEqual(
+            actual,
+            [
+                (valid.pk, True, None),
+                (expired.pk, False, TokenInvalidReasons.expired),
+                (mismatch.pk, False, TokenInvalidReasons.uid_mismatch),
+                (tampered.pk, False, TokenInvalidReasons.invalid_signature),
+                (malformed.pk, False, TokenInvalidReasons.malformed),
+            ],
+        )
+
+    def test_token_fields(self):
+        from django.utils.http import urlsafe_base64_decode
+        from django_graphql_jwt_flow.utils import claim_to_datetime
+
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        claims = json_decode(urlsafe_base64_decode(token.token.split(".")[1]))
+        self.assertEqual(token.issued_at, claim_to_datetime(claims["iat"]))
+        self.assertEqual(token.expires_at, claim_to_datetime(claims["exp"]))
+        refreshed = JwtRefreshToken.objects.refresh_token(user)
+        self.assertIsNotNone(refreshed.expires_at)
+
+    def test_manager_expired_active(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        active = JwtRefreshToken.objects.create(user=self.create_user())
+        expired = JwtRefreshToken.objects.create(user=self.create_user())
+        JwtRefreshToken.objects.filter(pk=expired.pk).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertQuerysetEqual(
+            JwtRefreshToken.objects.expired(), [expired.pk], lambda o: o.pk
+        )
+        self.assertQuerysetEqual(
+            JwtRefreshToken.objects.active(), [active.pk], lambda o: o.pk
+        )
+
+    def test_manager_get_by_token(self):
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        self.assertEqual(len(token.token_digest), 64)
+        with self.assertNumQueries(1):
+            self.assertEqual(JwtRefreshToken.objects.get_by_token(token.token), token)
+        refreshed = JwtRefreshToken.objects.refresh_token(user)
+        self.assertEqual(JwtRefreshToken.objects.get_by_token(refreshed.token), token)
+        with self.assertRaises(JwtRefreshToken.DoesNotExist):
+            JwtRefreshToken.objects.get_by_token(token.token[:-1])
+
+    def test_save_maintains_digest(self):
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        token.token = JwtRefreshToken.objects.generate_token(str(user.pk)).serialize()
+        token.save(update_fields=["token"])
+        self.assertEqual(JwtRefreshToken.objects.get_by_token(token.token), token)
+
+    def test_key_rotation(self):
+        from datetime import datetime, timedelta
+        from django_graphql_jwt_flow.wks import TokenInvalidReasons
+
+        first = {"KID": "first", "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"}}
+        second = {"KID": "second", "KEY": {"kty": "oct", "k": "x-A5aHFjJohn3-wuBsv12Q"}}
+        with override_settings(JWT_FLOW={"KEYRING": [first]}):
+            old = JwtRefreshToken.objects.create(user=self.create_user())
+            self.assertEqual(
+                json_decode(base64url_decode(old.token.split(".")[0]))["kid"], "first"
+            )
+
+        retired_at = datetime.utcnow() - timedelta(days=1)
+        with override_settings(
+            JWT_FLOW={"KEYRING": [second, {**first, "RETIRED_AT": retired_at}]}
+        ):
+            self.assertTrue(old.is_valid())
+            new = JwtRefreshToken.objects.create(user=self.create_user())
+            self.assertTrue(new.is_valid())
+            self.assertEqual(
+                json_decode(base64url_decode(new.token.split(".")[0]))["kid"], "second"
+            )
+        with override_settings(
+            JWT_FLOW={
+                "KEYRING": [second, {**first, "RETIRED_AT": retired_at}],
+                "KEY_GRACE_DAYS": 0,
+            }
+        ):
+            self.assertFalse(old.is_valid())
+            self.assertTrue(new.is_valid())
+            self.assertEqual(
+                list(JwtRefreshToken.objects.validate()),
+                [
+                    (old.pk, False, TokenInvalidReasons.unknown_key),
+                    (new.pk, True, None),
+                ],
+            )
+
+    @override_settings(
+        JWT_FLOW={
+            "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+            "TIME_WITH_MICROSECONDS": True,
+        }
+    )
+    def test_manager_rotate(self):
+        from django_graphql_jwt_flow.exceptions import RefreshTokenReused
+
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        revocation_list.clear()
+        revocation_list.sync()
+        # The update and the revocation of the old token.
+        with self.assertNumQueries(2):
+            rotated = JwtRefreshToken.objects.rotate(user.pk, token.token)
+        self.assertNotEqual(rotated, token.token)
+        self.assertEqual(JwtRefreshToken.objects.get_by_token(rotated).pk, token.pk)
+        self.assertTrue(JwtRefreshToken.objects.get(pk=token.pk).is_valid())
+
+        with self.assertNumQueries(1), self.assertRaises(RefreshTokenReused):
+            JwtRefreshToken.objects.rotate(user.pk, token.token)
+        with self.assertRaises(RefreshTokenReused):
+            JwtRefreshToken.objects.rotate(self.create_user().pk, rotated)
+
+    def test_manager_rotate_same_second(self):
+        from datetime import datetime
+        from unittest import mock
+
+        from django_graphql_jwt_flow.exceptions import RefreshTokenReused
+
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        revocation_list.clear()
+        revocation_list.sync()
+        frozen = mock.Mock(wraps=datetime)
+        frozen.utcnow.return_value = datetime.utcfromtimestamp(
+            json_decode(base64url_decode(token.token.split(".")[1]))["iat"]
+        )
+        with mock.patch("django_graphql_jwt_flow.models.datetime", frozen):
+            rotated = JwtRefreshToken.objects.rotate(user.pk, token.token)
+        self.assertNotEqual(rotated, token.token)
+        with self.assertRaises(RefreshTokenReused):
+            JwtRefreshToken.objects.rotate(user.pk, token.token)
+
+    def test_manager_rotate_expired(self):
+        from datetime import datetime, timedelta
+
+        from django_graphql_jwt_flow.exceptions import RefreshTokenExpired
+        from django_graphql_jwt_flow.storage import ModelStorage
+
+        user = self.create_user()
+        JwtRefreshToken.objects.create(user=user)
+        expired = JwtRefreshToken.objects.token_fields(
+            JwtRefreshToken.objects.generate_token(
+                str(user.pk), expires_at=datetime.utcnow() - timedelta(days=1)
+            )
+        )
+        JwtRefreshToken.objects.filter(user=user).update(**expired)
+        revocation_list.clear()
+        revocation_list.sync()
+        with self.assertRaises(RefreshTokenExpired):
+            JwtRefreshToken.objects.rotate(user.pk, expired["token"])
+        fields = JwtRefreshToken.objects.token_fields(
+            JwtRefreshToken.objects.generate_token(str(user.pk))
+        )
+        self.assertFalse(
+            ModelStorage().rotate(user.pk, expired["token_digest"], fields)
+        )
+        self.assertEqual(JwtRefreshToken.objects.get(user=user).token, expired["token"])
+
+    def test_manager_rotate_revoked(self):
+        from django_graphql_jwt_flow.exceptions import RefreshTokenRevoked
+
+        user = self.create_user()
+        token = JwtRefreshToken.objects.create(user=user)
+        revocation_list.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            token.revoke()
+        with self.assertRaises(RefreshTokenRevoked):
+            JwtRefreshToken.objects.rotate(user.pk, token.token)
+        self.assertEqual(JwtRefreshToken.objects.get(pk=token.pk).token, token.token)
+
+    def test_manager_create_upsert(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        user = self.create_user()
+        # The conflict-ignoring insert and the read of the primary key.
+        with CaptureQueriesContext(connection) as ctx:
+            token = JwtRefreshToken.objects.create(user)
+        insert, select = ctx.captured_queries
+        self.assertRegex(insert["sql"], r"^INSERT .*(IGNORE|ON CONFLICT)")
+        self.assertEqual(JwtRefreshToken.objects.get(user=user), token)
+        self.assertFalse(token._state.adding)
+
+        with self.assertNumQueries(2), self.assertRaisesMessage(
+            IntegrityError, "already has a token"
+        ):
+            JwtRefreshToken.objects.create(user)
+        # The failed insert did not break the transaction.
+        self.assertEqual(JwtRefreshToken.objects.count(), 1)
+
+    def test_manager_get_or_create_queries(self):
+        user = self.create_user()
+        with self.assertNumQueries(3):
+            token, created = JwtRefreshToken.objects.get_or_create(user)
+        self.assertTrue(created)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                JwtRefreshToken.objects.get_or_create(user), (token, False)
+            )
+
+    def test_manager_get_or_create_race(self):
+        from unittest import mock
+
+        from django_graphql_jwt_flow.storage import ModelStorage
+
+        user = self.create_user()
+        winner = JwtRefreshToken.objects.create(user)
+        # The first lookup misses, as if the winner committed right after it.
+        with mock.patch.object(
+            ModelStorage, "get", side_effect=[None, ModelStorage().get(user)]
+        ):
+            token, created = JwtRefreshToken.objects.get_or_create(user)
+        self.assertFalse(created)
+        self.assertEqual(token, winner)
+
+    def test_manager_create_without_ignore_conflicts(self):
+        from unittest import mock
+
+        from django.db import connection
+
+        user = self.create_user()
+        with mock.patch.object(connection.features, "supports_ignore_conflicts", False):
+            token = JwtRefreshToken.objects.create(user)
+            self.assertEqual(JwtRefreshToken.objects.get(user=user), token)
+            token, created = JwtRefreshToken.objects.get_or_create(user)
+            self.assertFalse(created)
+            with self.assertRaises(IntegrityError):
+                JwtRefreshToken.objects.create(user)
@@ -0,0 +1,127 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.models import JwtRefreshToken, RevokedToken
+from django_graphql_jwt_flow.revocation import BloomFilter, revocation_list
+from django_graphql_jwt_flow.utils import token_digest
+from django_graphql_jwt_flow.wks import TokenInvalidReasons
+
+
+class BloomFilterTest(SimpleTestCase):
+    def test_sizing(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        self.assertEqual(bloom_filter.size, 9586)
+        self.assertEqual(bloom_filter.hashes, 7)
+        self.assertEqual(bloom_filter.nbytes, 1199)
+        with self.assertRaisesMessage(ValueError, "error_rate must be between"):
+            BloomFilter(1000, 1)
+
+    def test_membership(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        added = [token_digest(str(i)) for i in range(1000)]
+        for digest in added:
+            bloom_filter.add(digest)
+        self.assertTrue(all(digest in bloom_filter for digest in added))
+        others = [token_digest(f"other {i}") for i in range(10000)]
+        false_positives = sum(digest in bloom_filter for digest in others)
+        self.assertLess(false_positives, 200)
+        self.assertAlmostEqual(bloom_filter.estimated_error_rate(), 0.01, places=2)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    JWT_FLOW={
+        "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+        "REVOCATION_CAPACITY": 100,
+        "REVOCATION_SYNC_INTERVAL": 3600,
+        "TIME_WITH_MICROSECONDS": True,
+    },
+)
+class RevocationListTest(TestCase):
+    def setUp(self):
+        self.tokens = [JwtRefreshToken.objects.create(UserFactory()) for i in range(3)]
+        revocation_list.clear()
+
+    def test_not_revoked_without_queries(self):
+        revocation_list.sync()
+        with self.assertNumQueries(0):
+            for token in self.tokens:
+                self.assertTrue(token.is_valid())
+        self.assertEqual(revocation_list.stats()["checks"], 3)
+
+    def test_revoke(self):
+        revocation_list.sync()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.tokens[0].revoke(), 1)
+        with self.assertNumQueries(0):
+            self.assertFalse(self.tokens[0].is_valid())
+            self.assertTrue(self.tokens[1].is_valid())
+        self.assertEqual(
+            [reason for pk, valid, reason in JwtRefreshToken.objects.validate()],
+            [TokenInvalidReasons.revoked, None, None],
+        )
+        self.assertTrue(self.tokens[0].refresh().is_valid())
+
+    def test_catch_up(self):
+        revocation_list.sync()
+        RevokedToken.objects.create(token_digest=self.tokens[1].token_digest)
+        self.assertTrue(self.tokens[1].is_valid())
+        revocation_list.sync(force=True)
+        self.assertFalse(self.tokens[1].is_valid())
+        self.assertEqual(
+            revocation_list.stats()["high_water"], RevokedToken.objects.get().pk
+        )
+
+    def test_skipped_keys_are_retried(self):
+        first = RevokedToken.objects.create(token_digest=self.tokens[0].token_digest)
+        third = RevokedToken.objects.create(
+            pk=first.pk + 2, token_digest=self.tokens[2].token_digest
+        )
+        revocation_list.sync()
+        self.assertEqual(revocation_list.stats()["high_water"], third.pk)
+        RevokedToken.objects.create(
+            pk=first.pk + 1, token_digest=self.tokens[1].token_digest
+        )
+        revocation_list.sync(force=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                revocation_list.filter_revoked(t.token_digest for t in self.tokens),
+                {t.token_digest for t in self.tokens},
+            )
+
+    def test_false_positive_checked_once(self):
+        revocation_list.sync()
+        digest = self.tokens[0].token_digest
+        revocation_list._filter.add(digest)
+        with self.assertNumQueries(1):
+            self.assertFalse(revocation_list.is_revoked(digest))
+            self.assertFalse(revocation_list.is_revoked(digest))
+        self.assertEqual(revocation_list.stats()["false_positives"], 1)
+
+    def test_lookup_without_filter(self):
+        RevokedToken.objects.create(token_digest=self.tokens[0].token_digest)
+        with mock.patch.object(
+            revocation_list, "rebuild", side_effect=DatabaseError
+        ), self.assertNumQueries(1):
+            self.assertEqual(
+                revocation_list.filter_revoked(t.token_digest for t in self.tokens),
+                {self.tokens[0].token_digest},
+            )
+        self.assertIsNone(revocation_list._filter)
+        self.assertFalse(self.tokens[0].is_valid())
+        self.assertTrue(self.tokens[1].is_valid())
+        self.assertIsNotNone(revocation_list._filter)
+
+    def test_rebuild_when_full(self):
+        RevokedToken.objects.bulk_create(
+            RevokedToken(token_digest=token_digest(str(i))) for i in range(150)
+        )
+        revocation_list.sync()
+        stats = revocation_list.stats()
+        self.assertEqual(stats["capacity"], 300)
+        self.assertEqual(stats["entries"], 150)
+        self.assertEqual(stats["error_rate"], 0.001)
+        self.assertLess(stats["estimated_error_rate"], 0.001)
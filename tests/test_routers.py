@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connections, router
+from django.test import TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.models import JwtRefreshToken, RevokedToken
+from django_graphql_jwt_flow.routers import pinned_users
+
+JWT_FLOW = {
+    "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+    "READ_REPLICAS": ["replica"],
+}
+#: A stand-in read replica, which never catches up.
+REPLICA = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ReplicaRouterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Connections read DATABASES once, so override_settings() cannot add an
+        # alias. The replica is added to them directly, for these tests only, and
+        # to the databases of the class once the test runner set up its own.
+        connections.databases["replica"] = dict(REPLICA)
+        cls.addClassCleanup(cls.remove_replica)
+        call_command("migrate", database="replica", verbosity=0)
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @staticmethod
+    def remove_replica():
+        if hasattr(connections._connections, "replica"):
+            del connections["replica"]
+        del connections.databases["replica"]
+
+    def setUp(self):
+        # Routers are overridden per test, so they cannot outlive a failed test.
+        routing = override_settings(
+            DATABASE_ROUTERS=["django_graphql_jwt_flow.routers.ReplicaRouter"],
+            JWT_FLOW=JWT_FLOW,
+        )
+        routing.enable()
+        self.addCleanup(routing.disable)
+        self.user = UserFactory()
+        pinned_users.clear()
+
+    def test_routing(self):
+        self.assertEqual(router.db_for_read(JwtRefreshToken), "replica")
+        self.assertEqual(router.db_for_read(RevokedToken), "replica")
+        self.assertEqual(router.db_for_write(JwtRefreshToken), "default")
+        self.assertEqual(router.db_for_read(type(self.user)), "default")
+        with self.assertNumQueries(1, using="replica"):
+            list(JwtRefreshToken.objects.validate())
+
+    def test_read_your_writes(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        self.assertTrue(pinned_users.is_pinned(self.user.pk))
+        with self.assertNumQueries(1, using="default"):
+            self.assertEqual(
+                JwtRefreshToken.objects.get_or_create(self.user), (token, False)
+            )
+        self.assertEqual(
+            router.db_for_read(JwtRefreshToken, instance=self.user), "default"
+        )
+        other = UserFactory()
+        self.assertEqual(router.db_for_read(JwtRefreshToken, instance=other), "replica")
+
+        # The replica has not caught up, as long as the pin lasts.
+        with mock.patch("time.monotonic", return_value=10**9):
+            self.assertFalse(pinned_users.is_pinned(self.user.pk))
+            with self.assertNumQueries(1, using="replica"):
+                self.assertFalse(
+                    JwtRefreshToken.objects.filter(user=self.user).exists()
+                )
+
+    def test_rotate_pins(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        pinned_users.clear()
+        JwtRefreshToken.objects.rotate(self.user.pk, token.token)
+        self.assertTrue(pinned_users.is_pinned(self.user.pk))
+
+    def test_pins_in_cache(self):
+        with override_settings(
+            JWT_FLOW={**JWT_FLOW, "REPLICA_PIN_CACHE": "default"},
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            },
+        ):
+            JwtRefreshToken.objects.create(self.user)
+            self.assertTrue(pinned_users.is_pinned(self.user.pk))
+            pinned_users.clear()
+            self.assertTrue(pinned_users.is_pinned(self.user.pk))
+
+    def test_without_replicas(self):
+        with override_settings(JWT_FLOW={**JWT_FLOW, "READ_REPLICAS": []}):
+            self.assertEqual(router.db_for_read(JwtRefreshToken), "default")
+            JwtRefreshToken.objects.create(self.user)
+            self.assertFalse(pinned_users.is_pinned(self.user.pk))
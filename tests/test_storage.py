@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.exceptions import (
+    RefreshTokenExpired,
+    RefreshTokenReused,
+)
+from django_graphql_jwt_flow.models import JwtRefreshToken, RevokedToken
+from django_graphql_jwt_flow.revocation import revocation_list
+from django_graphql_jwt_flow.storage import (
+    CacheStorage,
+    ModelStorage,
+    TokenStorage,
+    get_token_storage,
+)
+
+JWT_FLOW = {
+    "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+    "REVOCATION_SYNC_INTERVAL": 3600,
+    "TIME_WITH_MICROSECONDS": True,
+    "TOKEN_STORAGE": "django_graphql_jwt_flow.storage.CacheStorage",
+    "TOKEN_STORAGE_CACHE": "tokens",
+}
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "tokens": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tokens",
+    },
+}
+
+
+class TokenStorageTest(SimpleTestCase):
+    def test_incomplete_backend(self):
+        class Incomplete(TokenStorage):
+            def get(self, user):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    CACHES=CACHES,
+    JWT_FLOW=JWT_FLOW,
+)
+class CacheStorageWriteThroughTest(TestCase):
+    def setUp(self):
+        caches["tokens"].clear()
+        revocation_list.clear()
+        revocation_list.sync()
+        self.user = UserFactory()
+
+    def test_backend(self):
+        self.assertIsInstance(get_token_storage(), CacheStorage)
+
+    def test_reads_from_cache(self):
+        created = JwtRefreshToken.objects.create(self.user)
+        with self.assertNumQueries(0):
+            token, was_created = JwtRefreshToken.objects.get_or_create(self.user)
+            self.assertTrue(token.is_valid())
+        self.assertFalse(was_created)
+        self.assertEqual((token.pk, token.token), (created.pk, created.token))
+
+        caches["tokens"].clear()
+        with self.assertNumQueries(1):
+            JwtRefreshToken.objects.get_or_create(self.user)
+        with self.assertNumQueries(0):
+            JwtRefreshToken.objects.get_or_create(self.user)
+
+    def test_writes_through(self):
+        JwtRefreshToken.objects.create(self.user)
+        refreshed = JwtRefreshToken.objects.refresh_token(self.user)
+        self.assertEqual(JwtRefreshToken.objects.get(user=self.user), refreshed)
+        with self.assertNumQueries(0):
+            cached = JwtRefreshToken.objects.get_or_create(self.user)[0]
+        self.assertEqual(cached.token, refreshed.token)
+
+        rotated = JwtRefreshToken.objects.rotate(self.user.pk, refreshed.token)
+        self.assertEqual(JwtRefreshToken.objects.get(user=self.user).token, rotated)
+        self.assertEqual(
+            JwtRefreshToken.objects.get_or_create(self.user)[0].token, rotated
+        )
+        with self.assertRaises(RefreshTokenReused):
+            JwtRefreshToken.objects.rotate(self.user.pk, refreshed.token)
+
+    def test_fill_races_with_rotation(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        caches["tokens"].clear()
+        rotated = []
+        read = ModelStorage.get
+
+        def read_then_rotate(storage, user):
+            # A concurrent rotation between the database read and the cache fill.
+            instance = read(storage, user)
+            rotated.append(JwtRefreshToken.objects.rotate(user.pk, instance.token))
+            return instance
+
+        with mock.patch.object(ModelStorage, "get", read_then_rotate):
+            stale = JwtRefreshToken.objects.get_or_create(self.user)[0]
+        self.assertEqual(stale.token, token.token)
+        self.assertEqual(
+            JwtRefreshToken.objects.get_or_create(self.user)[0].token, rotated[0]
+        )
+
+    def test_fill_timeout(self):
+        JwtRefreshToken.objects.create(self.user)
+        caches["tokens"].clear()
+        with mock.patch.object(caches["tokens"], "set") as cache_set:
+            JwtRefreshToken.objects.get_or_create(self.user)
+        self.assertEqual(cache_set.call_args[0][2], CacheStorage.max_fill_timeout)
+
+    def test_entry_without_version(self):
+        # As cached without write-through, before the setting was switched on.
+        token = JwtRefreshToken.objects.create(self.user)
+        storage = get_token_storage()
+        caches["tokens"].set(
+            storage.make_key(self.user.pk),
+            {**storage.get_fields(token), "pk": token.pk},
+        )
+        with self.assertNumQueries(1):
+            cached = JwtRefreshToken.objects.get_or_create(self.user)[0]
+        self.assertEqual(cached.token, token.token)
+
+    def test_forgets_changes_behind_its_back(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        JwtRefreshToken.objects.bulk_refresh(JwtRefreshToken.objects.all())
+        current = JwtRefreshToken.objects.get(user=self.user).token
+        self.assertNotEqual(current, token.token)
+        self.assertEqual(
+            JwtRefreshToken.objects.get_or_create(self.user)[0].token, current
+        )
+
+        JwtRefreshToken.objects.filter(user=self.user).delete()
+        self.user.refresh_from_db()
+        self.assertTrue(JwtRefreshToken.objects.get_or_create(self.user)[1])
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    CACHES=CACHES,
+    JWT_FLOW={**JWT_FLOW, "TOKEN_STORAGE_WRITE_THROUGH": False},
+)
+class CacheStorageTtlOnlyTest(TestCase):
+    def setUp(self):
+        caches["tokens"].clear()
+        revocation_list.clear()
+        revocation_list.sync()
+        self.user = UserFactory()
+
+    def test_no_queries(self):
+        with self.assertNumQueries(0):
+            token, created = JwtRefreshToken.objects.get_or_create(self.user)
+            self.assertTrue(created)
+            self.assertIsNone(token.pk)
+            self.assertTrue(token.is_valid())
+            cached, created = JwtRefreshToken.objects.get_or_create(self.user)
+            self.assertEqual((cached.token, created), (token.token, False))
+        # Only the replaced tokens are written, to the revocation list.
+        with self.assertNumQueries(1):
+            refreshed = JwtRefreshToken.objects.refresh_token(self.user)
+        self.assertNotEqual(refreshed.token, token.token)
+        with self.assertNumQueries(1):
+            rotated = JwtRefreshToken.objects.rotate(self.user.pk, refreshed.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                JwtRefreshToken.objects.get_or_create(self.user)[0].token, rotated
+            )
+        self.assertFalse(JwtRefreshToken.objects.exists())
+        self.assertTrue(
+            RevokedToken.objects.filter(token_digest=refreshed.token_digest).exists()
+        )
+
+    def test_create_twice(self):
+        JwtRefreshToken.objects.create(self.user)
+        with self.assertRaisesMessage(IntegrityError, "already has a token"):
+            JwtRefreshToken.objects.create(self.user)
+
+    def test_rotate_once(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        JwtRefreshToken.objects.rotate(self.user.pk, token.token)
+        with self.assertRaises(RefreshTokenReused):
+            JwtRefreshToken.objects.rotate(self.user.pk, token.token)
+
+    def test_rotate_expired(self):
+        storage = get_token_storage()
+        expired = JwtRefreshToken.objects.token_fields(
+            JwtRefreshToken.objects.generate_token(
+                str(self.user.pk), expires_at=datetime.utcnow() - timedelta(days=1)
+            )
+        )
+        # Cached without a timeout, as if the cache kept it past its expiry.
+        caches["tokens"].set(storage.make_key(self.user.pk), {**expired, "pk": None})
+        with self.assertRaises(RefreshTokenExpired):
+            JwtRefreshToken.objects.rotate(self.user.pk, expired["token"])
+        fields = JwtRefreshToken.objects.token_fields(
+            JwtRefreshToken.objects.generate_token(str(self.user.pk))
+        )
+        self.assertFalse(storage.rotate(self.user.pk, expired["token_digest"], fields))
+        self.assertEqual(storage.get(self.user).token, expired["token"])
+
+    def test_forget_keeps_tokens(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        get_token_storage().forget([self.user.pk])
+        JwtRefreshToken.objects.filter(user=self.user).delete()
+        cached, created = JwtRefreshToken.objects.get_or_create(self.user)
+        self.assertEqual((cached.token, created), (token.token, False))
+
+    def test_expiry(self):
+        token = JwtRefreshToken.objects.create(self.user)
+        timeout = CacheStorage.get_timeout(token.expires_at)
+        self.assertAlmostEqual(timeout, 7 * 24 * 3600 + 90, delta=5)
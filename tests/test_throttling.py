@@ -0,0 +1,167 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.throttling import (
+    CacheThrottle,
+    LocalThrottle,
+    ThrottleBackend,
+    password_check_slot,
+)
+from django_graphql_jwt_flow.wks import ErrorStrings
+
+LOGIN = """
+mutation login($email: String!, $password: String!) {
+    login(email: $email, password: $password) { success token }
+}
+"""
+
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "throttle": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "throttle",
+    },
+}
+
+
+class ThrottleBackendTest(SimpleTestCase):
+    def test_local(self):
+        throttle = LocalThrottle()
+        with mock.patch("time.monotonic", return_value=100.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+        with mock.patch("time.monotonic", return_value=105.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+            self.assertFalse(throttle.allow("a", 2, 10))
+            self.assertTrue(throttle.allow("b", 2, 10))
+        with mock.patch("time.monotonic", return_value=110.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+            self.assertFalse(throttle.allow("a", 2, 10))
+
+    def test_local_max_keys(self):
+        throttle = LocalThrottle()
+        throttle.max_keys = 2
+        for key in "abc":
+            throttle.allow(key, 1, 10)
+        self.assertEqual(list(throttle._attempts), ["b", "c"])
+
+    @override_settings(CACHES=CACHES, JWT_FLOW={"LOGIN_THROTTLE_CACHE": "throttle"})
+    def test_cache(self):
+        caches["throttle"].clear()
+        throttle = CacheThrottle()
+        with mock.patch("time.time", return_value=1000.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+            self.assertTrue(throttle.allow("a", 2, 10))
+            self.assertFalse(throttle.allow("a", 2, 10))
+        # Half of the previous window still counts: 2 * 0.5 + 0 < 2.
+        with mock.patch("time.time", return_value=1015.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+            self.assertFalse(throttle.allow("a", 2, 10))
+        with mock.patch("time.time", return_value=1030.0):
+            self.assertTrue(throttle.allow("a", 2, 10))
+
+    def test_incomplete_backend(self):
+        class Incomplete(ThrottleBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_password_check_slot(self):
+        with override_settings(JWT_FLOW={"LOGIN_CONCURRENCY": 1}):
+            with password_check_slot():
+                with self.assertRaisesMessage(Exception, ErrorStrings.server_busy):
+                    with password_check_slot():
+                        pass
+            with password_check_slot():
+                pass
+
+
+JWT_FLOW = {
+    "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+    "LOGIN_RATE_PER_USERNAME": (2, 60),
+    "LOGIN_RATE_PER_IP": (3, 60),
+    "LOGIN_THROTTLE_BACKEND": "django_graphql_jwt_flow.throttling.CacheThrottle",
+    "LOGIN_THROTTLE_CACHE": "throttle",
+}
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    CACHES=CACHES,
+    JWT_FLOW=JWT_FLOW,
+)
+class LoginThrottleTest(TestCase):
+    def setUp(self):
+        caches["throttle"].clear()
+        self.user = UserFactory(password="secret")
+
+    def login(self, email, password="wrong", **extra):
+        response = self.client.post(
+            "/graphql",
+            json.dumps(
+                {"query": LOGIN, "variables": {"email": email, "password": password}}
+            ),
+            content_type="application/json",
+            **extra,
+        )
+        return response.status_code, response.json().get("errors")
+
+    def test_per_username(self):
+        self.assertEqual(self.login(self.user.email)[0], 401)
+        self.assertEqual(self.login(self.user.email.upper())[0], 401)
+        with mock.patch("django_graphql_jwt_flow.schema.authenticate") as authenticate:
+            status_code, errors = self.login(self.user.email, "secret")
+        authenticate.assert_not_called()
+        self.assertEqual(status_code, 429)
+        self.assertEqual(errors[0]["message"], ErrorStrings.too_many_attempts)
+        self.assertEqual(self.login(self.user.email, REMOTE_ADDR="10.0.0.1")[0], 429)
+
+    def test_per_ip(self):
+        for i in range(3):
+            self.assertEqual(self.login(f"user{i}@example.com")[0], 401)
+        self.assertEqual(self.login("user9@example.com")[0], 429)
+        self.assertEqual(
+            self.login("user9@example.com", REMOTE_ADDR="10.0.0.1")[0], 401
+        )
+
+    @override_settings(JWT_FLOW={**JWT_FLOW, "LOGIN_CONCURRENCY": 1})
+    def test_load_shedding(self):
+        with password_check_slot():
+            status_code, errors = self.login(self.user.email, "secret")
+        self.assertEqual(status_code, 503)
+        self.assertEqual(errors[0]["message"], ErrorStrings.server_busy)
+        self.assertEqual(self.login(self.user.email, "secret")[0], 200)
+
+    def test_async_check_off_event_loop(self):
+        in_loop = []
+
+        def check_login_rate(request, username):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                in_loop.append(False)
+            else:
+                in_loop.append(True)
+
+        with mock.patch(
+            "django_graphql_jwt_flow.schema.check_login_rate", check_login_rate
+        ):
+            response = async_to_sync(self.async_client.post)(
+                "/graphql-async",
+                json.dumps(
+                    {
+                        "query": LOGIN,
+                        "variables": {"email": self.user.email, "password": "secret"},
+                    }
+                ),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(in_loop, [False])
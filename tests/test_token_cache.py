@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.models import JwtRefreshToken, verify_claims
+from django_graphql_jwt_flow.revocation import revocation_list
+from django_graphql_jwt_flow.token_cache import verified_tokens
+
+JWT_FLOW = {
+    "KEY": {"kty": "oct", "k": "J5CnFlrYuU1dITmW8FkDkw"},
+    "REVOCATION_SYNC_INTERVAL": 3600,
+    "TIME_WITH_MICROSECONDS": True,
+}
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    JWT_FLOW=JWT_FLOW,
+)
+class VerifiedTokenCacheTest(TestCase):
+    def setUp(self):
+        self.tokens = [JwtRefreshToken.objects.create(UserFactory()) for i in range(3)]
+        verified_tokens.clear()
+
+    def test_hit_skips_verification(self):
+        token = self.tokens[0]
+        self.assertTrue(token.is_valid())
+        with mock.patch("jwcrypto.jws.JWS.verify") as verify:
+            self.assertTrue(token.is_valid())
+            claims = verify_claims(token.token)
+        verify.assert_not_called()
+        self.assertEqual(claims["uid"], str(token.user_id))
+        claims["uid"] = "changed"
+        self.assertTrue(token.is_valid())
+        self.assertEqual(
+            verified_tokens.stats(),
+            {"size": 1, "hits": 3, "misses": 1, "evictions": 0, "hit_rate": 0.75},
+        )
+
+    def test_invalid_tokens_are_not_cached(self):
+        for __ in range(2):
+            self.assertIsInstance(verify_claims(self.tokens[0].token[:-2]), str)
+        self.assertEqual(verified_tokens.stats()["size"], 0)
+
+    def test_size_bound(self):
+        with override_settings(JWT_FLOW={**JWT_FLOW, "VERIFIED_TOKEN_CACHE_SIZE": 2}):
+            for token in self.tokens:
+                verify_claims(token.token)
+            verify_claims(self.tokens[0].token)
+            stats = verified_tokens.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["evictions"]), (2, 0, 2))
+
+    def test_ttl(self):
+        token = self.tokens[0]
+        with mock.patch("time.monotonic", return_value=1000.0):
+            verify_claims(token.token)
+        with mock.patch("time.monotonic", return_value=1299.0):
+            verify_claims(token.token)
+        with mock.patch("time.monotonic", return_value=1301.0):
+            verify_claims(token.token)
+        self.assertEqual(verified_tokens.stats()["hits"], 1)
+
+    def test_ttl_capped_at_expiry(self):
+        raw = JwtRefreshToken.objects.generate_token(
+            "1", expires_at=datetime.utcnow() + timedelta(seconds=10)
+        ).serialize()
+        with mock.patch("time.monotonic", return_value=1000.0):
+            verify_claims(raw)
+        with mock.patch("time.monotonic", return_value=1011.0):
+            verify_claims(raw)
+        self.assertEqual(verified_tokens.stats()["hits"], 0)
+
+    def test_cleared_on_key_change(self):
+        raw = self.tokens[0].token
+        verify_claims(raw)
+        other_key = {**JWT_FLOW, "KEY": {"kty": "oct", "k": "aW52YWxpZCBrZXkgMTIzNA"}}
+        with override_settings(JWT_FLOW=other_key):
+            self.assertIsInstance(verify_claims(raw), str)
+
+    def test_discarded_on_revocation(self):
+        revocation_list.clear()
+        revocation_list.sync()
+        token = self.tokens[0]
+        self.assertTrue(token.is_valid())
+        with self.captureOnCommitCallbacks(execute=True):
+            token.revoke()
+        self.assertEqual(verified_tokens.stats()["size"], 0)
+        self.assertFalse(token.is_valid())
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import threading
+import time
+
+import graphene
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from demo.app.factories import UserFactory
+from django_graphql_jwt_flow.backend import document_backend, query_hash
+from django_graphql_jwt_flow.models import JwtRefreshToken
+from django_graphql_jwt_flow.views import AsyncGraphQLView, GraphQLView, JWKSView
+from django_graphql_jwt_flow.wks import ErrorStrings
+
+LOGIN = """
+mutation login($email: String!, $password: String!) {
+    login(email: $email, password: $password) { success token }
+}
+"""
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class GraphQLViewTest(TestCase):
+    url = "/graphql"
+
+    def setUp(self):
+        self.password = "correct horse battery staple"
+        self.user = UserFactory(password=self.password)
+
+    def post(self, query, **variables):
+        return self.client.post(
+            self.url,
+            json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+        )
+
+    def assertLoginSucceeds(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]["login"]
+        self.assertTrue(data["success"])
+        token = JwtRefreshToken.objects.get_by_token(data["token"])
+        self.assertEqual(token.user_id, self.user.pk)
+        self.assertTrue(token.is_valid())
+
+    def assertLoginFails(self, response):
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(
+            response.json()["errors"][0]["message"], ErrorStrings.invalid_credentials
+        )
+
+    def test_query(self):
+        response = self.post("{ ping }")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"data": {"ping": "pong"}})
+
+    def test_login(self):
+        self.assertLoginSucceeds(
+            self.post(LOGIN, email=self.user.email, password=self.password)
+        )
+
+    def test_login_invalid_credentials(self):
+        self.assertLoginFails(self.post(LOGIN, email=self.user.email, password="no"))
+
+    def test_login_rotates_expired_token(self):
+        from datetime import datetime, timedelta
+
+        expired = JwtRefreshToken.objects.create(self.user)
+        expired.token = JwtRefreshToken.objects.generate_token(
+            str(self.user.pk), expires_at=datetime.utcnow() - timedelta(days=1)
+        ).serialize()
+        expired.save()
+        response = self.post(LOGIN, email=self.user.email, password=self.password)
+        self.assertLoginSucceeds(response)
+        self.assertNotEqual(response.json()["data"]["login"]["token"], expired.token)
+
+
+class AsyncGraphQLViewTest(GraphQLViewTest):
+    url = "/graphql-async"
+
+    async def async_post(self, query, **variables):
+        return await self.async_client.post(
+            self.url,
+            json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+        )
+
+    def post(self, query, **variables):
+        from asgiref.sync import async_to_sync
+
+        return async_to_sync(self.async_post)(query, **variables)
+
+    def test_invalid_query(self):
+        response = self.post("{ pong }")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("errors", response.json())
+
+
+class InFlight:
+    """Records the highest number of resolvers running at the same time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.highest = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.highest = max(self.highest, self.current)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.current -= 1
+
+
+in_flight = InFlight()
+
+
+class BatchQuery(graphene.ObjectType):
+    slow = graphene.Int(n=graphene.Int())
+    slow_async = graphene.Int(n=graphene.Int())
+
+    @staticmethod
+    def resolve_slow(root, info, n):
+        with in_flight:
+            time.sleep(0.05)
+        return n
+
+    @staticmethod
+    async def resolve_slow_async(root, info, n):
+        with in_flight:
+            await asyncio.sleep(0.05)
+        return n
+
+
+class BatchMutation(graphene.ObjectType):
+    noop = graphene.Int()
+
+
+batch_schema = graphene.Schema(query=BatchQuery, mutation=BatchMutation)
+
+
+class BatchConcurrencyTest(SimpleTestCase):
+    view_class = GraphQLView
+    field = "slow"
+
+    def setUp(self):
+        in_flight.highest = 0
+
+    def execute(self, batch):
+        request = RequestFactory().post(
+            "/graphql", json.dumps(batch), content_type="application/json"
+        )
+        view = self.view_class.as_view(schema=batch_schema, batch=True)
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return view(request)
+
+    def batch(self, count):
+        return [
+            {"id": str(n), "query": "{ %s(n: %d) }" % (self.field, n)}
+            for n in range(count)
+        ]
+
+    def assertInOrder(self, response, count):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (entry["id"], entry["data"][self.field])
+                for entry in json.loads(response.content)
+            ],
+            [(str(n), n) for n in range(count)],
+        )
+
+    @override_settings(JWT_FLOW={"BATCH_CONCURRENCY": 3})
+    def test_concurrent(self):
+        self.assertInOrder(self.execute(self.batch(6)), 6)
+        self.assertEqual(in_flight.highest, 3)
+
+    def test_sequential_by_default(self):
+        self.assertInOrder(self.execute(self.batch(3)), 3)
+        self.assertEqual(in_flight.highest, 1)
+
+    @override_settings(JWT_FLOW={"BATCH_CONCURRENCY": 3})
+    def test_mutation_runs_sequentially(self):
+        batch = self.batch(3) + [{"id": "m", "query": "mutation { noop }"}]
+        response = self.execute(batch)
+        self.assertEqual(in_flight.highest, 1)
+        self.assertEqual(len(json.loads(response.content)), 4)
+
+    @override_settings(JWT_FLOW={"BATCH_CONCURRENCY": 3})
+    def test_highest_status_code(self):
+        batch = self.batch(2) + [{"id": "x", "query": "{ nope }"}]
+        response = self.execute(batch)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [entry["status"] for entry in json.loads(response.content)], [200, 200, 400]
+        )
+
+
+class AsyncBatchConcurrencyTest(BatchConcurrencyTest):
+    view_class = AsyncGraphQLView
+    field = "slowAsync"
+
+
+class DocumentCacheTest(SimpleTestCase):
+    def setUp(self):
+        document_backend.clear()
+
+    def post(self, data):
+        return self.client.post(
+            "/graphql", json.dumps(data), content_type="application/json"
+        )
+
+    def test_cache_hits(self):
+        for i in range(3):
+            response = self.post({"query": "{ ping }"})
+            self.assertEqual(response.json(), {"data": {"ping": "pong"}})
+        self.assertEqual(document_backend.stats(), {"size": 1, "hits": 2, "misses": 1})
+
+    def test_invalid_document_cached(self):
+        for i in range(2):
+            response = self.post({"query": "{ pong }"})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(document_backend.stats()["hits"], 1)
+
+    @override_settings(JWT_FLOW={"DOCUMENT_CACHE_SIZE": 2})
+    def test_lru_eviction(self):
+        for query in ("{ ping }", "query a { ping }", "{ ping }", "query b { ping }"):
+            self.post({"query": query})
+        self.assertEqual(document_backend.stats()["size"], 2)
+        self.post({"query": "{ ping }"})
+        self.assertEqual(document_backend.stats()["hits"], 2)
+
+    @override_settings(
+        JWT_FLOW={"PERSISTED_QUERIES": {query_hash("{ ping }"): "{ ping }"}}
+    )
+    def test_persisted_query(self):
+        response = self.post(
+            {
+                "extensions": {
+                    "persistedQuery": {
+                        "version": 1,
+                        "sha256Hash": query_hash("{ ping }"),
+                    }
+                }
+            }
+        )
+        self.assertEqual(response.json(), {"data": {"ping": "pong"}})
+
+    def test_persisted_query_not_found(self):
+        persisted = {"version": 1, "sha256Hash": query_hash("query q { ping }")}
+        response = self.post({"extensions": {"persistedQuery": persisted}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"][0]["message"], "PersistedQueryNotFound"
+        )
+
+    @override_settings(JWT_FLOW={"PERSISTED_QUERIES_REGISTER": True})
+    def test_persisted_query_register(self):
+        query = "query registered { ping }"
+        persisted = {"version": 1, "sha256Hash": query_hash(query)}
+        response = self.post(
+            {"query": query, "extensions": {"persistedQuery": persisted}}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.post({"extensions": {"persistedQuery": persisted}})
+        self.assertEqual(response.json(), {"data": {"ping": "pong"}})
+
+    def test_persisted_query_hash_mismatch(self):
+        persisted = {"version": 1, "sha256Hash": query_hash("{ ping }")}
+        response = self.post(
+            {
+                "query": "query other { ping }",
+                "extensions": {"persistedQuery": persisted},
+            }
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class JWKSViewTest(SimpleTestCase):
+    okp_key = {
+        "kty": "OKP",
+        "crv": "Ed25519",
+        "x": "Lc5eoWH8FRE2L8CHlBDHTyd_o26DOi4PpPwbnM4QGBI",
+        "d": "2vs4Y76RdPDatIdOsTALoMa7_99xbbnmUTpz974O2oo",
+    }
+    oct_key = {"kty": "oct", "k": "x-A5aHFjJohn3-wuBsv12Q"}
+
+    def get(self, **headers):
+        request = RequestFactory().get("/.well-known/jwks.json", **headers)
+        return JWKSView.as_view()(request)
+
+    @override_settings(
+        JWT_FLOW={
+            "KEYRING": [
+                {"KID": "okp", "KEY": okp_key},
+                {"KID": "oct", "KEY": oct_key},
+                {"KID": "old", "KEY": okp_key, "RETIRED_AT": "2020-01-01T00:00:00"},
+            ]
+        }
+    )
+    def test_jwks(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/jwk-set+json")
+        self.assertIn("max-age=3600", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
+        keys = json.loads(response.content)["keys"]
+        self.assertEqual([key["kid"] for key in keys], ["okp"])
+        self.assertNotIn("d", keys[0])
+        self.assertEqual(keys[0]["use"], "sig")
+
+    @override_settings(JWT_FLOW={"KEY": okp_key, "JWKS_MAX_AGE": 60})
+    def test_conditional_get(self):
+        response = self.get()
+        etag = response["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertIn("max-age=60", response["Cache-Control"])
+        not_modified = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)